@@ -0,0 +1,66 @@
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from cgroup_writer import CgroupWriter, CgroupRemovedError
+
+BatchResult = namedtuple("BatchResult", ["wall_ns", "writes", "failed"])
+
+
+class BulkUpdater:
+    def __init__(self, workers=1, writer=None):
+        self.writer = writer or CgroupWriter()
+        self.workers = max(1, int(workers))
+        self._pool = ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _apply_chunk(self, updates):
+        writes = 0
+        failed = []
+        for cgroup_path, knobs in updates:
+            for name, value in knobs.items():
+                try:
+                    self.writer.write(cgroup_path, name, value)
+                    writes += 1
+                except (OSError, CgroupRemovedError) as e:
+                    failed.append((cgroup_path, name, e))
+        return writes, failed
+
+    def apply(self, updates):
+        # updates: iterable of (cgroup_path, {"memory.max": ..., "cpu.max": ...}).
+        # Each cgroup lands in exactly one chunk, so a given fd is never
+        # written from two threads at once.
+        updates = list(updates)
+        t0 = time.perf_counter_ns()
+        if self._pool is None or len(updates) < 2:
+            writes, failed = self._apply_chunk(updates)
+        else:
+            n = min(self.workers, len(updates))
+            size = (len(updates) + n - 1) // n
+            futures = [self._pool.submit(self._apply_chunk, updates[i:i + size])
+                       for i in range(0, len(updates), size)]
+            writes, failed = 0, []
+            for fut in futures:
+                w, f = fut.result()
+                writes += w
+                failed.extend(f)
+        return BatchResult(time.perf_counter_ns() - t0, writes, failed)
+
+    def close(self, close_writer=True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        if close_writer:
+            self.writer.close()
+
+
+def apply_batch(updates, workers=1, writer=None):
+    updater = BulkUpdater(workers, writer)
+    try:
+        return updater.apply(updates)
+    finally:
+        updater.close(close_writer=writer is None)
@@ -0,0 +1,77 @@
+import os, sys
+from bulk_update import BulkUpdater
+from cgroup_writer import CgroupWriter, memory_max_bytes, cpu_max_bytes
+from cgroupfs import CgroupFS, FakeCgroupFS
+
+PARENT_NAME = "bulk-bench"
+CGROUP_COUNTS = (1, 10, 100, 300)
+WORKER_COUNTS = (1, 2, 4, 8)
+MEM_DELTA = 1 * 1024 * 1024
+CPU_DELTA = 1000
+CPU_PERIOD = 100000
+TICKS = 50
+
+initial_mem = 128 * 1024 * 1024
+initial_cpu = 10000
+
+
+def setup_cgroups(fs, parent, count):
+    fs.mkdir(parent)
+    fs.enable_controllers(parent)
+    paths = []
+    for i in range(count):
+        path = os.path.join(parent, f"cg-{i}")
+        fs.mkdir(path)
+        paths.append(path)
+    return paths
+
+
+def teardown_cgroups(fs, parent, paths):
+    for path in paths:
+        fs.rmdir(path)
+    fs.rmdir(parent)
+
+
+def make_batches(paths):
+    # Two alternating batches, preformatted, so each tick really changes every limit.
+    batches = []
+    for sign in (1, -1):
+        mem = memory_max_bytes(initial_mem + sign * MEM_DELTA)
+        cpu = cpu_max_bytes(initial_cpu + sign * CPU_DELTA, CPU_PERIOD)
+        batches.append([(path, {"memory.max": mem, "cpu.max": cpu}) for path in paths])
+    return batches
+
+
+def main():
+    # --fake: rootless run on a FakeCgroupFS tree (userspace cost only).
+    fs = FakeCgroupFS() if "--fake" in sys.argv else CgroupFS()
+    parent = fs.path(PARENT_NAME)
+    paths = setup_cgroups(fs, parent, max(CGROUP_COUNTS))
+    try:
+        print(f"{'cgroups':>8} {'workers':>8} {'avg batch':>12} {'p99 batch':>12} {'per write':>12}")
+        for count in CGROUP_COUNTS:
+            batches = make_batches(paths[:count])
+            for workers in WORKER_COUNTS:
+                with BulkUpdater(workers, CgroupWriter(fs=fs)) as updater:
+                    updater.apply(batches[1])
+                    walls = []
+                    writes = 0
+                    for i in range(TICKS):
+                        result = updater.apply(batches[i % 2])
+                        if result.failed:
+                            raise RuntimeError(f"Batch write failed: {result.failed[0]}")
+                        walls.append(result.wall_ns)
+                        writes += result.writes
+                walls.sort()
+                avg = sum(walls) / len(walls)
+                p99 = walls[min(len(walls) - 1, int(len(walls) * 0.99))]
+                per_write = sum(walls) / writes
+                print(f"{count:>8} {workers:>8} {avg / 1e3:>9.1f} us {p99 / 1e3:>9.1f} us {per_write / 1e3:>9.3f} us")
+    finally:
+        teardown_cgroups(fs, parent, paths)
+        if fs.fake:
+            fs.cleanup()
+
+
+if __name__ == "__main__":
+    main()
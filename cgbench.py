@@ -0,0 +1,483 @@
+import os, sys, csv, json, math, time, argparse, platform, subprocess
+from concurrent.futures import ThreadPoolExecutor
+from cgroup_index import CgroupIndex
+from cgroup_writer import CgroupWriter, memory_max_bytes, cpu_max_bytes
+from cgroupfs import FakeCgroupFS, FakeWriteTracer
+from docker_api import DockerClient, DOCKER_SOCKET
+from effect_probe import EffectProbe, reclaim_window, swap_available, wait_for_effect
+from fake_dockerd import FakeDockerd
+from latency_hist import KNOBS, PERCENTILES
+from sample_log import SampleLog
+
+IMAGE_NAME = "memcpu-test-img"
+CONTAINER_NAME = "memcpu-test-container"
+UPDATE_PATHS = ("raw", "cli", "api")
+MEM_DELTA = 1 * 1024 * 1024
+CPU_DELTA = 1000
+CPU_PERIOD = 100000
+EVENT_TIMEOUT_MS = 5000
+# --effect: limits alternate between a level the workload never hits and one
+# it is well above (write_memory_process keeps 30 MiB dirty and spins).
+EFFECT_WORKLOAD = "/write_memory_process"
+EFFECT_LIMITS = {"cpu.max": (2 * CPU_PERIOD, 10000), "memory.max": (128 * 1024 * 1024, 16 * 1024 * 1024)}
+EFFECT_TIMEOUT = 2.0
+SETTLE_TIMEOUT = 10.0
+
+initial_mem = 128 * 1024 * 1024
+initial_cpu = 10000
+
+
+def build_image():
+    subprocess.run(["docker", "build", "-q", "-t", IMAGE_NAME, "."], cwd="./docker-test",
+                   check=True, stdout=subprocess.DEVNULL)
+
+
+def start_containers(count, prefix=CONTAINER_NAME, image=IMAGE_NAME, entrypoint=None):
+    names = [prefix] if count == 1 else [f"{prefix}-{i}" for i in range(count)]
+    remove_containers(names)
+    for name in names:
+        subprocess.run([
+            "docker", "run", "-d",
+            "--cgroupns=host",
+            "--name", name,
+            "--memory", str(initial_mem),
+            "--memory-swap", str(4 * initial_mem),
+            "--cpus", f"{initial_cpu / CPU_PERIOD:.3f}",
+        ] + (["--entrypoint", entrypoint] if entrypoint else []) + [image], check=True, stdout=subprocess.DEVNULL)
+    return names
+
+
+def remove_containers(names):
+    for name in names:
+        subprocess.run(["docker", "rm", "-f", name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def resolve_cgroups(names, fs=None):
+    kwargs = {"root": fs.root, "docker_root": fs.docker_root} if fs is not None and fs.fake else {}
+    with CgroupIndex(watch=False, **kwargs) as index:
+        paths = {name: index.lookup(name) for name in names}
+    missing = [name for name, path in paths.items() if path is None]
+    if missing:
+        raise RuntimeError(f"Cgroup path not found for {missing}")
+    return paths
+
+
+def knob_value(knob, i, args):
+    sign = 1 if i % 2 == 0 else -1
+    if knob == "memory.max":
+        return initial_mem + sign * args.mem_delta
+    return initial_cpu + sign * args.cpu_delta
+
+
+class Updater:
+    def __init__(self, path, cgroup_paths, socket_path=DOCKER_SOCKET, fs=None):
+        self.path = path
+        self.cgroup_paths = cgroup_paths
+        self.writer = CgroupWriter(fs=fs) if path == "raw" else None
+        self.client = DockerClient(socket_path) if path == "api" else None
+        if self.writer:
+            for cgroup_path in cgroup_paths.values():
+                self.writer.open(cgroup_path)
+
+    def issue(self, name, knob, value):
+        if self.path == "raw":
+            if knob == "memory.max":
+                self.writer.write(self.cgroup_paths[name], knob, memory_max_bytes(value))
+            else:
+                self.writer.write(self.cgroup_paths[name], knob, cpu_max_bytes(value, CPU_PERIOD))
+        elif self.path == "api":
+            if knob == "memory.max":
+                self.client.update(name, memory=value)
+            else:
+                self.client.update(name, cpus=value / CPU_PERIOD)
+        else:
+            flag = ["--memory", str(value)] if knob == "memory.max" else ["--cpus", f"{value / CPU_PERIOD:.3f}"]
+            subprocess.run(["docker", "update"] + flag + [name],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+        if self.client:
+            self.client.close()
+
+
+def issue_round(tracer, updater, names, name_by_cgid, knob, value, pool):
+    # Issues one update per container (concurrently if there are several) and
+    # returns {name: (issue ts, WriteEvent)} for the writes that were seen.
+    t0s = {}
+
+    def one(name):
+        t0s[name] = time.monotonic_ns()
+        updater.issue(name, knob, value)
+
+    if pool is None:
+        one(names[0])
+    else:
+        list(pool.map(one, names))
+
+    results = {}
+    deadline = time.monotonic() + EVENT_TIMEOUT_MS / 1e3
+    while len(results) < len(names):
+        remaining = int((deadline - time.monotonic()) * 1e3)
+        if remaining <= 0:
+            break
+        try:
+            ev = tracer.wait(timeout_ms=remaining, filename=knob)
+        except TimeoutError:
+            break
+        name = name_by_cgid.get(ev.cgroup_id)
+        if name is None or name in results:
+            continue
+        results[name] = (t0s[name], ev)
+    return results
+
+
+def run_round(tracer, updater, names, name_by_cgid, knob, value, pool):
+    # Returns {name: (WriteEvent, issue->write ns, dockerd read->write ns or None)}.
+    tracer.drain()
+    return {name: (ev, ev.ts - t0, ev.ts - ev.start_ts if ev.start_ts else None)
+            for name, (t0, ev) in issue_round(tracer, updater, names, name_by_cgid, knob, value, pool).items()}
+
+
+def effect_round(env, updater, name_by_cgid, probes, knob, pool, watcher):
+    # Raises the limit out of the way, waits for the workload to settle, then
+    # lowers it and times write -> effect. Returns {metric: [(WriteEvent, ns), ...]}.
+    high, low = EFFECT_LIMITS[knob]
+    names, tracer = env.names, env.tracer
+    tracer.drain()
+    issue_round(tracer, updater, names, name_by_cgid, knob, high, pool)
+    for probe in probes.values():
+        probe.settle(knob, SETTLE_TIMEOUT)
+        probe.arm()
+    tracer.drain()
+    if env.reclaim is not None:
+        env.reclaim.drain()
+    # The dockerd paths only return after the write, so the effect is
+    # watched from another thread while the update is in flight.
+    effects = watcher.submit(wait_for_effect, probes, knob, low, EFFECT_TIMEOUT)
+    writes = issue_round(tracer, updater, names, name_by_cgid, knob, low, pool)
+    effects = effects.result()
+    reclaims = env.reclaim.drain() if env.reclaim is not None and knob == "memory.max" else []
+
+    samples = {}
+    for name, (t0, ev) in writes.items():
+        effect_ts = effects.get(name)
+        if effect_ts is None:
+            continue
+        samples.setdefault("write_to_effect", []).append((ev, effect_ts - ev.ts))
+        samples.setdefault("issue_to_effect", []).append((ev, effect_ts - t0))
+        window = reclaim_window(reclaims, ev.ts, effect_ts, (ev.pid,), ev.cgroup_id)
+        if window is not None:
+            samples.setdefault("write_to_reclaim", []).append((ev, window[0] - ev.ts))
+            samples.setdefault("write_to_reclaim_end", []).append((ev, window[1] - ev.ts))
+    return samples
+
+
+def percentile(sorted_samples, q):
+    if not sorted_samples:
+        return float("nan")
+    idx = max(0, min(len(sorted_samples) - 1, math.ceil(q / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[idx]
+
+
+def stats(samples_ns):
+    s = sorted(samples_ns)
+    row = {"count": len(s), "mean_ms": (sum(s) / len(s) / 1e6) if s else float("nan")}
+    for q in PERCENTILES:
+        row[f"p{q:g}_ms"] = percentile(s, q) / 1e6
+    row["max_ms"] = (s[-1] / 1e6) if s else float("nan")
+    return row
+
+
+class DockerEnv:
+    # Real containers, dockerd and BPF write probes.
+
+    def __init__(self, args):
+        from write_tracer import open_tracer_async
+
+        self.fs = None
+        self.socket = args.socket
+        self.reclaim = None
+        # The BPF compile overlaps the image build and container start.
+        tracer_future = open_tracer_async(hook=args.hook)
+        self.names = []
+        try:
+            build_image()
+            self.names = start_containers(args.concurrency, entrypoint=EFFECT_WORKLOAD if args.effect else None)
+            self.cgroup_paths = resolve_cgroups(self.names)
+            t0 = time.monotonic_ns()
+            self.tracer = tracer_future.result()
+            self.startup = {f"tracer_{k}_ms": v / 1e6 for k, v in self.tracer.startup_ns.items()}
+            self.startup["tracer_wait_ms"] = (time.monotonic_ns() - t0) / 1e6
+            if set(args.path) & {"cli", "api"}:
+                self.tracer.set_dockerd_pid(int(subprocess.check_output(["pidof", "dockerd"]).decode().split()[0]))
+            if args.effect and "memory.max" in args.knob:
+                from effect_probe import ReclaimTracer
+
+                self.reclaim = ReclaimTracer()
+        except BaseException:
+            if tracer_future.done() and tracer_future.exception() is None:
+                tracer_future.result().close()
+            remove_containers(self.names)
+            raise
+
+    def close(self):
+        self.tracer.close()
+        if self.reclaim is not None:
+            self.reclaim.close()
+        remove_containers(self.names)
+
+
+class FakeEnv:
+    # Rootless stand-ins: a FakeCgroupFS tree, the stand-in dockerd on a
+    # private socket and write events from the fake backend. Measures the
+    # userspace side of the harness only; kernel costs are not modelled.
+
+    def __init__(self, args):
+        self.fs = FakeCgroupFS()
+        self.socket = os.path.join(self.fs.base, "docker.sock")
+        self.server = FakeDockerd(self.socket, fs=self.fs)
+        self.names = [CONTAINER_NAME] if args.concurrency == 1 else \
+            [f"{CONTAINER_NAME}-{i}" for i in range(args.concurrency)]
+        for name in self.names:
+            container_id, path = self.fs.add_container(name)
+            self.fs.write_file(path, "memory.max", initial_mem)
+            self.fs.write_file(path, "cpu.max", f"{initial_cpu} {CPU_PERIOD}")
+            self.server.add_container(name, path, container_id=container_id)
+        self.server.start()
+        self.cgroup_paths = resolve_cgroups(self.names, self.fs)
+        self.tracer = FakeWriteTracer(self.fs)
+        self.startup = {}
+
+    def close(self):
+        self.tracer.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.fs.cleanup()
+
+
+def measure_write(args, env, updater, name_by_cgid, pool, path, results, log=None):
+    names = env.names
+    missed = 0
+    samples = {knob: ([], []) for knob in args.knob}
+    for i in range(args.warmup + args.iterations):
+        for knob in args.knob:
+            got = run_round(env.tracer, updater, names, name_by_cgid, knob, knob_value(knob, i, args), pool)
+            if i < args.warmup:
+                continue
+            missed += len(names) - len(got)
+            for ev, e2e_ns, dockerd_ns in got.values():
+                samples[knob][0].append(e2e_ns)
+                if log is not None:
+                    log.append(ev.ts, ev.cgroup_id, knob, path, "issue_to_write", e2e_ns)
+                if dockerd_ns is not None:
+                    samples[knob][1].append(dockerd_ns)
+                    if log is not None:
+                        log.append(ev.ts, ev.cgroup_id, knob, path, "dockerd_to_write", dockerd_ns)
+    for knob in args.knob:
+        e2e, dockerd = samples[knob]
+        results.append(dict(path=path, knob=knob, metric="issue_to_write", **stats(e2e)))
+        if dockerd:
+            results.append(dict(path=path, knob=knob, metric="dockerd_to_write", **stats(dockerd)))
+    return missed
+
+
+def measure_effect(args, env, updater, name_by_cgid, pool, path, results, log=None):
+    probes = {name: EffectProbe(cgroup_path) for name, cgroup_path in env.cgroup_paths.items()}
+    watcher = ThreadPoolExecutor(max_workers=1)
+    missed = 0
+    try:
+        for knob in args.knob:
+            samples = {}
+            for i in range(args.warmup + args.iterations):
+                got = effect_round(env, updater, name_by_cgid, probes, knob, pool, watcher)
+                if i < args.warmup:
+                    continue
+                missed += len(env.names) - len(got.get("write_to_effect", ()))
+                for metric, values in got.items():
+                    samples.setdefault(metric, []).extend(ns for _, ns in values)
+                    if log is not None:
+                        for ev, ns in values:
+                            log.append(ev.ts, ev.cgroup_id, knob, path, metric, ns)
+            for metric, values in samples.items():
+                results.append(dict(path=path, knob=knob, metric=metric, **stats(values)))
+            # Leave the workload unconstrained for the next knob or path.
+            issue_round(env.tracer, updater, env.names, name_by_cgid, knob, EFFECT_LIMITS[knob][0], pool)
+    finally:
+        watcher.shutdown()
+        for probe in probes.values():
+            probe.close()
+    return missed
+
+
+def run(args):
+    env = FakeEnv(args) if args.fake else DockerEnv(args)
+    names, cgroup_paths, tracer = env.names, env.cgroup_paths, env.tracer
+    try:
+        name_by_cgid = {tracer.watch_container(path, name): name for name, path in cgroup_paths.items()}
+        pool = ThreadPoolExecutor(max_workers=len(names)) if len(names) > 1 else None
+        log = SampleLog(args.log) if args.log else None
+
+        results = []
+        missed = 0
+        try:
+            for path in args.path:
+                updater = Updater(path, cgroup_paths, env.socket, env.fs)
+                try:
+                    if args.effect:
+                        missed += measure_effect(args, env, updater, name_by_cgid, pool, path, results, log)
+                    else:
+                        missed += measure_write(args, env, updater, name_by_cgid, pool, path, results, log)
+                finally:
+                    updater.close()
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            if log is not None:
+                log.close()
+            dropped = tracer.dropped()
+    finally:
+        env.close()
+
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "kernel": platform.release(),
+            "host": platform.node(),
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "mem_delta": args.mem_delta,
+            "cpu_delta": args.cpu_delta,
+            "hook": "fake" if args.fake else args.hook,
+            "mode": "effect" if args.effect else "write",
+            "missed_events": missed,
+            "dropped_events": dropped,
+            **env.startup,
+        },
+        "results": results,
+    }
+
+
+RESULT_FIELDS = ["path", "knob", "metric", "count", "mean_ms"] + [f"p{q:g}_ms" for q in PERCENTILES] + ["max_ms"]
+
+
+def write_output(report, fmt, out):
+    if fmt == "json":
+        json.dump(report, out, indent=2)
+        out.write("\n")
+    elif fmt == "csv":
+        w = csv.DictWriter(out, fieldnames=RESULT_FIELDS)
+        w.writeheader()
+        for row in report["results"]:
+            w.writerow({k: row[k] for k in RESULT_FIELDS})
+    else:
+        out.write(f"{'path':<5} {'knob':<11} {'metric':<20} {'count':>6} "
+                  + " ".join(f"{f[:-3]:>9}" for f in RESULT_FIELDS[4:]) + "\n")
+        for row in report["results"]:
+            out.write(f"{row['path']:<5} {row['knob']:<11} {row['metric']:<20} {row['count']:>6} "
+                      + " ".join(f"{row[f]:>9.3f}" for f in RESULT_FIELDS[4:]) + "\n")
+        meta = report["meta"]
+        if "tracer_compile_ms" in meta:
+            out.write(f"BPF compile {meta['tracer_compile_ms']:.0f} ms, attach {meta['tracer_attach_ms']:.0f} ms, "
+                      f"waited {meta['tracer_wait_ms']:.0f} ms after container setup\n")
+        if meta.get("missed_events") or meta.get("dropped_events"):
+            out.write(f"missed events: {meta['missed_events']}, dropped: {meta['dropped_events']}\n")
+
+
+def load_report(path):
+    with open(path) as f:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+            for row in rows:
+                for k in RESULT_FIELDS[3:]:
+                    row[k] = float(row[k])
+            return {"meta": {}, "results": rows}
+        return json.load(f)
+
+
+def compare(report, baseline, threshold, fields=("p50_ms", "p99_ms"), out=sys.stdout):
+    # Returns the regressions: rows whose fields grew by more than threshold %.
+    base = {(r["path"], r["knob"], r["metric"]): r for r in baseline["results"]}
+    regressions = []
+    out.write(f"{'path':<5} {'knob':<11} {'metric':<20} {'field':<7} {'baseline':>10} {'current':>10} {'delta':>8}\n")
+    for row in report["results"]:
+        key = (row["path"], row["knob"], row["metric"])
+        old = base.get(key)
+        if old is None:
+            continue
+        for field in fields:
+            before, after = float(old[field]), float(row[field])
+            delta = (after - before) / before * 100 if before else float("nan")
+            flag = ""
+            if before and delta > threshold:
+                flag = "  REGRESSION"
+                regressions.append((key, field, before, after))
+            out.write(f"{key[0]:<5} {key[1]:<11} {key[2]:<20} {field[:-3]:<7} {before:>10.3f} {after:>10.3f} "
+                      f"{delta:>7.1f}%{flag}\n")
+    return regressions
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(prog="cgbench", description="Container limit update latency benchmark")
+    p.add_argument("--path", action="append", choices=UPDATE_PATHS,
+                   help="update path to measure (repeatable, default: all)")
+    p.add_argument("--knob", action="append", choices=KNOBS, help="cgroup file to update (repeatable, default: all)")
+    p.add_argument("-n", "--iterations", type=int, default=100)
+    p.add_argument("--warmup", type=int, default=5, help="unrecorded iterations per path")
+    p.add_argument("--mem-delta", type=int, default=MEM_DELTA, help="memory.max step in bytes")
+    p.add_argument("--cpu-delta", type=int, default=CPU_DELTA, help="cpu.max quota step in usec")
+    p.add_argument("-c", "--concurrency", type=int, default=1, help="containers updated concurrently per round")
+    p.add_argument("--hook", default="vfs_write", help="write probe hook (vfs_write, cgroup_file_write, fentry)")
+    p.add_argument("--socket", default=DOCKER_SOCKET, help="dockerd socket for the api path")
+    p.add_argument("--effect", action="store_true",
+                   help="lower limits under a running workload and time write -> throttling/reclaim")
+    p.add_argument("--fake", action="store_true",
+                   help="run rootless against a fake cgroupfs tree and the stand-in dockerd (no cli path)")
+    p.add_argument("-f", "--format", choices=("text", "json", "csv"), default="text")
+    p.add_argument("-o", "--output", help="write results to this file instead of stdout")
+    p.add_argument("--log", help="also append every sample to this sample log (see sample_log.py)")
+    p.add_argument("--baseline", help="stored JSON/CSV results to compare against")
+    p.add_argument("--threshold", type=float, default=10.0, help="allowed p50/p99 growth in percent")
+    p.add_argument("--compare", metavar="RESULTS", help="compare stored results against --baseline without running")
+    args = p.parse_args(argv)
+    args.path = args.path or [path for path in UPDATE_PATHS if not (args.fake and path == "cli")]
+    args.knob = args.knob or list(KNOBS)
+    if args.fake and "cli" in args.path:
+        p.error("the cli path needs a real dockerd")
+    if args.effect and args.fake:
+        p.error("--effect needs real containers")
+    if args.effect and "memory.max" in args.knob and not args.compare and not swap_available():
+        p.error("--effect on memory.max needs swap; without it the workload is OOM-killed (use --knob cpu.max)")
+    if args.compare and not args.baseline:
+        p.error("--compare needs --baseline")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        report = load_report(args.compare)
+    else:
+        report = run(args)
+        if args.output:
+            with open(args.output, "w", newline="") as f:
+                write_output(report, args.format, f)
+        else:
+            write_output(report, args.format, sys.stdout)
+
+    if args.baseline:
+        # JSON/CSV results on stdout stay machine-readable; the comparison
+        # then goes to stderr.
+        machine = args.format != "text" and not args.output and not args.compare
+        out = sys.stderr if machine else sys.stdout
+        regressions = compare(report, load_report(args.baseline), args.threshold, out=out)
+        if regressions:
+            out.write(f"\n{len(regressions)} regression(s) above {args.threshold:g}%\n")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
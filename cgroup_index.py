@@ -0,0 +1,187 @@
+import os, re, json, errno, struct
+import ctypes as ct
+from cgroupfs import CGROUP_ROOT, cgroup_path_of_pid
+
+DOCKER_ROOT = "/var/lib/docker"
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_ONLYDIR = 0x01000000
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+
+_EVENT = struct.Struct("iIII")
+
+# systemd driver: docker-<id>.scope (also libpod/crio/containerd scopes);
+# cgroupfs driver: .../docker/<id>
+_CONTAINER_DIR = re.compile(r"^(?:(?:docker|libpod|crio|cri-containerd)-)?([0-9a-f]{64})(?:\.scope)?$")
+
+_libc = ct.CDLL(None, use_errno=True)
+_libc.inotify_init1.argtypes = [ct.c_int]
+_libc.inotify_add_watch.argtypes = [ct.c_int, ct.c_char_p, ct.c_uint32]
+
+
+def container_id_from_dir(name):
+    m = _CONTAINER_DIR.match(name)
+    return m.group(1) if m else None
+
+
+def read_container_name(container_id, docker_root=DOCKER_ROOT):
+    try:
+        with open(os.path.join(docker_root, "containers", container_id, "config.v2.json")) as f:
+            return json.load(f).get("Name", "").lstrip("/") or None
+    except (OSError, ValueError):
+        return None
+
+
+class CgroupIndex:
+    def __init__(self, root=CGROUP_ROOT, docker_root=DOCKER_ROOT, watch=True):
+        self.root = root
+        self.docker_root = docker_root
+        self.by_id = {}
+        self.by_short_id = {}
+        self.by_name = {}
+        self.by_pid = {}
+        self._ids_by_path = {}
+        self._wds = {}
+        self._paths_by_wd = {}
+        self._inotify_fd = -1
+        if watch:
+            fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                e = ct.get_errno()
+                raise OSError(e, os.strerror(e))
+            self._inotify_fd = fd
+        self.rescan()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def fileno(self):
+        return self._inotify_fd
+
+    def rescan(self):
+        self._remove_tree(self.root)
+        self._add_tree(self.root)
+
+    def _watch(self, path):
+        if self._inotify_fd < 0 or path in self._wds:
+            return
+        wd = _libc.inotify_add_watch(self._inotify_fd, path.encode(), WATCH_MASK)
+        if wd >= 0:
+            self._wds[path] = wd
+            self._paths_by_wd[wd] = path
+
+    def _add_tree(self, top):
+        for dirpath, _, _ in os.walk(top):
+            self._watch(dirpath)
+            self._add_dir(dirpath)
+
+    def _add_dir(self, path):
+        container_id = container_id_from_dir(os.path.basename(path))
+        if container_id is None:
+            return
+        self._ids_by_path[path] = container_id
+        self.by_id[container_id] = path
+        self.by_short_id[container_id[:12]] = path
+        name = read_container_name(container_id, self.docker_root)
+        if name:
+            self.by_name[name] = path
+        try:
+            with open(os.path.join(path, "cgroup.procs")) as f:
+                for line in f:
+                    self.by_pid[int(line)] = path
+        except OSError:
+            pass
+
+    def _remove_dir(self, path):
+        wd = self._wds.pop(path, None)
+        if wd is not None:
+            self._paths_by_wd.pop(wd, None)
+        container_id = self._ids_by_path.pop(path, None)
+        if container_id is None:
+            return
+        self.by_id.pop(container_id, None)
+        self.by_short_id.pop(container_id[:12], None)
+        for table in (self.by_name, self.by_pid):
+            for key in [k for k, v in table.items() if v == path]:
+                del table[key]
+
+    def _remove_tree(self, top):
+        prefix = top + os.sep
+        for path in [p for p in set(self._wds) | set(self._ids_by_path) if p == top or p.startswith(prefix)]:
+            self._remove_dir(path)
+
+    def process_events(self):
+        # Drains pending inotify events; returns the number of directories
+        # added or removed. Safe to call from an epoll loop on fileno().
+        changed = 0
+        while self._inotify_fd >= 0:
+            try:
+                data = os.read(self._inotify_fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            offset = 0
+            while offset + _EVENT.size <= len(data):
+                wd, mask, _, name_len = _EVENT.unpack_from(data, offset)
+                name = data[offset + _EVENT.size:offset + _EVENT.size + name_len].rstrip(b"\0").decode()
+                offset += _EVENT.size + name_len
+                if mask & IN_Q_OVERFLOW:
+                    self.rescan()
+                    changed += 1
+                    continue
+                parent = self._paths_by_wd.get(wd)
+                if parent is None:
+                    continue
+                if mask & IN_IGNORED:
+                    if self._wds.get(parent) == wd:
+                        del self._wds[parent]
+                    self._paths_by_wd.pop(wd, None)
+                    continue
+                if not mask & IN_ISDIR or not name:
+                    continue
+                path = os.path.join(parent, name)
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(path)
+                    changed += 1
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self._remove_tree(path)
+                    changed += 1
+        return changed
+
+    def lookup(self, key):
+        return self.by_id.get(key) or self.by_short_id.get(key) or self.by_name.get(key)
+
+    def lookup_pid(self, pid):
+        path = self.by_pid.get(pid)
+        if path is None:
+            # Not a process we saw at scan time (e.g. exec'd later): a single
+            # /proc read, no subprocess, and cached for the next lookup.
+            try:
+                path = cgroup_path_of_pid(pid, self.root)
+            except OSError:
+                return None
+            if path is not None and path in self._ids_by_path:
+                self.by_pid[pid] = path
+        return path
+
+    def close(self):
+        if self._inotify_fd >= 0:
+            os.close(self._inotify_fd)
+            self._inotify_fd = -1
+        self._wds.clear()
+        self._paths_by_wd.clear()
@@ -0,0 +1,45 @@
+import os, sys, time
+from cgroup_writer import CgroupWriter, memory_max_bytes, cpu_max_bytes
+from cgroupfs import CGROUP_ROOT
+from write_tracer import WriteTracer
+
+CGROUP_NAME = "cgwriter-hist"
+MEM_DELTA = 1 * 1024 * 1024
+CPU_DELTA = 1000
+CPU_PERIOD = 100000
+ITERATIONS = 1000000
+
+initial_mem = 128 * 1024 * 1024
+initial_cpu = 10000
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else ITERATIONS
+    cgroup_path = os.path.join(CGROUP_ROOT, CGROUP_NAME)
+    os.makedirs(cgroup_path, exist_ok=True)
+
+    # Histogram-only tracer: no per-write ring-buffer events, userspace reads
+    # the aggregated buckets once at the end.
+    tracer = WriteTracer(events=False)
+    tracer.watch_cgroup(cgroup_path)
+    writer = CgroupWriter()
+    mem_bufs = [memory_max_bytes(initial_mem + MEM_DELTA), memory_max_bytes(initial_mem - MEM_DELTA)]
+    cpu_bufs = [cpu_max_bytes(initial_cpu + CPU_DELTA, CPU_PERIOD), cpu_max_bytes(initial_cpu - CPU_DELTA, CPU_PERIOD)]
+    try:
+        writer.open(cgroup_path)
+        print(f"Running {iterations} raw updates per knob on {cgroup_path}...")
+        t0 = time.monotonic()
+        for i in range(iterations):
+            writer.write(cgroup_path, "memory.max", mem_bufs[i % 2])
+            writer.write(cgroup_path, "cpu.max", cpu_bufs[i % 2])
+        elapsed = time.monotonic() - t0
+        print(f"{2 * iterations / elapsed:.0f} writes/s\n")
+        tracer.print_latency_report()
+    finally:
+        writer.close()
+        tracer.close()
+        os.rmdir(cgroup_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import os, errno, threading
+from cgroupfs import CgroupFS
+DEFAULT_FILES = ("memory.max", "cpu.max")
+
+# Errors kernfs returns once the cgroup directory behind an open fd is gone
+# (ENODEV) or when the path no longer resolves on reopen (ENOENT).
+_GONE_ERRNOS = (errno.ENODEV, errno.ENOENT)
+
+
+class CgroupRemovedError(RuntimeError):
+    def __init__(self, cgroup_path):
+        super().__init__(f"Cgroup removed: {cgroup_path}")
+        self.cgroup_path = cgroup_path
+
+
+def encode_value(value):
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, tuple):
+        return " ".join(str(v) for v in value).encode()
+    return str(value).encode()
+
+
+def memory_max_bytes(limit):
+    return b"max" if limit is None else str(int(limit)).encode()
+
+
+def cpu_max_bytes(quota, period=100000):
+    quota = "max" if quota is None else str(int(quota))
+    return f"{quota} {int(period)}".encode()
+
+
+class CgroupWriter:
+    # With shadow=True the last value written to each file is remembered and
+    # an identical write is skipped (counted in suppressed). The shadow only
+    # knows about writes made through this writer; call invalidate() when
+    # something else (dockerd, another controller) may have changed a file.
+    # BulkUpdater calls write() from several threads, so the counters are
+    # only updated under _lock.
+
+    def __init__(self, files=DEFAULT_FILES, shadow=False, fs=None):
+        self.files = tuple(files)
+        self.fs = fs or CgroupFS()
+        self._fds = {}
+        self._shadow = {} if shadow else None
+        self._lock = threading.Lock()
+        self.reopens = 0
+        self.writes = 0
+        self.suppressed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self, cgroup_path, files=None):
+        for name in files or self.files:
+            if (cgroup_path, name) not in self._fds:
+                self._open_file(cgroup_path, name)
+
+    def _open_file(self, cgroup_path, name):
+        try:
+            fd = self.fs.open(cgroup_path, name)
+        except OSError as e:
+            if e.errno in _GONE_ERRNOS and not os.path.isdir(cgroup_path):
+                raise CgroupRemovedError(cgroup_path) from e
+            raise
+        self._fds[(cgroup_path, name)] = fd
+        return fd
+
+    def write(self, cgroup_path, name, value):
+        # Returns the number of bytes written, 0 if suppressed by the shadow.
+        data = encode_value(value)
+        key = (cgroup_path, name)
+        shadow = self._shadow
+        if shadow is not None:
+            if shadow.get(key) == data:
+                with self._lock:
+                    self.suppressed += 1
+                return 0
+            # Unknown until the write succeeds.
+            shadow.pop(key, None)
+        written = self._write(cgroup_path, name, data)
+        with self._lock:
+            self.writes += 1
+        if shadow is not None:
+            shadow[key] = data
+        return written
+
+    def _write(self, cgroup_path, name, data):
+        fd = self._fds.get((cgroup_path, name))
+        if fd is None:
+            fd = self._open_file(cgroup_path, name)
+        try:
+            return self.fs.write(fd, data)
+        except OSError as e:
+            if e.errno not in _GONE_ERRNOS:
+                raise
+        # The fd points at a removed kernfs node. Drop every fd we hold for
+        # this cgroup and retry once, in case it was recreated at the same path.
+        self.forget(cgroup_path)
+        with self._lock:
+            self.reopens += 1
+        fd = self._open_file(cgroup_path, name)
+        try:
+            return self.fs.write(fd, data)
+        except OSError as e:
+            if e.errno in _GONE_ERRNOS:
+                self.forget(cgroup_path)
+                raise CgroupRemovedError(cgroup_path) from e
+            raise
+
+    def set_memory_max(self, cgroup_path, limit):
+        return self.write(cgroup_path, "memory.max", memory_max_bytes(limit))
+
+    def set_cpu_max(self, cgroup_path, quota, period=100000):
+        return self.write(cgroup_path, "cpu.max", cpu_max_bytes(quota, period))
+
+    def invalidate(self, cgroup_path=None):
+        # Drops shadow values so the next write goes through.
+        if self._shadow is None:
+            return
+        if cgroup_path is None:
+            self._shadow.clear()
+            return
+        for key in [k for k in list(self._shadow) if k[0] == cgroup_path]:
+            self._shadow.pop(key, None)
+
+    def forget(self, cgroup_path):
+        self.invalidate(cgroup_path)
+        for key in [k for k in list(self._fds) if k[0] == cgroup_path]:
+            fd = self._fds.pop(key, None)
+            if fd is None:
+                continue
+            try:
+                self.fs.close(fd)
+            except OSError:
+                pass
+
+    def cgroups(self):
+        return sorted({k[0] for k in list(self._fds)})
+
+    def close(self):
+        for fd in self._fds.values():
+            try:
+                self.fs.close(fd)
+            except OSError:
+                pass
+        self._fds.clear()
+        self.invalidate()
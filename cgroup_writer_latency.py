@@ -0,0 +1,92 @@
+import os, sys, time
+from cgroup_writer import CgroupWriter, memory_max_bytes, cpu_max_bytes
+from cgroupfs import CGROUP_ROOT
+
+CGROUP_NAME = "cgwriter-bench"
+MEM_DELTA = 1 * 1024 * 1024
+CPU_DELTA = 1000
+CPU_PERIOD = 100000
+ITERATIONS = 10000
+
+initial_mem = 128 * 1024 * 1024
+initial_cpu = 10000
+
+
+def write_cgroup_file(path, value):
+    with open(path, "w") as f:
+        f.write(str(value))
+
+
+def summarize(label, samples):
+    samples = sorted(samples)
+    avg = sum(samples) / len(samples)
+    p50 = samples[len(samples) // 2]
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<32} avg {avg / 1e3:8.3f} us  p50 {p50 / 1e3:8.3f} us  p99 {p99 / 1e3:8.3f} us")
+
+
+def bench_open_per_write(memory_file, cpu_file):
+    mem_samples, cpu_samples = [], []
+    for i in range(ITERATIONS):
+        mem = initial_mem + (MEM_DELTA if i % 2 == 0 else -MEM_DELTA)
+        cpu = initial_cpu + (CPU_DELTA if i % 2 == 0 else -CPU_DELTA)
+
+        t0 = time.perf_counter_ns()
+        write_cgroup_file(memory_file, str(mem))
+        mem_samples.append(time.perf_counter_ns() - t0)
+
+        t0 = time.perf_counter_ns()
+        write_cgroup_file(cpu_file, f"{cpu} {CPU_PERIOD}")
+        cpu_samples.append(time.perf_counter_ns() - t0)
+    return mem_samples, cpu_samples
+
+
+def bench_writer(cgroup_path):
+    # Buffers are formatted up front so the loop measures only pwrite().
+    mem_bufs = [memory_max_bytes(initial_mem + MEM_DELTA), memory_max_bytes(initial_mem - MEM_DELTA)]
+    cpu_bufs = [cpu_max_bytes(initial_cpu + CPU_DELTA, CPU_PERIOD), cpu_max_bytes(initial_cpu - CPU_DELTA, CPU_PERIOD)]
+    mem_samples, cpu_samples = [], []
+    with CgroupWriter() as writer:
+        writer.open(cgroup_path)
+        for i in range(ITERATIONS):
+            t0 = time.perf_counter_ns()
+            writer.write(cgroup_path, "memory.max", mem_bufs[i % 2])
+            mem_samples.append(time.perf_counter_ns() - t0)
+
+            t0 = time.perf_counter_ns()
+            writer.write(cgroup_path, "cpu.max", cpu_bufs[i % 2])
+            cpu_samples.append(time.perf_counter_ns() - t0)
+    return mem_samples, cpu_samples
+
+
+def main():
+    created = False
+    if len(sys.argv) > 1:
+        cgroup_path = sys.argv[1]
+    else:
+        cgroup_path = os.path.join(CGROUP_ROOT, CGROUP_NAME)
+        if not os.path.isdir(cgroup_path):
+            os.mkdir(cgroup_path)
+            created = True
+
+    memory_file = os.path.join(cgroup_path, "memory.max")
+    cpu_file = os.path.join(cgroup_path, "cpu.max")
+    write_cgroup_file(memory_file, str(initial_mem))
+    write_cgroup_file(cpu_file, f"{initial_cpu} {CPU_PERIOD}")
+
+    try:
+        print(f"Benchmarking {ITERATIONS} updates per knob on {cgroup_path}...")
+        mem, cpu = bench_open_per_write(memory_file, cpu_file)
+        summarize("memory.max open/write/close", mem)
+        summarize("cpu.max open/write/close", cpu)
+
+        mem, cpu = bench_writer(cgroup_path)
+        summarize("memory.max CgroupWriter pwrite", mem)
+        summarize("cpu.max CgroupWriter pwrite", cpu)
+    finally:
+        if created:
+            os.rmdir(cgroup_path)
+
+
+if __name__ == "__main__":
+    main()
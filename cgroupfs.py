@@ -0,0 +1,382 @@
+import os, json, time, errno, random, shutil, tempfile, threading, uuid
+from collections import deque, namedtuple
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+PAGE_SIZE = 4096
+
+WriteEvent = namedtuple("WriteEvent", ["ts", "start_ts", "pid", "dockerd_tid", "cgroup_id", "filename", "value"])
+
+
+def cgroup_id(cgroup_path):
+    # kernfs exposes the cgroup id as the directory's inode number.
+    return os.stat(cgroup_path).st_ino
+
+
+def cgroup_path_of_pid(pid, root=CGROUP_ROOT):
+    with open(f"/proc/{pid}/cgroup", "r") as f:
+        for line in f:
+            parts = line.strip().split(":", 2)
+            if len(parts) == 3 and parts[0] == "0" and parts[1] == "":
+                return os.path.join(root, parts[2].lstrip("/"))
+    return None
+
+
+class CgroupFS:
+    # Access layer for a cgroup v2 hierarchy: path resolution, control file
+    # fds and writes. This one is the real /sys/fs/cgroup; FakeCgroupFS
+    # implements the same calls on a plain directory tree.
+
+    fake = False
+
+    def __init__(self, root=CGROUP_ROOT):
+        self.root = root
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def open(self, cgroup_path, name, flags=os.O_WRONLY):
+        return os.open(os.path.join(cgroup_path, name), flags | os.O_CLOEXEC)
+
+    def write(self, fd, data):
+        return os.pwrite(fd, data, 0)
+
+    def close(self, fd):
+        os.close(fd)
+
+    def write_file(self, cgroup_path, name, value):
+        # One-off open/write/close, for setup; use CgroupWriter on hot paths.
+        fd = self.open(cgroup_path, name)
+        try:
+            return self.write(fd, value if isinstance(value, bytes) else str(value).encode())
+        finally:
+            self.close(fd)
+
+    def mkdir(self, cgroup_path):
+        os.makedirs(cgroup_path, exist_ok=True)
+
+    def rmdir(self, cgroup_path):
+        os.rmdir(cgroup_path)
+
+    def enable_controllers(self, cgroup_path, controllers=("memory", "cpu")):
+        with open(os.path.join(cgroup_path, "cgroup.subtree_control"), "w") as f:
+            f.write(" ".join("+" + c for c in controllers))
+
+    def move(self, pid, cgroup_path):
+        with open(os.path.join(cgroup_path, "cgroup.procs"), "w") as f:
+            f.write(str(pid))
+
+    def cgroup_path_of_pid(self, pid):
+        return cgroup_path_of_pid(pid, self.root)
+
+
+_PSI = "some avg10=0.00 avg60=0.00 avg300=0.00 total=0\nfull avg10=0.00 avg60=0.00 avg300=0.00 total=0\n"
+
+# Initial content of every fake cgroup directory.
+FAKE_FILES = {
+    "cgroup.procs": "",
+    "cgroup.controllers": "cpu memory\n",
+    "cgroup.subtree_control": "\n",
+    "cgroup.events": "populated 0\nfrozen 0\n",
+    "cpu.max": "max 100000\n",
+    "cpu.weight": "100\n",
+    "cpu.stat": "usage_usec 0\nuser_usec 0\nsystem_usec 0\nnr_periods 0\nnr_throttled 0\nthrottled_usec 0\n"
+                "nr_bursts 0\nburst_usec 0\n",
+    "cpu.pressure": _PSI,
+    "memory.current": "0\n",
+    "memory.low": "0\n",
+    "memory.high": "max\n",
+    "memory.max": "max\n",
+    "memory.swap.current": "0\n",
+    "memory.swap.max": "max\n",
+    "memory.stat": "anon 0\nfile 0\nkernel 0\nshmem 0\nfile_mapped 0\nfile_dirty 0\npgfault 0\npgmajfault 0\n",
+    "memory.events": "low 0\nhigh 0\nmax 0\noom 0\noom_kill 0\noom_group_kill 0\n",
+    "memory.swap.events": "high 0\nmax 0\nfail 0\n",
+    "memory.pressure": _PSI,
+}
+
+_request_start = threading.local()
+
+
+def mark_request_start(ts=None):
+    # Called by the stand-in dockerd when it reads a request; the fake write
+    # tracer reports it as start_ts of writes made on the same thread.
+    _request_start.ts = time.monotonic_ns() if ts is None else ts
+
+
+def clear_request_start():
+    _request_start.ts = 0
+
+
+def _invalid():
+    return OSError(errno.EINVAL, os.strerror(errno.EINVAL))
+
+
+def _parse_limit(text, round_to=1):
+    if text == "max":
+        return "max"
+    try:
+        value = int(text)
+    except ValueError:
+        raise _invalid()
+    if value < 0:
+        raise _invalid()
+    return str(value // round_to * round_to)
+
+
+class FakeCgroupFS(CgroupFS):
+    # A cgroup-like tree in a temporary directory (tmpfs on most systems), for
+    # running the update path, batching and controller logic without root,
+    # Docker or a cgroup v2 mount. Control files are regular files written
+    # with pwrite() + ftruncate(). Values are validated and normalized like
+    # the kernel does for the knobs used here (EINVAL on bad input, memory
+    # limits rounded down to pages). Writes through an fd whose cgroup was
+    # removed fail with ENODEV, the same as kernfs.
+    #
+    # Counters such as memory.current or cpu.stat are not simulated; set them
+    # with set_stat(). Every successful write is offered to the registered
+    # FakeWriteTracers.
+
+    fake = True
+
+    def __init__(self, root=None):
+        self.base = root or tempfile.mkdtemp(prefix="fake-cgroupfs-")
+        super().__init__(os.path.join(self.base, "cgroup"))
+        self.docker_root = os.path.join(self.base, "docker")
+        os.makedirs(os.path.join(self.docker_root, "containers"), exist_ok=True)
+        self._fd_files = {}
+        self._tracers = []
+        self._lock = threading.Lock()
+        self.mkdir(self.root)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+
+    def open(self, cgroup_path, name, flags=os.O_WRONLY):
+        path = os.path.join(cgroup_path, name)
+        if not os.path.isfile(path):
+            raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        fd = os.open(path, flags | os.O_CLOEXEC)
+        self._fd_files[fd] = (cgroup_path, name)
+        return fd
+
+    def close(self, fd):
+        self._fd_files.pop(fd, None)
+        os.close(fd)
+
+    def _normalize(self, cgroup_path, name, data):
+        text = data.decode().strip()
+        if name in ("memory.max", "memory.high", "memory.swap.max"):
+            return _parse_limit(text, PAGE_SIZE)
+        if name == "memory.low":
+            value = _parse_limit(text, PAGE_SIZE)
+            return "0" if value == "max" else value
+        if name == "cpu.max":
+            parts = text.split()
+            if not 1 <= len(parts) <= 2:
+                raise _invalid()
+            quota = _parse_limit(parts[0])
+            if len(parts) == 2:
+                period = parts[1]
+            else:
+                with open(os.path.join(cgroup_path, name)) as f:
+                    period = f.read().split()[1]
+            if not period.isdigit() or not 1000 <= int(period) <= 1000000:
+                raise _invalid()
+            if quota != "max" and int(quota) < 1000:
+                raise _invalid()
+            return f"{quota} {period}"
+        if name == "cpu.weight":
+            if not text.isdigit() or not 1 <= int(text) <= 10000:
+                raise _invalid()
+            return text
+        return text
+
+    def write(self, fd, data):
+        if os.fstat(fd).st_nlink == 0:
+            raise OSError(errno.ENODEV, os.strerror(errno.ENODEV))
+        cgroup_path, name = self._fd_files.get(fd, (None, None))
+        if name == "cgroup.procs":
+            self.move(int(data), cgroup_path)
+            return len(data)
+        content = (self._normalize(cgroup_path, name, data) + "\n").encode() if name else data
+        with self._lock:
+            os.pwrite(fd, content, 0)
+            os.ftruncate(fd, len(content))
+        if name and self._tracers:
+            start_ts = getattr(_request_start, "ts", 0)
+            ev = WriteEvent(time.monotonic_ns(), start_ts, os.getpid(),
+                            threading.get_native_id() if start_ts else 0,
+                            os.stat(cgroup_path).st_ino, name, content.decode().strip())
+            for tracer in list(self._tracers):
+                tracer._push(ev)
+        return len(data)
+
+    def mkdir(self, cgroup_path):
+        os.makedirs(cgroup_path, exist_ok=True)
+        for name, content in FAKE_FILES.items():
+            path = os.path.join(cgroup_path, name)
+            if not os.path.exists(path):
+                with open(path, "w") as f:
+                    f.write(content)
+
+    def rmdir(self, cgroup_path):
+        # Like cgroupfs: only an empty cgroup with no children can go.
+        if any(os.path.isdir(os.path.join(cgroup_path, d)) for d in os.listdir(cgroup_path)):
+            raise OSError(errno.EBUSY, os.strerror(errno.EBUSY), cgroup_path)
+        with open(os.path.join(cgroup_path, "cgroup.procs")) as f:
+            if f.read().strip():
+                raise OSError(errno.EBUSY, os.strerror(errno.EBUSY), cgroup_path)
+        for name in os.listdir(cgroup_path):
+            os.unlink(os.path.join(cgroup_path, name))
+        os.rmdir(cgroup_path)
+
+    def enable_controllers(self, cgroup_path, controllers=("memory", "cpu")):
+        self.set_stat(cgroup_path, "cgroup.subtree_control", " ".join(controllers) + "\n")
+
+    def set_stat(self, cgroup_path, name, content):
+        # Plain replace, for simulated kernel-owned files (memory.current, ...).
+        with self._lock, open(os.path.join(cgroup_path, name), "w") as f:
+            f.write(content)
+
+    def move(self, pid, cgroup_path):
+        pid = int(pid)
+        for dirpath, _, files in os.walk(self.root):
+            if "cgroup.procs" not in files or dirpath == cgroup_path:
+                continue
+            procs_path = os.path.join(dirpath, "cgroup.procs")
+            with open(procs_path) as f:
+                pids = f.read().split()
+            if str(pid) in pids:
+                pids.remove(str(pid))
+                self.set_stat(dirpath, "cgroup.procs", "".join(p + "\n" for p in pids))
+                self.set_stat(dirpath, "cgroup.events", f"populated {int(bool(pids))}\nfrozen 0\n")
+        with open(os.path.join(cgroup_path, "cgroup.procs")) as f:
+            pids = f.read().split()
+        if str(pid) not in pids:
+            pids.append(str(pid))
+        self.set_stat(cgroup_path, "cgroup.procs", "".join(p + "\n" for p in pids))
+        self.set_stat(cgroup_path, "cgroup.events", "populated 1\nfrozen 0\n")
+
+    def cgroup_path_of_pid(self, pid):
+        for dirpath, _, files in os.walk(self.root):
+            if "cgroup.procs" in files:
+                with open(os.path.join(dirpath, "cgroup.procs")) as f:
+                    if str(pid) in f.read().split():
+                        return dirpath
+        return None
+
+    def add_container(self, name, container_id=None, pids=(), slice_name="system.slice"):
+        # Lays out what dockerd with the systemd cgroup driver would:
+        # <root>/system.slice/docker-<id>.scope and containers/<id>/config.v2.json.
+        container_id = container_id or uuid.uuid4().hex + uuid.uuid4().hex
+        parent = os.path.join(self.root, slice_name)
+        self.mkdir(parent)
+        path = os.path.join(parent, f"docker-{container_id}.scope")
+        self.mkdir(path)
+        config_dir = os.path.join(self.docker_root, "containers", container_id)
+        os.makedirs(config_dir, exist_ok=True)
+        with open(os.path.join(config_dir, "config.v2.json"), "w") as f:
+            json.dump({"ID": container_id, "Name": "/" + name}, f)
+        for pid in pids:
+            self.move(pid, path)
+        return container_id, path
+
+    def remove_container(self, container_id, slice_name="system.slice"):
+        path = os.path.join(self.root, slice_name, f"docker-{container_id}.scope")
+        self.set_stat(path, "cgroup.procs", "")
+        self.rmdir(path)
+        shutil.rmtree(os.path.join(self.docker_root, "containers", container_id), ignore_errors=True)
+
+    def cleanup(self):
+        for fd in list(self._fd_files):
+            self.close(fd)
+        shutil.rmtree(self.base, ignore_errors=True)
+
+
+class FakeWriteTracer:
+    # WriteTracer's event interface (drain/wait/watch_*) fed by the writes of
+    # a FakeCgroupFS instead of BPF probes. ts is taken right after the value
+    # is stored, start_ts is the stand-in dockerd's request read, if any.
+
+    def __init__(self, fs, dockerd_pid=None, events=True, hook=None, sample_rate=1):
+        self.fs = fs
+        self.timeouts = 0
+        self.set_sample_rate(sample_rate)
+        self._watched = set()
+        self._watch_ids = {}
+        self._pending = deque()
+        self._cond = threading.Condition()
+        fs._tracers.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def set_sample_rate(self, rate):
+        self.sample_rate = max(1, int(rate))
+
+    def _push(self, ev):
+        if (ev.cgroup_id, ev.filename) not in self._watched:
+            return
+        if self.sample_rate > 1 and random.randrange(self.sample_rate):
+            return
+        with self._cond:
+            self._pending.append(ev)
+            self._cond.notify_all()
+
+    def drain(self):
+        with self._cond:
+            events = list(self._pending)
+            self._pending.clear()
+        return events
+
+    def wait(self, timeout_ms=1000, cgroup_id=None, filename=None):
+        deadline = time.monotonic() + timeout_ms / 1e3
+        with self._cond:
+            while True:
+                while self._pending:
+                    ev = self._pending.popleft()
+                    if cgroup_id is not None and ev.cgroup_id != cgroup_id:
+                        continue
+                    if filename is not None and ev.filename != filename:
+                        continue
+                    return ev
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise TimeoutError(f"No cgroup write event within {timeout_ms} ms")
+                self._cond.wait(remaining)
+
+    def watch_cgroup(self, cgroup_path, files=("memory.max", "cpu.max")):
+        cgid = cgroup_id(cgroup_path)
+        for name in files:
+            old = self._watch_ids.get((cgroup_path, name))
+            if old is not None:
+                self._watched.discard((old, name))
+            self._watched.add((cgid, name))
+            self._watch_ids[(cgroup_path, name)] = cgid
+        return cgid
+
+    def unwatch_cgroup(self, cgroup_path, files=("memory.max", "cpu.max")):
+        for name in files:
+            cgid = self._watch_ids.pop((cgroup_path, name), None)
+            if cgid is not None:
+                self._watched.discard((cgid, name))
+
+    def watch_container(self, cgroup_path, *idents):
+        return self.watch_cgroup(cgroup_path)
+
+    def add_raw_writer(self, pid):
+        pass
+
+    def dropped(self):
+        return 0
+
+    def close(self):
+        if self in self.fs._tracers:
+            self.fs._tracers.remove(self)
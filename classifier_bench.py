@@ -0,0 +1,192 @@
+import os, sys, time, random, argparse, threading
+from multiprocessing import Process
+from process_monitoring_framework.classifier import (ClassApplier, ExecEvent, FakeExecTracer, PriorityClass,
+                                                     PriorityEngine, Rule, RuleMatcher, match_linear)
+
+RULE_COUNTS = (10, 100, 1000, 10000)
+RATES = (1000, 5000, 10000)
+EVENTS = 20000
+DURATION = 3.0
+BATCH_INTERVAL = 0.001
+CGROUP_BASE = "/sys/fs/cgroup"
+
+CLASSES = {
+    "interactive": PriorityClass("interactive", cpu_weight=400, nice=-5),
+    "batch": PriorityClass("batch", cpu_weight=50, cpu_max=2.0, nice=10, sched_policy="batch"),
+    "background": PriorityClass("background", cpu_weight=10, memory_high=512 * 1024 * 1024, sched_policy="idle"),
+}
+
+
+def make_rules(count):
+    # A mix of every kind of pattern, one rule per i.
+    classes = list(CLASSES)
+    rules = []
+    for i in range(count):
+        cls = classes[i % len(classes)]
+        kind = i % 6
+        if kind == 0:
+            spec = {"comm": f"app{i}"}
+        elif kind == 1:
+            spec = {"comm": f"job{i}-*"}
+        elif kind == 2:
+            spec = {"exe": f"/opt/svc{i}/*"}
+        elif kind == 3:
+            spec = {"exe": f"/usr/local/bin/tool{i}"}
+        elif kind == 4:
+            spec = {"parent": f"sup{i}", "comm": "w*"}
+        else:
+            spec = {"cgroup": f"{CGROUP_BASE}/tenant{i}.slice/*"}
+        rules.append(Rule(i, cls, **spec))
+    return rules
+
+
+def make_events(count, rule_count, rng):
+    # About half of the events hit a rule (i < rule_count), the rest miss
+    # every rule, which is the worst case for a linear scan.
+    events, cgroups = [], {}
+    for n in range(count):
+        i = rng.randrange(2 * rule_count)
+        kind = i % 6
+        comm, exe, parent = "sh", "/usr/bin/sh", "bash"
+        cgroup = f"{CGROUP_BASE}/user.slice"
+        if kind == 0:
+            comm = f"app{i}"
+        elif kind == 1:
+            comm = f"job{i}-{n % 7}"
+        elif kind == 2:
+            exe = f"/opt/svc{i}/bin/run"
+        elif kind == 3:
+            exe = f"/usr/local/bin/tool{i}"
+        elif kind == 4:
+            comm, parent = f"w{n % 5}", f"sup{i}"
+        else:
+            cgroup = f"{CGROUP_BASE}/tenant{i}.slice/job-{n % 3}.scope"
+        cgid = cgroups.setdefault(cgroup, len(cgroups) + 1)
+        events.append(ExecEvent(0, 100000 + n, 1, cgid, comm, exe, parent))
+    return events, {cgid: path for path, cgid in cgroups.items()}
+
+
+def matcher_rate(match, values_list):
+    t0 = time.perf_counter()
+    for values in values_list:
+        match(values)
+    return len(values_list) / (time.perf_counter() - t0)
+
+
+def bench_matcher(rule_counts, rng):
+    print(f"{'rules':>6} {'indexed execs/s':>16} {'linear execs/s':>15} {'speedup':>8}")
+    for count in rule_counts:
+        rules = make_rules(count)
+        events, paths = make_events(EVENTS, count, rng)
+        values_list = [{"comm": ev.comm, "exe": ev.exe, "parent": ev.parent_comm, "cgroup": paths[ev.cgroup_id]}
+                       for ev in events]
+        matcher = RuleMatcher(rules)
+        for values in values_list[:1000]:
+            if matcher.match(values) != match_linear(rules, values):
+                raise RuntimeError(f"Indexed and linear matchers disagree on {values}")
+        indexed = matcher_rate(matcher.match, values_list)
+        linear = matcher_rate(lambda v: match_linear(rules, v), values_list[:max(200, EVENTS // count)])
+        print(f"{count:>6} {indexed:>16.0f} {linear:>15.0f} {indexed / linear:>7.0f}x")
+
+
+def bench_engine(rule_count, rates, duration, rng):
+    # The engine loop on a FakeExecTracer fed at a fixed rate by another
+    # thread, with a dry-run applier: classification and event handling
+    # only. Lag is push -> handled.
+    print(f"\n{rule_count} rules, {duration:g} s per rate")
+    print(f"{'target/s':>9} {'handled/s':>10} {'lag p50':>10} {'lag p99':>10} {'max':>10}")
+    events, paths = make_events(EVENTS, rule_count, rng)
+    for rate in rates:
+        tracer = FakeExecTracer()
+        engine = PriorityEngine(RuleMatcher(make_rules(rule_count)), ClassApplier(CLASSES, dry_run=True), tracer)
+        engine.cgroups.update(paths)
+        stop_at = time.monotonic() + duration
+
+        def produce():
+            n = 0
+            start = time.monotonic()
+            while time.monotonic() < stop_at:
+                due = int((time.monotonic() - start) * rate)
+                now = time.monotonic_ns()
+                while n < due:
+                    tracer.push(events[n % len(events)]._replace(ts=now))
+                    n += 1
+                time.sleep(BATCH_INTERVAL)
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        while producer.is_alive():
+            engine.run_once(100)
+        producer.join()
+        engine.run_once(0)
+        lag = sorted(engine.lag_ns) or [0]
+        print(f"{rate:>9} {engine.execs / duration:>10.0f} {lag[len(lag) // 2] / 1e3:>7.0f} us "
+              f"{lag[int(len(lag) * 0.99)] / 1e3:>7.0f} us {lag[-1] / 1e3:>7.0f} us")
+
+
+def spawn_loop(rate, stop_at):
+    # Execs /bin/true at about rate per second until stop_at.
+    start = time.monotonic()
+    n = 0
+    while time.monotonic() < stop_at:
+        due = int((time.monotonic() - start) * rate)
+        while n < due:
+            pid = os.posix_spawn("/bin/true", ["true"], os.environ)
+            os.waitpid(pid, 0)
+            n += 1
+        time.sleep(BATCH_INTERVAL)
+
+
+def bench_bpf(rates, duration, spawners):
+    # Real execs through ExecTracer. The "true" rule matches every spawned
+    # process; the applier is dry-run, so nothing is changed.
+    from process_monitoring_framework.classifier import ExecTracer
+
+    print(f"\nBPF sched_process_exec, {spawners} spawner processes, {duration:g} s per rate")
+    print(f"{'target/s':>9} {'execs/s':>8} {'matched/s':>10} {'dropped':>8} {'lag p50':>10} {'lag p99':>10}")
+    rules = make_rules(1000) + [Rule(1000, "background", comm="true")]
+    with ExecTracer() as tracer:
+        for rate in rates:
+            tracer.drain()
+            engine = PriorityEngine(RuleMatcher(rules), ClassApplier(CLASSES, dry_run=True), tracer)
+            dropped0 = tracer.dropped()
+            stop_at = time.monotonic() + duration
+            procs = [Process(target=spawn_loop, args=(rate / spawners, stop_at)) for _ in range(spawners)]
+            for p in procs:
+                p.start()
+            while time.monotonic() < stop_at:
+                engine.run_once(100)
+            for p in procs:
+                p.join()
+            engine.run_once(100)
+            lag = sorted(engine.lag_ns) or [0]
+            print(f"{rate:>9} {engine.execs / duration:>8.0f} {engine.matched.get('background', 0) / duration:>10.0f} "
+                  f"{tracer.dropped() - dropped0:>8} {lag[len(lag) // 2] / 1e3:>7.0f} us "
+                  f"{lag[int(len(lag) * 0.99)] / 1e3:>7.0f} us")
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Exec classification throughput")
+    p.add_argument("--rules", type=int, action="append", help="rule count, repeatable (default: 10, 100, 1000)")
+    p.add_argument("--rate", type=int, action="append", help="execs/s for the engine runs (default: 1k, 5k, 10k)")
+    p.add_argument("--duration", type=float, default=DURATION, help="seconds per rate")
+    p.add_argument("--bpf", action="store_true", help="also exec /bin/true for real through ExecTracer (root, bcc)")
+    p.add_argument("--spawners", type=int, default=min(4, os.cpu_count() or 1), help="exec'ing processes for --bpf")
+    args = p.parse_args(argv)
+    args.rules = args.rules or list(RULE_COUNTS)
+    args.rate = args.rate or list(RATES)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rng = random.Random(1)
+    bench_matcher(args.rules, rng)
+    bench_engine(max(args.rules), args.rate, args.duration, rng)
+    if args.bpf:
+        bench_bpf(args.rate, args.duration, args.spawners)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+import json, queue, socket
+from contextlib import contextmanager
+from urllib.parse import quote, urlencode
+
+DOCKER_SOCKET = "/var/run/docker.sock"
+
+
+class DockerAPIError(RuntimeError):
+    def __init__(self, status, message):
+        super().__init__(f"Docker API error {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class UnixHTTPConnection:
+    # Minimal HTTP/1.1 client over a unix socket. The connection is kept
+    # alive across requests and several requests may be written before
+    # their responses are read (pipelining).
+
+    def __init__(self, path, timeout=None):
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(path)
+        except OSError:
+            self.sock.close()
+            raise
+        self.rfile = self.sock.makefile("rb")
+        self.reusable = True
+        self.responses = 0
+
+    def send_request(self, method, url, body=None):
+        headers = [f"{method} {url} HTTP/1.1", "Host: docker"]
+        if body is not None:
+            if not isinstance(body, bytes):
+                body = json.dumps(body).encode()
+            headers.append("Content-Type: application/json")
+            headers.append(f"Content-Length: {len(body)}")
+        else:
+            body = b""
+        self.sock.sendall(("\r\n".join(headers) + "\r\n\r\n").encode() + body)
+
+    def read_head(self):
+        line = self.rfile.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        parts = line.decode("latin-1").split(" ", 2)
+        status = int(parts[1])
+        headers = {}
+        while True:
+            line = self.rfile.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = line.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+        return status, headers
+
+    def iter_chunks(self):
+        while True:
+            size = int(self.rfile.readline().split(b";")[0], 16)
+            if size == 0:
+                self.rfile.readline()
+                return
+            data = self.rfile.read(size)
+            self.rfile.readline()
+            yield data
+
+    def read_response(self):
+        status, headers = self.read_head()
+        if headers.get("connection", "").lower() == "close":
+            self.reusable = False
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = b"".join(self.iter_chunks())
+        elif "content-length" in headers:
+            body = self.rfile.read(int(headers["content-length"]))
+        elif status in (204, 304):
+            body = b""
+        else:
+            body = self.rfile.read()
+        self.responses += 1
+        return status, headers, body
+
+    def request(self, method, url, body=None):
+        self.send_request(method, url, body)
+        return self.read_response()
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+
+def _check(status, body):
+    if status >= 400:
+        try:
+            message = json.loads(body).get("message", body.decode(errors="replace"))
+        except ValueError:
+            message = body.decode(errors="replace")
+        raise DockerAPIError(status, message)
+    return json.loads(body) if body else None
+
+
+def update_body(memory=None, memory_swap=None, cpus=None, cpu_quota=None, cpu_period=None, **extra):
+    # Field names follow the Engine API ContainerUpdate request; cpus maps to
+    # NanoCpus exactly like `docker update --cpus`.
+    body = dict(extra)
+    if memory is not None:
+        body["Memory"] = int(memory)
+    if memory_swap is not None:
+        body["MemorySwap"] = int(memory_swap)
+    if cpus is not None:
+        body["NanoCpus"] = int(round(cpus * 1e9))
+    if cpu_quota is not None:
+        body["CpuQuota"] = int(cpu_quota)
+    if cpu_period is not None:
+        body["CpuPeriod"] = int(cpu_period)
+    return body
+
+
+class DockerClient:
+    def __init__(self, socket_path=DOCKER_SOCKET, version=None, timeout=None):
+        self.socket_path = socket_path
+        self.prefix = f"/v{version.lstrip('v')}" if version else ""
+        self.timeout = timeout
+        self._pool = queue.LifoQueue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _new_connection(self):
+        return UnixHTTPConnection(self.socket_path, self.timeout)
+
+    @contextmanager
+    def connection(self):
+        # One keep-alive connection per concurrent caller, reused afterwards.
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._new_connection()
+        try:
+            yield conn
+        except BaseException:
+            conn.close()
+            raise
+        if conn.reusable:
+            self._pool.put(conn)
+        else:
+            conn.close()
+
+    def _url(self, path, params=None):
+        url = self.prefix + path
+        if params:
+            url += "?" + urlencode(params)
+        return url
+
+    def request(self, method, path, body=None, params=None):
+        url = self._url(path, params)
+        conn = None
+        try:
+            with self.connection() as conn:
+                status, _, data = conn.request(method, url, body)
+        except ConnectionError:
+            # dockerd closes idle keep-alive connections; a pooled one may be
+            # gone by now. Retry once on a new connection, but only if the
+            # failed one had already served a response (i.e. it was stale).
+            # conn is None when the connect itself failed.
+            if conn is None or not conn.responses:
+                raise
+            with self.connection() as conn:
+                status, _, data = conn.request(method, url, body)
+        return _check(status, data)
+
+    def update(self, container, **limits):
+        return self.request("POST", f"/containers/{quote(container, safe='')}/update", update_body(**limits))
+
+    def inspect(self, container):
+        return self.request("GET", f"/containers/{quote(container, safe='')}/json")
+
+    def update_pipelined(self, updates):
+        # updates: iterable of (container, {limits}). All requests are written
+        # on one connection before any response is read.
+        updates = list(updates)
+        with self.connection() as conn:
+            for container, limits in updates:
+                conn.send_request("POST", self._url(f"/containers/{quote(container, safe='')}/update"),
+                                  update_body(**limits))
+            responses = [conn.read_response() for _ in updates]
+        return [_check(status, data) for status, _, data in responses]
+
+    def events(self, filters=None, since=None, until=None):
+        # Streams on a dedicated connection; it is closed when the generator is.
+        params = {}
+        if filters:
+            params["filters"] = json.dumps(filters)
+        if since is not None:
+            params["since"] = str(since)
+        if until is not None:
+            params["until"] = str(until)
+        conn = self._new_connection()
+        try:
+            conn.send_request("GET", self._url("/events", params))
+            status, headers = conn.read_head()
+            if status >= 400:
+                raise DockerAPIError(status, conn.rfile.read(int(headers.get("content-length", 0))).decode())
+            if headers.get("transfer-encoding", "").lower() == "chunked":
+                chunks = conn.iter_chunks()
+            else:
+                chunks = iter(conn.rfile.readline, b"")
+            buf = b""
+            for chunk in chunks:
+                buf += chunk
+                while b"\n" in buf:
+                    line, buf = buf.split(b"\n", 1)
+                    if line.strip():
+                        yield json.loads(line)
+        finally:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,105 @@
+import os, sys, time, tempfile, subprocess
+from concurrent.futures import ThreadPoolExecutor
+from docker_api import DockerClient, DOCKER_SOCKET
+from fake_dockerd import FakeDockerd
+from cgbench import CONTAINER_NAME, initial_mem, MEM_DELTA, build_image, start_containers, remove_containers
+
+ITERATIONS = 200
+CONCURRENCY = (1, 4, 16)
+PIPELINE_DEPTH = 16
+
+
+
+def summarize(label, samples_ns, total_ns=None):
+    samples_ns = sorted(samples_ns)
+    avg = sum(samples_ns) / len(samples_ns)
+    p99 = samples_ns[min(len(samples_ns) - 1, int(len(samples_ns) * 0.99))]
+    line = f"{label:<28} avg {avg / 1e6:8.3f} ms  p99 {p99 / 1e6:8.3f} ms"
+    if total_ns:
+        line += f"  {len(samples_ns) / (total_ns / 1e9):9.0f} updates/s"
+    print(line)
+
+
+def bench_cli(iterations):
+    samples = []
+    for i in range(iterations):
+        mem = initial_mem + (MEM_DELTA if i % 2 == 0 else -MEM_DELTA)
+        t0 = time.monotonic_ns()
+        subprocess.run(["docker", "update", "--memory", str(mem), CONTAINER_NAME],
+                       stdout=subprocess.DEVNULL, check=True)
+        samples.append(time.monotonic_ns() - t0)
+    return samples
+
+
+def bench_api(client, iterations):
+    samples = []
+    for i in range(iterations):
+        mem = initial_mem + (MEM_DELTA if i % 2 == 0 else -MEM_DELTA)
+        t0 = time.monotonic_ns()
+        client.update(CONTAINER_NAME, memory=mem)
+        samples.append(time.monotonic_ns() - t0)
+    return samples
+
+
+def bench_api_concurrent(client, iterations, workers):
+    def one(i):
+        mem = initial_mem + (MEM_DELTA if i % 2 == 0 else -MEM_DELTA)
+        t0 = time.monotonic_ns()
+        client.update(CONTAINER_NAME, memory=mem)
+        return time.monotonic_ns() - t0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        t0 = time.monotonic_ns()
+        samples = list(pool.map(one, range(iterations)))
+        return samples, time.monotonic_ns() - t0
+
+
+def bench_api_pipelined(client, iterations, depth):
+    samples = []
+    t_start = time.monotonic_ns()
+    for start in range(0, iterations, depth):
+        batch = [(CONTAINER_NAME, {"memory": initial_mem + (MEM_DELTA if i % 2 == 0 else -MEM_DELTA)})
+                 for i in range(start, min(start + depth, iterations))]
+        t0 = time.monotonic_ns()
+        client.update_pipelined(batch)
+        # Per-request cost within the pipeline.
+        samples.extend([(time.monotonic_ns() - t0) / len(batch)] * len(batch))
+    return samples, time.monotonic_ns() - t_start
+
+
+def main():
+    fake = "--fake" in sys.argv
+    server = None
+    if fake:
+        socket_path = os.path.join(tempfile.mkdtemp(), "docker.sock")
+        server = FakeDockerd(socket_path)
+        server.add_container(CONTAINER_NAME)
+        server.start()
+    else:
+        socket_path = DOCKER_SOCKET
+        print("Building image...")
+        build_image()
+        start_containers(1)
+
+    try:
+        print(f"\n{ITERATIONS} memory updates against {socket_path}\n")
+        if not fake:
+            summarize("docker CLI", bench_cli(ITERATIONS))
+        with DockerClient(socket_path) as client:
+            client.inspect(CONTAINER_NAME)
+            summarize("Engine API keep-alive", bench_api(client, ITERATIONS))
+            for workers in CONCURRENCY:
+                samples, total = bench_api_concurrent(client, ITERATIONS, workers)
+                summarize(f"Engine API x{workers} concurrent", samples, total)
+            samples, total = bench_api_pipelined(client, ITERATIONS, PIPELINE_DEPTH)
+            summarize(f"Engine API pipelined ({PIPELINE_DEPTH})", samples, total)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        else:
+            remove_containers([CONTAINER_NAME])
+
+
+if __name__ == "__main__":
+    main()
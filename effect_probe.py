@@ -0,0 +1,177 @@
+import os, time
+from collections import namedtuple, deque
+
+# Polling interval when waiting for a limit to take effect. It bounds the
+# resolution of cpu.stat / memory.current based effect times.
+POLL_INTERVAL = 0.0001
+
+ReclaimEvent = namedtuple("ReclaimEvent", ["begin_ts", "end_ts", "pid", "cgroup_id", "nr_reclaimed"])
+
+bpf_code = """
+#include <uapi/linux/ptrace.h>
+
+struct reclaim_event {
+    u64 begin_ts;
+    u64 end_ts;
+    u64 cgroup_id;
+    u64 nr_reclaimed;
+    u32 pid;
+};
+
+BPF_RINGBUF_OUTPUT(events, 16);
+BPF_HASH(begin, u32, u64);
+
+// memcg limit reclaim: from memory.max/memory.high writes (in the writer's
+// context) and from charges over the limit (in the workload's context).
+TRACEPOINT_PROBE(vmscan, mm_vmscan_memcg_reclaim_begin) {
+    u32 tid = bpf_get_current_pid_tgid();
+    u64 ts = bpf_ktime_get_ns();
+    begin.update(&tid, &ts);
+    return 0;
+}
+
+TRACEPOINT_PROBE(vmscan, mm_vmscan_memcg_reclaim_end) {
+    u64 pid_tgid = bpf_get_current_pid_tgid();
+    u32 tid = pid_tgid;
+    u64 *ts = begin.lookup(&tid);
+    if (!ts)
+        return 0;
+    struct reclaim_event *ev = events.ringbuf_reserve(sizeof(struct reclaim_event));
+    if (ev) {
+        ev->begin_ts = *ts;
+        ev->end_ts = bpf_ktime_get_ns();
+        ev->cgroup_id = bpf_get_current_cgroup_id();
+        ev->nr_reclaimed = args->nr_reclaimed;
+        ev->pid = pid_tgid >> 32;
+        events.ringbuf_submit(ev, 0);
+    }
+    begin.delete(&tid);
+    return 0;
+}
+"""
+
+
+class ReclaimTracer:
+    # Reports every memcg reclaim pass with its begin/end time (CLOCK_MONOTONIC,
+    # like WriteEvent.ts), the reclaiming process and its cgroup. The
+    # tracepoints do not say which memcg is reclaimed, so callers match on
+    # the writer's pid or the workload's cgroup id.
+
+    def __init__(self):
+        from bcc import BPF
+
+        self.bpf = BPF(text=bpf_code)
+        self._pending = deque()
+        self.bpf["events"].open_ring_buffer(self._on_event)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _on_event(self, ctx, data, size):
+        ev = self.bpf["events"].event(data)
+        self._pending.append(ReclaimEvent(ev.begin_ts, ev.end_ts, ev.pid, ev.cgroup_id, ev.nr_reclaimed))
+
+    def drain(self):
+        self.bpf.ring_buffer_consume()
+        events = list(self._pending)
+        self._pending.clear()
+        return events
+
+    def close(self):
+        self.bpf.cleanup()
+
+
+def reclaim_window(events, start, end, pids=(), cgroup_id=None):
+    # (first begin_ts, last end_ts) of the passes that began in [start, end]
+    # in one of pids or in cgroup_id, or None. A memory.max write reclaims in
+    # a loop, one pass per iteration.
+    passes = [ev for ev in events
+              if start <= ev.begin_ts <= end and (ev.pid in pids or ev.cgroup_id == cgroup_id)]
+    if not passes:
+        return None
+    return min(ev.begin_ts for ev in passes), max(ev.end_ts for ev in passes)
+
+
+def _read_counter(fd, key):
+    data = os.pread(fd, 4096, 0)
+    i = data.index(key)
+    return int(data[i + len(key) + 1:data.index(b"\n", i)])
+
+
+class EffectProbe:
+    # Watches one cgroup for a lowered limit to take effect:
+    #   cpu.max    - cpu.stat nr_throttled grows past its value at arm()
+    #   memory.max - memory.current is at or below the new limit
+    # arm() must be called before the update is issued.
+
+    def __init__(self, cgroup_path):
+        self.cgroup_path = cgroup_path
+        self._stat = os.open(os.path.join(cgroup_path, "cpu.stat"), os.O_RDONLY | os.O_CLOEXEC)
+        self._current = os.open(os.path.join(cgroup_path, "memory.current"), os.O_RDONLY | os.O_CLOEXEC)
+        self._throttled = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def nr_throttled(self):
+        return _read_counter(self._stat, b"nr_throttled")
+
+    def memory_current(self):
+        return int(os.pread(self._current, 64, 0))
+
+    def arm(self):
+        self._throttled = self.nr_throttled()
+
+    def reached(self, knob, limit):
+        if knob == "cpu.max":
+            return self.nr_throttled() > self._throttled
+        return self.memory_current() <= limit
+
+    def settle(self, knob, timeout, quiet=0.3):
+        # After the limit was raised again: wait until the workload runs
+        # unthrottled (no new throttled periods for quiet seconds) or has
+        # faulted its memory back in (memory.current stable for quiet s).
+        deadline = time.monotonic() + timeout
+        read = self.nr_throttled if knob == "cpu.max" else self.memory_current
+        last, since = read(), time.monotonic()
+        while time.monotonic() < deadline:
+            time.sleep(0.02)
+            value = read()
+            if value != last:
+                last, since = value, time.monotonic()
+            elif time.monotonic() - since >= quiet:
+                return True
+        return False
+
+    def close(self):
+        os.close(self._stat)
+        os.close(self._current)
+
+
+def wait_for_effect(probes, knob, limit, timeout):
+    # probes: {key: armed EffectProbe}. Polls them all every POLL_INTERVAL
+    # and returns {key: CLOCK_MONOTONIC ns the effect was first seen}; keys
+    # still missing at the timeout are left out.
+    seen = {}
+    deadline = time.monotonic() + timeout
+    while len(seen) < len(probes):
+        for key, probe in probes.items():
+            if key not in seen and probe.reached(knob, limit):
+                seen[key] = time.monotonic_ns()
+        if time.monotonic() > deadline:
+            break
+        time.sleep(POLL_INTERVAL)
+    return seen
+
+
+def swap_available():
+    # Lowering memory.max under anonymous memory only reclaims with swap;
+    # without it the workload is OOM-killed.
+    with open("/proc/swaps") as f:
+        return len(f.read().splitlines()) > 1
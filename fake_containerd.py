@@ -0,0 +1,86 @@
+import os, sys, json, socket, subprocess, socketserver, threading
+from update_waterfall import mark_stage
+
+# Stand-in for containerd plus shim on a unix socket: one JSON request per
+# line ({"cgroup": path, "resources": {...}}), answered with one JSON line
+# after running the stand-in runc (fake_runc.py) as a child process, like the
+# shim runs `runc update`. Stages are reported through mark_stage().
+
+FAKE_RUNC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_runc.py")
+
+
+class FakeContainerd(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, runc=(sys.executable, FAKE_RUNC)):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.socket_path = socket_path
+        self.runc = list(runc)
+        self.updates = 0
+        super().__init__(socket_path, _Handler)
+
+    def update(self, cgroup_path, resources):
+        mark_stage("runc_fork")
+        proc = subprocess.Popen(self.runc + [cgroup_path], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        out, err = proc.communicate(json.dumps(resources).encode())
+        mark_stage("runc_exit", pid=proc.pid)
+        if proc.returncode:
+            raise RuntimeError(f"runc update failed: {err.decode(errors='replace').strip()}")
+        for line in out.decode().splitlines():
+            stage, _, ts = line.partition(" ")
+            mark_stage(stage, int(ts), pid=proc.pid)
+        self.updates += 1
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            mark_stage("containerd_recv")
+            request = json.loads(line)
+            try:
+                self.server.update(request["cgroup"], request["resources"])
+                reply = {"ok": True}
+            except (OSError, RuntimeError) as e:
+                reply = {"ok": False, "error": str(e)}
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+
+class ContainerdClient:
+    # dockerd's side: one persistent connection, one request at a time.
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self._sock = None
+        self._rfile = None
+        self._lock = threading.Lock()
+
+    def update(self, cgroup_path, resources):
+        with self._lock:
+            if self._sock is None:
+                mark_stage("connect")
+                self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self._sock.connect(self.socket_path)
+                self._rfile = self._sock.makefile("rb")
+            mark_stage("containerd_send")
+            self._sock.sendall(json.dumps({"cgroup": cgroup_path, "resources": resources}).encode() + b"\n")
+            reply = json.loads(self._rfile.readline())
+        if not reply["ok"]:
+            raise RuntimeError(reply["error"])
+
+    def close(self):
+        if self._sock is not None:
+            self._rfile.close()
+            self._sock.close()
+            self._sock = None
@@ -0,0 +1,235 @@
+import os, re, sys, json, time, queue, threading, socketserver, uuid
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import unquote, urlsplit
+from cgroup_writer import CgroupWriter
+from cgroupfs import mark_request_start, clear_request_start
+from fake_containerd import ContainerdClient
+from update_waterfall import mark_stage
+
+# Stand-in for dockerd on a unix socket. Implements the subset of the Engine
+# API the benchmarks use (container update/inspect, events) so the client and
+# the update path can be exercised without Docker or root. Containers may be
+# bound to a cgroup directory; updates are then written through CgroupWriter,
+# on the given cgroupfs backend (e.g. a FakeCgroupFS tree), or, with
+# containerd_socket, handed to the stand-in containerd (fake_containerd.py)
+# which runs a stand-in runc, like the real update path. idle_timeout closes
+# keep-alive connections idle for that many seconds, like dockerd does.
+
+_CONTAINER_PATH = re.compile(r"^(?:/v[0-9.]+)?/containers/([^/]+)/(update|json)$")
+_EVENTS_PATH = re.compile(r"^(?:/v[0-9.]+)?/events$")
+
+
+class FakeDockerd(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, update_delay=0.0, fs=None, containerd_socket=None, idle_timeout=None):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.socket_path = socket_path
+        self.update_delay = update_delay
+        self.idle_timeout = idle_timeout
+        self.accepts = 0
+        self.containers = {}
+        self.writer = CgroupWriter(fs=fs)
+        self.containerd = ContainerdClient(containerd_socket) if containerd_socket else None
+        self.updates = 0
+        self._lock = threading.Lock()
+        self._subscribers = []
+        super().__init__(socket_path, _Handler)
+
+    def add_container(self, name, cgroup_path=None, pid=0, container_id=None):
+        container_id = container_id or uuid.uuid4().hex + uuid.uuid4().hex
+        info = {
+            "Id": container_id,
+            "Name": "/" + name,
+            "State": {"Running": True, "Pid": pid},
+            "HostConfig": {"Memory": 0, "MemorySwap": 0, "NanoCpus": 0, "CpuQuota": 0, "CpuPeriod": 0},
+            "CgroupPath": cgroup_path,
+        }
+        with self._lock:
+            self.containers[container_id] = info
+        return container_id
+
+    def find(self, ident):
+        # Like dockerd: full ID, then name, then ID prefix.
+        with self._lock:
+            if ident in self.containers:
+                return self.containers[ident]
+            for info in self.containers.values():
+                if info["Name"] == "/" + ident:
+                    return info
+            for info in self.containers.values():
+                if info["Id"].startswith(ident):
+                    return info
+        return None
+
+    def apply_update(self, info, body):
+        if self.update_delay:
+            time.sleep(self.update_delay)
+        host = info["HostConfig"]
+        for key in ("Memory", "MemorySwap", "NanoCpus", "CpuQuota", "CpuPeriod"):
+            if key in body:
+                host[key] = int(body[key])
+        path = info["CgroupPath"]
+        if path and self.containerd is not None:
+            self.containerd.update(path, runtime_resources(host, body))
+        elif path:
+            if "Memory" in body:
+                self.writer.set_memory_max(path, host["Memory"] or None)
+            if "NanoCpus" in body or "CpuQuota" in body:
+                period = host["CpuPeriod"] or 100000
+                if host["NanoCpus"]:
+                    quota = host["NanoCpus"] * period // 10**9
+                else:
+                    quota = host["CpuQuota"] or None
+                self.writer.set_cpu_max(path, quota, period)
+        with self._lock:
+            self.updates += 1
+        self.publish({"Type": "container", "Action": "update", "Actor": {"ID": info["Id"]},
+                      "time": int(time.time()), "timeNano": time.time_ns()})
+
+    def get_request(self):
+        request = super().get_request()
+        with self._lock:
+            self.accepts += 1
+        return request
+
+    def subscribe(self):
+        q = queue.Queue()
+        with self._lock:
+            self._subscribers.append(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.remove(q)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            q.put(event)
+
+    def server_close(self):
+        super().server_close()
+        self.writer.close()
+        if self.containerd is not None:
+            self.containerd.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def runtime_resources(host, body):
+    # The OCI LinuxResources subset dockerd sends to containerd for an update.
+    resources = {}
+    if "Memory" in body:
+        resources["memory"] = {"limit": host["Memory"] or -1}
+    if "NanoCpus" in body or "CpuQuota" in body:
+        period = host["CpuPeriod"] or 100000
+        quota = host["NanoCpus"] * period // 10**9 if host["NanoCpus"] else host["CpuQuota"] or -1
+        resources["cpu"] = {"quota": quota, "period": period}
+    return resources
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        # A timed-out read ends handle() and closes the connection.
+        self.timeout = self.server.idle_timeout
+        super().setup()
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, payload=None):
+        body = b"" if payload is None else json.dumps(payload).encode()
+        self.send_response(status)
+        if body:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def do_POST(self):
+        # The request line has been read: the start of the dockerd stage.
+        mark_request_start()
+        mark_stage("dockerd_recv")
+        try:
+            self._post()
+        finally:
+            clear_request_start()
+
+    def _post(self):
+        m = _CONTAINER_PATH.match(urlsplit(self.path).path)
+        if not m or m.group(2) != "update":
+            return self._reply(404, {"message": "page not found"})
+        body = self._read_body()
+        info = self.server.find(unquote(m.group(1)))
+        if info is None:
+            return self._reply(404, {"message": f"No such container: {m.group(1)}"})
+        try:
+            self.server.apply_update(info, body)
+        except (OSError, RuntimeError) as e:
+            return self._reply(500, {"message": str(e)})
+        mark_stage("dockerd_reply")
+        self._reply(200, {"Warnings": []})
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if _EVENTS_PATH.match(path):
+            return self._stream_events()
+        m = _CONTAINER_PATH.match(path)
+        if not m or m.group(2) != "json":
+            return self._reply(404, {"message": "page not found"})
+        info = self.server.find(unquote(m.group(1)))
+        if info is None:
+            return self._reply(404, {"message": f"No such container: {m.group(1)}"})
+        self._reply(200, {k: v for k, v in info.items() if k != "CgroupPath"})
+
+    def _stream_events(self):
+        q = self.server.subscribe()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.wfile.flush()
+            while True:
+                data = json.dumps(q.get()).encode() + b"\n"
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.server.unsubscribe(q)
+            self.close_connection = True
+
+
+def main():
+    socket_path = sys.argv[1] if len(sys.argv) > 1 else "/tmp/fake-docker.sock"
+    server = FakeDockerd(socket_path)
+    for spec in sys.argv[2:]:
+        # name[=cgroup_path]
+        name, _, cgroup_path = spec.partition("=")
+        print(f"{name}: {server.add_container(name, cgroup_path or None)}")
+    print(f"Listening on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import os, sys, json, time
+
+# Stand-in for `runc update --resources - <id>`: reads the resources JSON on
+# stdin and writes them into the cgroup directory given as argument. Prints
+# "<stage> <CLOCK_MONOTONIC ns>" lines for the stages only it can observe
+# (its exec and its first cgroup write).
+
+
+def write_file(path, value):
+    with open(path, "w") as f:
+        f.write(value)
+
+
+def main():
+    exec_ts = time.monotonic_ns()
+    cgroup_path = sys.argv[1]
+    resources = json.load(sys.stdin)
+    writes = []
+    memory = resources.get("memory", {}).get("limit")
+    if memory is not None:
+        writes.append(("memory.max", "max" if memory <= 0 else str(memory)))
+    cpu = resources.get("cpu", {})
+    if "quota" in cpu or "period" in cpu:
+        quota = cpu.get("quota", -1)
+        writes.append(("cpu.max", f"{'max' if quota <= 0 else quota} {cpu.get('period', 100000)}"))
+    write_ts = None
+    for name, value in writes:
+        if write_ts is None:
+            write_ts = time.monotonic_ns()
+        write_file(os.path.join(cgroup_path, name), value)
+    print(f"runc_exec {exec_ts}")
+    if write_ts is not None:
+        print(f"cgroup_write {write_ts}")
+
+
+if __name__ == "__main__":
+    main()
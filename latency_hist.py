@@ -0,0 +1,61 @@
+KNOBS = ("memory.max", "cpu.max")
+PATHS = ("raw", "dockerd")
+PERCENTILES = (50, 90, 99, 99.9)
+
+# Log-linear buckets, matching hist_slot() in write_tracer.py: values below
+# 2**SUB_BITS get their own slot, above that every power of two is split
+# into 2**SUB_BITS linear sub-buckets (12.5% resolution for SUB_BITS=3).
+SUB_BITS = 3
+SUB_BUCKETS = 1 << SUB_BITS
+
+
+def slot_of(value):
+    if value < SUB_BUCKETS:
+        return int(value)
+    log2 = int(value).bit_length() - 1
+    return (log2 - SUB_BITS + 1) * SUB_BUCKETS + ((int(value) >> (log2 - SUB_BITS)) & (SUB_BUCKETS - 1))
+
+
+def slot_bounds(slot):
+    if slot < SUB_BUCKETS:
+        return slot, slot + 1
+    log2 = slot // SUB_BUCKETS + SUB_BITS - 1
+    sub = slot % SUB_BUCKETS
+    shift = log2 - SUB_BITS
+    return (SUB_BUCKETS + sub) << shift, (SUB_BUCKETS + sub + 1) << shift
+
+
+def percentile(counts, q):
+    total = sum(counts.values())
+    if not total:
+        return float("nan")
+    target = total * q / 100.0
+    seen = 0
+    for slot in sorted(counts):
+        n = counts[slot]
+        if seen + n >= target:
+            lo, hi = slot_bounds(slot)
+            return lo + (hi - lo) * (target - seen) / n
+        seen += n
+    return float(slot_bounds(max(counts))[1])
+
+
+def summarize(counts, max_ns=None):
+    if max_ns is None:
+        max_ns = slot_bounds(max(counts))[1] if counts else float("nan")
+    summary = {"count": sum(counts.values())}
+    for q in PERCENTILES:
+        # Interpolating inside the top bucket can overshoot the exact max.
+        summary[f"p{q:g}"] = min(percentile(counts, q), max_ns)
+    summary["max"] = max_ns
+    return summary
+
+
+def print_report(hists, maxes=None):
+    maxes = maxes or {}
+    cols = [f"p{q:g}" for q in PERCENTILES] + ["max"]
+    print(f"{'knob':<12} {'path':<8} {'count':>9} " + " ".join(f"{c:>10}" for c in cols))
+    for key in sorted(hists):
+        s = summarize(hists[key], maxes.get(key))
+        values = " ".join(f"{s[c] / 1e6:>7.3f} ms" for c in cols)
+        print(f"{key[0]:<12} {key[1]:<8} {s['count']:>9} {values}")
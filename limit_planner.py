@@ -0,0 +1,219 @@
+import os, time
+from collections import namedtuple
+from cgroup_writer import CgroupWriter, cpu_max_bytes
+from cgroupfs import CgroupFS
+
+CPU_PERIOD = 100000
+# Initial cpu.weight of a group's average budget (the default weight).
+WEIGHT_PER_CORE = 100
+MIN_WEIGHT, MAX_WEIGHT = 1, 10000
+# Below this the rounding of cpu.weight is too coarse; rescale the group.
+MIN_MAX_WEIGHT = 50
+# Smallest cpu.max quota the kernel accepts.
+MIN_QUOTA = 1000
+
+PlanResult = namedtuple("PlanResult", ["writes", "wall_ns", "failed"])
+
+
+_WEIGHT_BYTES = [str(max(MIN_WEIGHT, w)).encode() for w in range(MAX_WEIGHT + 1)]
+
+
+def cpu_weight_bytes(weight):
+    weight = round(weight)
+    return _WEIGHT_BYTES[weight if weight <= MAX_WEIGHT else MAX_WEIGHT]
+
+
+def cpu_budget_bytes(cores, period=CPU_PERIOD):
+    if cores is None:
+        return cpu_max_bytes(None, period)
+    return cpu_max_bytes(max(MIN_QUOTA, int(cores * period)), period)
+
+
+def _quota(value):
+    quota = value.split()[0]
+    return None if quota == b"max" else int(quota)
+
+
+class LimitPlanner:
+    # Turns per-cgroup CPU budgets (in cores) into the smallest set of
+    # cgroupfs writes. By default every budget is a hard cpu.max on its own
+    # cgroup.
+    #
+    # Parents listed in shared opt in to group enforcement: when every child
+    # of such a parent has a budget and none of them is strict, the group is
+    # enforced by one cpu.max on the parent (sum of the budgets). The
+    # children's shares come from cpu.weight and their own cpu.max is
+    # lifted. Weights are kept on a per-group scale that follows
+    # proportional changes, so scaling the whole group is a single write and
+    # changing one child is the parent plus that child's weight.
+    #
+    # That is not equivalent to per-child caps: it only matches them while
+    # the group is saturated. When some children idle, the others may use
+    # the slack up to the group total, and shares are only as exact as the
+    # integer weights. Hence opt-in, per parent.
+    #
+    # Only values that differ from what is already in the files are written.
+    # The current state is read once and then tracked. Writes that tighten a
+    # cap go first and writes that relax one go last, so no intermediate
+    # state allows more than the old or the new plan.
+
+    def __init__(self, writer=None, fs=None, period=CPU_PERIOD):
+        self.fs = fs or CgroupFS()
+        self.writer = writer or CgroupWriter(files=("cpu.max", "cpu.weight"), fs=self.fs)
+        self.period = period
+        self.state = {}
+        self._children = {}
+        self._parents = {}
+        self._grouped = set()
+        self._next_grouped = set()
+        # parent -> (budgets, weight per core) of the last grouped plan.
+        self._scales = {}
+        self._next_scales = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def children(self, parent):
+        kids = self._children.get(parent)
+        if kids is None:
+            with os.scandir(parent) as it:
+                kids = frozenset(e.path for e in it if e.is_dir(follow_symlinks=False))
+            self._children[parent] = kids
+        return kids
+
+    def refresh(self):
+        # Forget the discovered tree and file state, e.g. after containers
+        # were added or removed or something else wrote the files.
+        self._children.clear()
+        self.state.clear()
+        self._scales.clear()
+
+    def _current(self, path, name):
+        key = (path, name)
+        value = self.state.get(key)
+        if value is None:
+            with open(os.path.join(path, name), "rb") as f:
+                value = f.read().strip()
+            self.state[key] = value
+        return value
+
+    def _scale(self, parent, kids, budgets, total):
+        # Weight per core for this group. If every budget changed by the same
+        # factor, the scale absorbs it and the weights stay as they are.
+        last = self._scales.get(parent)
+        scale = None
+        if last is not None and set(last[0]) == set(kids):
+            old, scale = last
+            factor = total / sum(old.values())
+            if any(abs(budgets[k] - old[k] * factor) > 1e-9 * budgets[k] for k in kids):
+                factor = 1.0
+            scale /= factor
+            top = max(budgets[k] for k in kids) * scale
+            if top > MAX_WEIGHT or top < MIN_MAX_WEIGHT or min(budgets[k] for k in kids) * scale < MIN_WEIGHT:
+                scale = None
+        if scale is None:
+            scale = WEIGHT_PER_CORE * len(kids) / total
+            scale = min(scale, MAX_WEIGHT / max(budgets[k] for k in kids))
+        self._next_scales[parent] = ({k: budgets[k] for k in kids}, scale)
+        return scale
+
+    def plan(self, budgets, strict=(), shared=()):
+        # budgets: {cgroup_path: cores or None (unlimited)}. shared: parents
+        # whose children may be capped as a group; strict: children that
+        # keep their own cap even then.
+        # Returns the ordered list of (cgroup_path, file, value) to write.
+        desired = []
+        grouped = set()
+        self._next_scales = {}
+        by_parent = {}
+        parents = self._parents
+        for path in budgets:
+            parent = parents.get(path)
+            if parent is None:
+                parent = parents[path] = os.path.dirname(path)
+            kids = by_parent.get(parent)
+            if kids is None:
+                by_parent[parent] = [path]
+            else:
+                kids.append(path)
+        unlimited = cpu_budget_bytes(None, self.period)
+        for parent, kids in by_parent.items():
+            if (parent in shared and len(kids) > 1 and parent != self.fs.root
+                    and len(self.children(parent)) == len(kids)
+                    and self.children(parent).issuperset(kids)
+                    and not any(k in strict or budgets[k] is None for k in kids)):
+                grouped.add(parent)
+                total = sum(budgets[k] for k in kids)
+                desired.append((parent, "cpu.max", cpu_budget_bytes(total, self.period)))
+                scale = self._scale(parent, kids, budgets, total)
+                for k in kids:
+                    desired.append((k, "cpu.max", unlimited))
+                    desired.append((k, "cpu.weight", cpu_weight_bytes(budgets[k] * scale)))
+            else:
+                for k in kids:
+                    desired.append((k, "cpu.max", cpu_budget_bytes(budgets[k], self.period)))
+        # Parents grouped last time but not now get their cap lifted, after
+        # the children are capped again.
+        for parent in self._grouped - grouped:
+            desired.append((parent, "cpu.max", unlimited))
+        self._next_grouped = grouped
+
+        tighten, weights, relax = [], [], []
+        state = self.state
+        for write in desired:
+            path, name, value = write
+            current = state.get((path, name)) or self._current(path, name)
+            if current == value:
+                continue
+            if name == "cpu.weight":
+                weights.append(write)
+                continue
+            old, new = _quota(current), _quota(value)
+            if new is not None and (old is None or new < old):
+                tighten.append(write)
+            else:
+                relax.append(write)
+        # Parents before children when tightening, children before parents
+        # when relaxing.
+        tighten.sort(key=lambda w: w[0].count(os.sep))
+        relax.sort(key=lambda w: -w[0].count(os.sep))
+        return tighten + weights + relax
+
+    def apply(self, writes):
+        t0 = time.perf_counter_ns()
+        failed = []
+        done = 0
+        for path, name, value in writes:
+            try:
+                self.writer.write(path, name, value)
+            except OSError as e:
+                failed.append((path, name, e))
+                self.state.pop((path, name), None)
+                continue
+            self.state[(path, name)] = value
+            done += 1
+        self._grouped = self._next_grouped
+        self._scales = self._next_scales
+        return PlanResult(done, time.perf_counter_ns() - t0, failed)
+
+    def tick(self, budgets, strict=(), shared=()):
+        # wall_ns covers planning as well as the writes.
+        t0 = time.perf_counter_ns()
+        result = self.apply(self.plan(budgets, strict, shared))
+        return result._replace(wall_ns=time.perf_counter_ns() - t0)
+
+    def close(self):
+        self.writer.close()
+
+
+def apply_flat(writer, budgets, period=CPU_PERIOD):
+    # The per-container approach: one cpu.max per cgroup.
+    t0 = time.perf_counter_ns()
+    writes = 0
+    for path, cores in budgets.items():
+        if writer.write(path, "cpu.max", cpu_budget_bytes(cores, period)):
+            writes += 1
+    return PlanResult(writes, time.perf_counter_ns() - t0, [])
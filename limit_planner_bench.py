@@ -0,0 +1,80 @@
+import sys, random
+from cgroup_writer import CgroupWriter
+from cgroupfs import CgroupFS, FakeCgroupFS
+from limit_planner import LimitPlanner, apply_flat
+from bulk_update_latency import setup_cgroups, teardown_cgroups
+
+PARENT_NAME = "planner-bench.slice"
+CGROUP_COUNTS = (10, 100, 500)
+TICKS = 200
+BASE_CORES = 0.5
+
+
+def scenarios(paths, rng):
+    # Each yields one {path: cores} budget per tick.
+    def scale():
+        for i in range(TICKS):
+            factor = 1.1 if i % 2 else 0.9
+            yield {p: BASE_CORES * factor * (1 + j % 4) for j, p in enumerate(paths)}
+
+    def one():
+        budgets = {p: BASE_CORES * (1 + j % 4) for j, p in enumerate(paths)}
+        for _ in range(TICKS):
+            budgets = dict(budgets)
+            budgets[rng.choice(paths)] = BASE_CORES * rng.uniform(0.5, 4)
+            yield budgets
+
+    def every():
+        for _ in range(TICKS):
+            yield {p: BASE_CORES * rng.uniform(0.5, 4) for p in paths}
+
+    return {"scale all": scale, "change one": one, "change all": every}
+
+
+def run(tick, budgets_iter):
+    walls, writes = [], 0
+    for budgets in budgets_iter:
+        result = tick(budgets)
+        if result.failed:
+            raise RuntimeError(f"Write failed: {result.failed[0]}")
+        walls.append(result.wall_ns)
+        writes += result.writes
+    walls.sort()
+    avg = sum(walls) / len(walls)
+    p99 = walls[min(len(walls) - 1, int(len(walls) * 0.99))]
+    return writes / len(walls), avg, p99
+
+
+def main():
+    # --fake: rootless run on a FakeCgroupFS tree (userspace cost only).
+    fs = FakeCgroupFS() if "--fake" in sys.argv else CgroupFS()
+    print(f"{'cgroups':>8} {'scenario':<12} {'approach':<8} {'writes/tick':>12} {'avg tick':>12} {'p99 tick':>12}")
+    for count in CGROUP_COUNTS:
+        parent = fs.path(PARENT_NAME)
+        paths = setup_cgroups(fs, parent, count)
+        try:
+            for name, scenario in scenarios(paths, random.Random(count)).items():
+                # Same budget sequence for both approaches; both start from a
+                # tree where every limit is already applied once.
+                sequence = list(scenario())
+                with CgroupWriter(files=("cpu.max",), shadow=True, fs=fs) as writer:
+                    apply_flat(writer, sequence[-1])
+                    flat = run(lambda b: apply_flat(writer, b), sequence)
+                with LimitPlanner(fs=fs) as planner:
+                    # The bench slice opts in to group enforcement.
+                    shared = {parent}
+                    planner.tick(sequence[-1], shared=shared)
+                    planned = run(lambda b: planner.tick(b, shared=shared), sequence)
+                    # Leave the tree flat for the next scenario.
+                    planner.tick({p: None for p in paths})
+                for approach, (per_tick, avg, p99) in (("flat", flat), ("planner", planned)):
+                    print(f"{count:>8} {name:<12} {approach:<8} {per_tick:>12.1f} "
+                          f"{avg / 1e3:>9.1f} us {p99 / 1e3:>9.1f} us")
+        finally:
+            teardown_cgroups(fs, parent, paths)
+    if fs.fake:
+        fs.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import ctypes as ct
+from collections import namedtuple
+
+LockStat = namedtuple("LockStat", ["lock", "name", "kind", "count", "wait_ns", "max_ns"])
+
+# contention_begin flags (include/trace/events/lock.h).
+LCB_F_SPIN = 1 << 0
+LCB_F_READ = 1 << 1
+LCB_F_WRITE = 1 << 2
+LCB_F_RT = 1 << 3
+LCB_F_PERCPU = 1 << 4
+LCB_F_MUTEX = 1 << 5
+
+bpf_code = """
+struct lock_key {
+    u64 lock;
+    u32 flags;
+};
+
+struct lock_val {
+    u64 count;
+    u64 wait_ns;
+    u64 max_ns;
+};
+
+struct wait_start {
+    u64 ts;
+    u64 lock;
+    u32 flags;
+};
+
+BPF_HASH(tgids, u32, u8);
+BPF_HASH(waiting, u32, struct wait_start);
+BPF_HASH(locks, struct lock_key, struct lock_val, 4096);
+
+// Only tasks of the registered processes (the benchmark writers) are timed.
+TRACEPOINT_PROBE(lock, contention_begin) {
+    u64 pid_tgid = bpf_get_current_pid_tgid();
+    u32 tgid = pid_tgid >> 32;
+    if (!tgids.lookup(&tgid))
+        return 0;
+    u32 tid = pid_tgid;
+    struct wait_start ws = {};
+    ws.ts = bpf_ktime_get_ns();
+    ws.lock = (u64)args->lock_addr;
+    ws.flags = args->flags;
+    waiting.update(&tid, &ws);
+    return 0;
+}
+
+TRACEPOINT_PROBE(lock, contention_end) {
+    u32 tid = bpf_get_current_pid_tgid();
+    struct wait_start *ws = waiting.lookup(&tid);
+    if (!ws)
+        return 0;
+    u64 delta = bpf_ktime_get_ns() - ws->ts;
+    struct lock_key key = {};
+    key.lock = ws->lock;
+    key.flags = ws->flags;
+    waiting.delete(&tid);
+    struct lock_val zero = {};
+    struct lock_val *val = locks.lookup_or_try_init(&key, &zero);
+    if (!val)
+        return 0;
+    __sync_fetch_and_add(&val->count, 1);
+    __sync_fetch_and_add(&val->wait_ns, delta);
+    if (delta > val->max_ns)
+        val->max_ns = delta;
+    return 0;
+}
+"""
+
+
+def lock_kind(flags):
+    if flags & LCB_F_MUTEX:
+        return "mutex"
+    if flags & LCB_F_PERCPU:
+        return "percpu-rwsem"
+    if flags & (LCB_F_READ | LCB_F_WRITE):
+        return "rwsem" if not flags & LCB_F_SPIN else "rwlock"
+    if flags & LCB_F_RT:
+        return "rtmutex"
+    return "spinlock" if flags & LCB_F_SPIN else "other"
+
+
+class ContentionTracer:
+    # Lock wait time of selected processes from the lock:contention_begin/end
+    # tracepoints (5.19+), aggregated per lock address in the kernel. Static
+    # locks such as cgroup_mutex resolve to their symbol name; locks inside
+    # objects (kernfs_open_file, per-inode rwsems) show as addresses.
+
+    def __init__(self, tgids=()):
+        from bcc import BPF
+
+        self.bpf = BPF(text=bpf_code)
+        for tgid in tgids:
+            self.add(tgid)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, tgid):
+        self.bpf["tgids"][ct.c_uint(tgid)] = ct.c_ubyte(1)
+
+    def clear(self):
+        self.bpf["locks"].clear()
+        self.bpf["tgids"].clear()
+
+    def stats(self):
+        # LockStat per (lock, flags), most total wait first.
+        rows = []
+        for k, v in self.bpf["locks"].items():
+            name = self.bpf.ksym(k.lock, show_offset=False).decode(errors="replace")
+            if name == "[unknown]":
+                name = f"{k.lock:#x}"
+            rows.append(LockStat(k.lock, name, lock_kind(k.flags), v.count, v.wait_ns, v.max_ns))
+        rows.sort(key=lambda r: r.wait_ns, reverse=True)
+        return rows
+
+    def close(self):
+        self.bpf.cleanup()
@@ -0,0 +1,147 @@
+import os, time, errno
+from collections import namedtuple
+from cgroup_writer import CgroupWriter, memory_max_bytes
+
+MEMORY_KNOBS = ("memory.high", "memory.max", "memory.swap.max")
+RECLAIM_TIMEOUT = 1.0
+RECLAIM_POLL = 0.002
+# Errors that abort a transaction and roll it back; anything else propagates.
+_ROLLBACK_ERRNOS = (errno.EBUSY, errno.EINVAL, errno.EINTR, errno.EAGAIN)
+
+# None means "max". A field left at KEEP is not touched by the transaction.
+KEEP = object()
+MemoryLimits = namedtuple("MemoryLimits", ["high", "max", "swap_max"])
+MemoryLimits.__new__.__defaults__ = (KEEP, KEEP, KEEP)
+
+# A step is (file, value) or ("wait", bytes): wait until memory.current has
+# been reclaimed down to bytes.
+TxnResult = namedtuple("TxnResult", ["ok", "latency_ns", "writes", "rolled_back", "error"])
+
+
+class MemoryTxnError(RuntimeError):
+    pass
+
+
+def read_memory_limits(cgroup_path):
+    values = []
+    for name in MEMORY_KNOBS:
+        try:
+            with open(os.path.join(cgroup_path, name)) as f:
+                value = f.read().strip()
+        except FileNotFoundError:
+            values.append(KEEP)
+            continue
+        values.append(None if value == "max" else int(value))
+    return MemoryLimits(*values)
+
+
+def from_docker(memory, memory_swap=None, reservation=None):
+    # docker's --memory-swap is memory plus swap; -1 is unlimited swap.
+    swap = KEEP
+    if memory_swap is not None:
+        swap = None if memory_swap < 0 else max(0, memory_swap - memory)
+    high = KEEP if reservation is None else reservation
+    return MemoryLimits(high=high, max=memory, swap_max=swap)
+
+
+def plan_memory_update(old, new, soft_step=True):
+    # Orders the writes so that no intermediate state is tighter than both
+    # the old and the new limits, except for the deliberate soft step:
+    #   growth: memory.max up first, then swap, then memory.high
+    #   shrink: swap up (room for reclaimed anon), memory.high down to the
+    #           new max so the kernel reclaims and throttles instead of
+    #           OOM-killing, wait for memory.current to fit, then memory.max,
+    #           swap down, and memory.high to its final value
+    steps = []
+    target = {name: getattr(new, field) for name, field in zip(MEMORY_KNOBS, MemoryLimits._fields)}
+    current = {name: getattr(old, field) for name, field in zip(MEMORY_KNOBS, MemoryLimits._fields)}
+    for name in MEMORY_KNOBS:
+        if target[name] is KEEP or current[name] is KEEP or target[name] == current[name]:
+            target.pop(name)
+
+    def grows(name):
+        return name in target and (target[name] is None or
+                                   (current[name] is not None and target[name] > current[name]))
+
+    new_max = target.get("memory.max", KEEP)
+    shrinking = "memory.max" in target and not grows("memory.max")
+    if not shrinking:
+        if "memory.max" in target:
+            steps.append(("memory.max", new_max))
+        if "memory.swap.max" in target:
+            steps.append(("memory.swap.max", target["memory.swap.max"]))
+        if "memory.high" in target:
+            steps.append(("memory.high", target["memory.high"]))
+        return steps
+
+    if grows("memory.swap.max"):
+        steps.append(("memory.swap.max", target["memory.swap.max"]))
+    old_high = current["memory.high"]
+    soft = soft_step and old_high is not KEEP and (old_high is None or old_high > new_max)
+    if soft:
+        steps.append(("memory.high", new_max))
+        steps.append(("wait", new_max))
+    steps.append(("memory.max", new_max))
+    if "memory.swap.max" in target and not grows("memory.swap.max"):
+        steps.append(("memory.swap.max", target["memory.swap.max"]))
+    # memory.high ends at its new value, or back where it was after a soft step.
+    final_high = target.get("memory.high", old_high if soft else KEEP)
+    if final_high is not KEEP and final_high != (new_max if soft else old_high):
+        steps.append(("memory.high", final_high))
+    return steps
+
+
+def _encode(value):
+    return memory_max_bytes(value)
+
+
+def _wait_reclaim(cgroup_path, limit, timeout):
+    fd = os.open(os.path.join(cgroup_path, "memory.current"), os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        deadline = time.monotonic() + timeout
+        while int(os.pread(fd, 64, 0)) > limit:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(RECLAIM_POLL)
+        return True
+    finally:
+        os.close(fd)
+
+
+def apply_memory_update(cgroup_path, new, writer=None, old=None, soft_step=True,
+                        reclaim_timeout=RECLAIM_TIMEOUT):
+    # Applies new as one transaction. On EBUSY/EINVAL/EINTR, or when the
+    # soft step cannot reclaim below the new memory.max in time, every file
+    # already written is restored in reverse order. latency_ns covers the
+    # whole transaction, from the first write to the last (or the rollback).
+    own_writer = writer is None
+    writer = writer or CgroupWriter(files=())
+    old = old or read_memory_limits(cgroup_path)
+    current = dict(zip(MEMORY_KNOBS, old))
+    done = []
+    error = None
+    t0 = time.monotonic_ns()
+    try:
+        for name, value in plan_memory_update(old, new, soft_step):
+            if name == "wait":
+                if not _wait_reclaim(cgroup_path, value, reclaim_timeout):
+                    error = MemoryTxnError(f"memory.current still above {value} after {reclaim_timeout:g} s")
+                    break
+                continue
+            try:
+                writer.write(cgroup_path, name, _encode(value))
+            except OSError as e:
+                if e.errno not in _ROLLBACK_ERRNOS:
+                    raise
+                error = e
+                break
+            done.append((name, current[name]))
+            current[name] = value
+        if error is None:
+            return TxnResult(True, time.monotonic_ns() - t0, len(done), False, None)
+        for name, value in reversed(done):
+            writer.write(cgroup_path, name, _encode(value))
+        return TxnResult(False, time.monotonic_ns() - t0, len(done), True, error)
+    finally:
+        if own_writer:
+            writer.close()
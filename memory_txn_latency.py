@@ -0,0 +1,78 @@
+import os, time, signal
+from multiprocessing import Process
+from cgroup_writer import CgroupWriter, memory_max_bytes
+from cgroupfs import CGROUP_ROOT
+from memory_txn import MemoryLimits, apply_memory_update, read_memory_limits
+
+CGROUP_NAME = "memory-txn-bench"
+ITERATIONS = 200
+RESIDENT_MB = 48
+MIB = 1024 * 1024
+
+GROW = MemoryLimits(max=256 * MIB, swap_max=256 * MIB)
+SHRINK = MemoryLimits(max=96 * MIB, swap_max=0)
+
+
+def resident(cgroup_path):
+    # Keeps RESIDENT_MB of anonymous memory charged to the cgroup.
+    with open(os.path.join(cgroup_path, "cgroup.procs"), "w") as f:
+        f.write(str(os.getpid()))
+    # Filled, not zeroed: calloc'd zero pages would not be charged yet.
+    chunks = [bytearray(b"\x01") * MIB for _ in range(RESIDENT_MB)]
+    signal.pause()
+    del chunks
+
+
+def summarize(label, samples_ns):
+    samples_ns = sorted(samples_ns)
+    if not samples_ns:
+        print(f"{label:<28} no samples")
+        return
+    p50 = samples_ns[len(samples_ns) // 2]
+    p99 = samples_ns[min(len(samples_ns) - 1, int(len(samples_ns) * 0.99))]
+    print(f"{label:<28} p50 {p50 / 1e3:9.1f} us  p99 {p99 / 1e3:9.1f} us  max {samples_ns[-1] / 1e3:9.1f} us")
+
+
+def main():
+    with open(os.path.join(CGROUP_ROOT, "cgroup.subtree_control"), "w") as f:
+        f.write("+memory")
+    path = os.path.join(CGROUP_ROOT, CGROUP_NAME)
+    os.makedirs(path, exist_ok=True)
+    proc = Process(target=resident, args=(path,), daemon=True)
+    proc.start()
+    try:
+        time.sleep(0.5)
+        results = {"grow": [], "shrink": []}
+        rollbacks = 0
+        with CgroupWriter(files=()) as writer:
+            for i in range(ITERATIONS):
+                direction = "grow" if i % 2 == 0 else "shrink"
+                result = apply_memory_update(path, GROW if direction == "grow" else SHRINK, writer)
+                if result.ok:
+                    results[direction].append(result.latency_ns)
+                elif result.rolled_back:
+                    rollbacks += 1
+
+            # Unordered baseline: memory.max alone, as a single docker-style write.
+            single = {"grow": [], "shrink": []}
+            for i in range(ITERATIONS):
+                direction = "grow" if i % 2 == 0 else "shrink"
+                t0 = time.monotonic_ns()
+                writer.write(path, "memory.max", memory_max_bytes((GROW if direction == "grow" else SHRINK).max))
+                single[direction].append(time.monotonic_ns() - t0)
+
+        print(f"{ITERATIONS} updates, {RESIDENT_MB} MiB resident, final limits {read_memory_limits(path)}\n")
+        summarize("transaction grow", results["grow"])
+        summarize("transaction shrink", results["shrink"])
+        summarize("memory.max only grow", single["grow"])
+        summarize("memory.max only shrink", single["shrink"])
+        print(f"\nrolled back: {rollbacks}")
+    finally:
+        proc.kill()
+        proc.join()
+        time.sleep(0.1)
+        os.rmdir(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import sys, time, argparse, http.client
+from cgroup_writer import CgroupWriter
+from cgroupfs import FakeCgroupFS
+from latency_hist import KNOBS, PATHS, PERCENTILES, slot_of
+from process_monitoring_framework import ObservePolicy
+from process_monitoring_framework.controller import Controller
+from process_monitoring_framework.exporter import MetricsExporter, controller_source, latency_source
+from process_monitoring_framework.vector_sampler import VectorSampler
+
+CGROUP_COUNTS = (1000, 10000)
+SCRAPES = 200
+
+
+class SyntheticHists:
+    # WriteTracer's histogram interface with fixed contents, so the
+    # benchmark runs without BPF: one populated histogram per knob and path.
+
+    def __init__(self):
+        self.hists = {}
+        for knob in KNOBS:
+            for path in PATHS:
+                counts = {}
+                for ns in range(2000, 20_000_000, 997):
+                    slot = slot_of(ns)
+                    counts[slot] = counts.get(slot, 0) + 1
+                self.hists[(knob, path)] = counts
+        self.maxes = {key: 20_000_000 for key in self.hists}
+
+    def latency_histograms(self):
+        return {key: dict(counts) for key, counts in self.hists.items()}
+
+    def latency_max(self):
+        return dict(self.maxes)
+
+    def watch_cgroup(self, cgroup_path):
+        pass
+
+    def unwatch_cgroup(self, cgroup_path):
+        pass
+
+
+def setup(count):
+    fs = FakeCgroupFS()
+    controller = Controller(ObservePolicy(), writer=CgroupWriter(fs=fs), sampler=VectorSampler(files=()), dry_run=True)
+    for i in range(count):
+        path = fs.path(f"bench-{i}")
+        fs.mkdir(path)
+        fs.write_file(path, "memory.max", (256 + i % 64) * 1024 * 1024)
+        fs.write_file(path, "cpu.max", f"{10000 + i % 100 * 1000} 100000")
+        controller.add(path)
+    return fs, controller
+
+
+def scrape(port, count, gzipped):
+    # Returns sorted per-scrape latencies in ns (request sent to body read)
+    # over one keep-alive connection, and the body size.
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    headers = {"Accept-Encoding": "gzip"} if gzipped else {}
+    times = []
+    size = 0
+    try:
+        for _ in range(count):
+            t0 = time.perf_counter_ns()
+            conn.request("GET", "/metrics", headers=headers)
+            resp = conn.getresponse()
+            size = len(resp.read())
+            times.append(time.perf_counter_ns() - t0)
+            if resp.status != 200:
+                raise RuntimeError(f"Scrape failed: HTTP {resp.status}")
+    finally:
+        conn.close()
+    return sorted(times), size
+
+
+def pct(sorted_ns, q):
+    return sorted_ns[min(len(sorted_ns) - 1, int(len(sorted_ns) * q / 100))] / 1e6
+
+
+def bench(controller, count, scrapes):
+    sources = [controller_source(controller), latency_source(SyntheticHists(), controller)]
+    for mode, interval in (("snapshot", 3600.0), ("per-scrape", 0)):
+        with MetricsExporter(sources, port=0, interval=interval).start() as exporter:
+            if interval:
+                exporter.rebuild()
+            for gzipped in (False, True):
+                times, size = scrape(exporter.port, scrapes, gzipped)
+                p = [pct(times, q) for q in PERCENTILES[:3]]
+                print(f"{count:>8} {mode:<11} {'gzip' if gzipped else 'plain':<6} {size / 1024:>9.0f} "
+                      + " ".join(f"{v:>9.3f}" for v in p) + f" {exporter.rebuild_ns / 1e6:>11.1f}")
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Scrape latency of the metrics exporter by number of cgroups")
+    p.add_argument("--count", type=int, action="append", help="managed cgroups, repeatable (default: 1000, 10000)")
+    p.add_argument("--scrapes", type=int, default=SCRAPES, help="scrapes per mode")
+    args = p.parse_args(argv)
+    args.count = args.count or list(CGROUP_COUNTS)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print(f"{'cgroups':>8} {'mode':<11} {'body':<6} {'KiB':>9} "
+          + " ".join(f"{f'p{q:g} ms':>9}" for q in PERCENTILES[:3]) + f" {'render ms':>11}")
+    for count in args.count:
+        fs, controller = setup(count)
+        try:
+            bench(controller, count, args.scrapes)
+        finally:
+            controller.close()
+            fs.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
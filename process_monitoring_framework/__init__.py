@@ -0,0 +1,2 @@
+from .sampler import Sample, SAMPLE_FILES, parse_psi_totals
+from .policy import Limits, Policy, ObservePolicy, HeadroomPolicy, POLICIES, read_limits, load_policy
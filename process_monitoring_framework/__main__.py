@@ -0,0 +1,4 @@
+import sys
+from .controller import main
+
+sys.exit(main())
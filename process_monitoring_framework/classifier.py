@@ -0,0 +1,495 @@
+import os, sys, json, time, errno, argparse, threading
+import ctypes as ct
+from collections import namedtuple, deque
+from cgroup_writer import CgroupWriter, CgroupRemovedError, cpu_max_bytes
+from cgroupfs import CgroupFS
+
+# Rules match on these, in the order they are tried for indexing. comm and
+# parent are the kernel's 15-character task names, exe the exec'd path,
+# cgroup the process's cgroup directory at exec time.
+RULE_FIELDS = ("comm", "exe", "parent", "cgroup")
+TASK_COMM_LEN = 16
+CLASS_SLICE = "prio.slice"
+
+SCHED_POLICIES = {
+    "other": os.SCHED_OTHER,
+    "batch": os.SCHED_BATCH,
+    "idle": os.SCHED_IDLE,
+    "fifo": os.SCHED_FIFO,
+    "rr": os.SCHED_RR,
+}
+
+# cpu_max in cores; memory in bytes; None leaves the setting alone. A class
+# with any cgroup setting gets its own cgroup, <root>/prio.slice/<name>, and
+# its processes are moved there; a class with only nice/sched_* does not
+# move processes, so they keep their container's limits.
+PriorityClass = namedtuple("PriorityClass", ["name", "cpu_weight", "cpu_max", "memory_low", "memory_high",
+                                             "nice", "sched_policy", "sched_priority"],
+                           defaults=(None,) * 7)
+# Patterns: "name" matches exactly, "prefix*" matches by prefix. Every
+# given field must match; the first matching rule (file order) wins.
+Rule = namedtuple("Rule", ["index", "cls", "comm", "exe", "parent", "cgroup"], defaults=(None,) * 4)
+CLASS_CGROUP_FIELDS = ("cpu_weight", "cpu_max", "memory_low", "memory_high")
+# A process exec: its new comm, the exec'd file, its cgroup (id) and parent.
+ExecEvent = namedtuple("ExecEvent", ["ts", "pid", "ppid", "cgroup_id", "comm", "exe", "parent_comm"])
+
+
+def load_rules(path):
+    # {"classes": {name: {setting: value}}, "rules": [{"class": name, field: pattern}]}
+    with open(path) as f:
+        config = json.load(f)
+    classes = {}
+    for name, settings in config.get("classes", {}).items():
+        unknown = set(settings) - set(PriorityClass._fields[1:])
+        if unknown:
+            raise ValueError(f"Class {name}: unknown settings {sorted(unknown)}")
+        if settings.get("sched_policy") not in (None, *SCHED_POLICIES):
+            raise ValueError(f"Class {name}: sched_policy must be one of {sorted(SCHED_POLICIES)}")
+        if settings.get("sched_policy") in ("fifo", "rr") and (settings.get("sched_priority") or 0) < 1:
+            # sched_setscheduler() rejects a real-time policy at priority 0.
+            raise ValueError(f"Class {name}: sched_policy {settings['sched_policy']} needs a sched_priority >= 1")
+        classes[name] = PriorityClass(name, **settings)
+    rules = []
+    for i, spec in enumerate(config.get("rules", [])):
+        spec = dict(spec)
+        cls = spec.pop("class", None)
+        if cls not in classes:
+            raise ValueError(f"Rule {i}: unknown class {cls!r}")
+        unknown = set(spec) - set(RULE_FIELDS)
+        if unknown:
+            raise ValueError(f"Rule {i}: unknown fields {sorted(unknown)}")
+        rules.append(Rule(i, cls, **spec))
+    return classes, rules
+
+
+def _pattern(field, pattern):
+    # (value, is_prefix); comm patterns are cut to what the kernel keeps.
+    prefix = pattern.endswith("*")
+    value = pattern[:-1] if prefix else pattern
+    if "*" in value:
+        raise ValueError(f"Only a trailing * is supported: {pattern!r}")
+    if field in ("comm", "parent"):
+        value = value[:TASK_COMM_LEN - 1]
+    return value, prefix
+
+
+def _rule_matches(checks, values):
+    for field, value, prefix in checks:
+        v = values[field]
+        if v is None or (not v.startswith(value) if prefix else v != value):
+            return False
+    return True
+
+
+class PrefixTrie:
+    # Character trie of prefixes; match() returns the values stored under
+    # every prefix of the string, walking it once.
+
+    _END = None
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, prefix, value):
+        node = self.root
+        for ch in prefix:
+            node = node.setdefault(ch, {})
+        node.setdefault(self._END, []).append(value)
+
+    def match(self, s):
+        node = self.root
+        out = list(node.get(self._END, ()))
+        for ch in s:
+            node = node.get(ch)
+            if node is None:
+                break
+            hits = node.get(self._END)
+            if hits:
+                out.extend(hits)
+        return out
+
+
+class RuleMatcher:
+    # Rules compiled into one index per field: a hash of exact patterns and
+    # a prefix trie. Each rule is indexed under its most selective pattern
+    # (an exact one if it has any, else its longest prefix), so a lookup
+    # costs one hash probe and one trie walk per field no matter how many
+    # rules there are; only the candidates found are checked against their
+    # remaining fields. Rules with no pattern at all match everything.
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._checks = []
+        self._exact = {field: {} for field in RULE_FIELDS}
+        self._tries = {field: PrefixTrie() for field in RULE_FIELDS}
+        self._used = set()
+        self._always = []
+        for rule in self.rules:
+            checks = tuple((field, *_pattern(field, getattr(rule, field)))
+                           for field in RULE_FIELDS if getattr(rule, field) is not None)
+            i = len(self._checks)
+            self._checks.append(checks)
+            if not checks:
+                self._always.append(i)
+                continue
+            field, value, prefix = min(checks, key=lambda c: (c[2], -len(c[1])))
+            self._used.add(field)
+            if prefix:
+                self._tries[field].add(value, i)
+            else:
+                self._exact[field].setdefault(value, []).append(i)
+        self._fields = [f for f in RULE_FIELDS if f in self._used]
+        self.needs_cgroup = any(field == "cgroup" for checks in self._checks for field, _, _ in checks)
+
+    def match(self, values):
+        # values: {field: str or None}. Returns the first matching Rule.
+        candidates = list(self._always)
+        for field in self._fields:
+            v = values[field]
+            if v is None:
+                continue
+            candidates += self._exact[field].get(v, ())
+            candidates += self._tries[field].match(v)
+        if not candidates:
+            return None
+        if len(candidates) > 1:
+            candidates.sort()
+        for i in candidates:
+            if _rule_matches(self._checks[i], values):
+                return self.rules[i]
+        return None
+
+
+def match_linear(rules, values):
+    # Reference matcher: every rule in order, the way a naive loop would.
+    for rule in rules:
+        checks = [(field, *_pattern(field, getattr(rule, field)))
+                  for field in RULE_FIELDS if getattr(rule, field) is not None]
+        if _rule_matches(checks, values):
+            return rule
+    return None
+
+
+bpf_code = """
+#include <linux/sched.h>
+
+struct exec_event {
+    u64 ts;
+    u64 cgroup_id;
+    u32 pid;
+    u32 ppid;
+    char comm[TASK_COMM_LEN];
+    char parent_comm[TASK_COMM_LEN];
+    char exe[256];
+};
+
+BPF_RINGBUF_OUTPUT(events, 256);
+BPF_ARRAY(dropped, u64, 1);
+
+// After exec: the current task has its new comm; filename is the path the
+// binary was exec'd by. No filtering here, userspace classifies.
+TRACEPOINT_PROBE(sched, sched_process_exec) {
+    struct exec_event *ev = events.ringbuf_reserve(sizeof(struct exec_event));
+    if (!ev) {
+        int key = 0;
+        u64 *d = dropped.lookup(&key);
+        if (d)
+            __sync_fetch_and_add(d, 1);
+        return 0;
+    }
+    struct task_struct *task = (struct task_struct *)bpf_get_current_task();
+    struct task_struct *parent = task->real_parent;
+    ev->ts = bpf_ktime_get_ns();
+    ev->cgroup_id = bpf_get_current_cgroup_id();
+    ev->pid = bpf_get_current_pid_tgid() >> 32;
+    ev->ppid = parent->tgid;
+    bpf_get_current_comm(&ev->comm, sizeof(ev->comm));
+    bpf_probe_read_kernel_str(&ev->parent_comm, sizeof(ev->parent_comm), parent->comm);
+    TP_DATA_LOC_READ_STR(ev->exe, filename, sizeof(ev->exe));
+    events.ringbuf_submit(ev, 0);
+    return 0;
+}
+"""
+
+
+class ExecTracer:
+    # Every exec on the host as an ExecEvent, from the sched_process_exec
+    # tracepoint through a BPF ring buffer.
+
+    def __init__(self):
+        from bcc import BPF
+
+        self.bpf = BPF(text=bpf_code)
+        self._pending = deque()
+        self.bpf["events"].open_ring_buffer(self._on_event)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _on_event(self, ctx, data, size):
+        ev = self.bpf["events"].event(data)
+        self._pending.append(ExecEvent(ev.ts, ev.pid, ev.ppid, ev.cgroup_id, ev.comm.decode(errors="replace"),
+                                       ev.exe.decode(errors="replace"), ev.parent_comm.decode(errors="replace")))
+
+    def poll(self, timeout_ms=-1):
+        self.bpf.ring_buffer_poll(timeout_ms)
+
+    def drain(self):
+        self.bpf.ring_buffer_consume()
+        events = list(self._pending)
+        self._pending.clear()
+        return events
+
+    def dropped(self):
+        return self.bpf["dropped"][ct.c_int(0)].value
+
+    def close(self):
+        self.bpf.cleanup()
+
+
+class FakeExecTracer:
+    # ExecTracer's poll/drain interface; events are pushed with push()
+    # (benchmarks, rootless runs) instead of coming from BPF.
+
+    def __init__(self):
+        self._pending = deque()
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def push(self, ev):
+        with self._cond:
+            self._pending.append(ev)
+            self._cond.notify_all()
+
+    def poll(self, timeout_ms=-1):
+        with self._cond:
+            if not self._pending:
+                self._cond.wait(None if timeout_ms < 0 else timeout_ms / 1e3)
+
+    def drain(self):
+        with self._cond:
+            events = list(self._pending)
+            self._pending.clear()
+        return events
+
+    def dropped(self):
+        return 0
+
+    def close(self):
+        pass
+
+
+def scan_processes(root="/proc"):
+    # One pass over /proc at startup, for processes that exec'd before the
+    # tracer was attached. Yields ExecEvents with cgroup_id 0 (resolved by pid).
+    comms = {}
+
+    def comm_of(pid):
+        if pid not in comms:
+            try:
+                with open(f"{root}/{pid}/comm") as f:
+                    comms[pid] = f.read().rstrip("\n")
+            except OSError:
+                comms[pid] = None
+        return comms[pid]
+
+    ts = time.monotonic_ns()
+    for entry in os.listdir(root):
+        if not entry.isdigit():
+            continue
+        pid = int(entry)
+        try:
+            with open(f"{root}/{pid}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            exe = os.readlink(f"{root}/{pid}/exe")
+        except OSError:
+            # Gone, or a kernel thread (no exe).
+            continue
+        comm = comm_of(pid)
+        if comm is not None:
+            yield ExecEvent(ts, pid, ppid, 0, comm, exe, comm_of(ppid))
+
+
+class ClassApplier:
+    # Puts a classified process into its class: moves it into the class
+    # cgroup (created with the class settings by setup()) if the class has
+    # one, then sets nice and the scheduling policy. Processes that exited
+    # in the meantime are counted in gone, not raised.
+
+    def __init__(self, classes, fs=None, writer=None, dry_run=False):
+        self.classes = dict(classes)
+        self.fs = fs or CgroupFS()
+        self.writer = writer or CgroupWriter(files=("cgroup.procs",), fs=self.fs)
+        self.dry_run = dry_run
+        self.paths = {}
+        self.applied = 0
+        self.gone = 0
+        self.errors = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def setup(self):
+        parent = self.fs.path(CLASS_SLICE)
+        for cls in self.classes.values():
+            if all(getattr(cls, f) is None for f in CLASS_CGROUP_FIELDS):
+                continue
+            path = os.path.join(parent, cls.name)
+            self.paths[cls.name] = path
+            if self.dry_run:
+                continue
+            self.fs.mkdir(parent)
+            self.fs.enable_controllers(parent)
+            self.fs.mkdir(path)
+            if cls.cpu_weight is not None:
+                self.fs.write_file(path, "cpu.weight", cls.cpu_weight)
+            if cls.cpu_max is not None:
+                self.fs.write_file(path, "cpu.max", cpu_max_bytes(cls.cpu_max * 100000, 100000))
+            if cls.memory_low is not None:
+                self.fs.write_file(path, "memory.low", cls.memory_low)
+            if cls.memory_high is not None:
+                self.fs.write_file(path, "memory.high", cls.memory_high)
+            self.writer.open(path)
+        return self
+
+    def apply(self, pid, cls):
+        if self.dry_run:
+            self.applied += 1
+            return True
+        try:
+            path = self.paths.get(cls.name)
+            if path is not None:
+                self.writer.write(path, "cgroup.procs", str(pid).encode())
+            if cls.nice is not None:
+                os.setpriority(os.PRIO_PROCESS, pid, cls.nice)
+            if cls.sched_policy is not None:
+                os.sched_setscheduler(pid, SCHED_POLICIES[cls.sched_policy],
+                                      os.sched_param(cls.sched_priority or 0))
+        except (ProcessLookupError, CgroupRemovedError):
+            self.gone += 1
+            return False
+        except OSError as e:
+            # cgroup.procs reports a pid that already exited as ESRCH.
+            if e.errno == errno.ESRCH:
+                self.gone += 1
+            else:
+                self.errors += 1
+            return False
+        self.applied += 1
+        return True
+
+    def close(self):
+        self.writer.close()
+
+
+class PriorityEngine:
+    # Reads exec events from a tracer, classifies each with the RuleMatcher
+    # and applies the class. The cgroup path of an event's cgroup id is
+    # resolved through /proc/<pid>/cgroup once per cgroup and cached in
+    # cgroups (id -> path, may be seeded), and only when some rule matches
+    # on cgroup.
+
+    def __init__(self, matcher, applier, tracer, fs=None):
+        self.matcher = matcher
+        self.applier = applier
+        self.tracer = tracer
+        self.fs = fs or applier.fs
+        self.execs = 0
+        self.matched = {}
+        self.lag_ns = []
+        self.cgroups = {}
+
+    def cgroup_path(self, ev):
+        path = self.cgroups.get(ev.cgroup_id) if ev.cgroup_id else None
+        if path is None:
+            try:
+                path = self.fs.cgroup_path_of_pid(ev.pid)
+            except OSError:
+                return None
+            if path is not None and ev.cgroup_id:
+                self.cgroups[ev.cgroup_id] = path
+        return path
+
+    def classify(self, ev):
+        values = {"comm": ev.comm, "exe": ev.exe, "parent": ev.parent_comm,
+                  "cgroup": self.cgroup_path(ev) if self.matcher.needs_cgroup else None}
+        rule = self.matcher.match(values)
+        return None if rule is None else self.applier.classes[rule.cls]
+
+    def handle(self, events):
+        for ev in events:
+            self.execs += 1
+            cls = self.classify(ev)
+            if cls is not None:
+                self.matched[cls.name] = self.matched.get(cls.name, 0) + 1
+                self.applier.apply(ev.pid, cls)
+            self.lag_ns.append(time.monotonic_ns() - ev.ts)
+
+    def run_once(self, timeout_ms=-1):
+        self.tracer.poll(timeout_ms)
+        events = self.tracer.drain()
+        self.handle(events)
+        return events
+
+    def run(self, duration=None, report_interval=10.0, report=print):
+        deadline = None if duration is None else time.monotonic() + duration
+        next_report = time.monotonic() + report_interval
+        while deadline is None or time.monotonic() < deadline:
+            now = time.monotonic()
+            timeout = next_report - now if deadline is None else min(next_report, deadline) - now
+            self.run_once(max(0, int(timeout * 1e3)))
+            if time.monotonic() >= next_report:
+                report(self.summary())
+                self.lag_ns = []
+                next_report = time.monotonic() + report_interval
+        report(self.summary())
+
+    def summary(self):
+        lag = sorted(self.lag_ns) or [0]
+        classes = " ".join(f"{name}={n}" for name, n in sorted(self.matched.items()))
+        return (f"execs {self.execs} matched [{classes}] applied {self.applier.applied} gone {self.applier.gone} "
+                f"errors {self.applier.errors} dropped {self.tracer.dropped()}  "
+                f"exec->handled p50 {lag[len(lag) // 2] / 1e3:.0f} us p99 {lag[int(len(lag) * 0.99)] / 1e3:.0f} us")
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python3 -m process_monitoring_framework.classifier",
+                                description="Classify processes on exec and apply their priority class")
+    p.add_argument("rules", help="JSON file with classes and rules")
+    p.add_argument("--existing", action="store_true", help="also classify running processes once at start")
+    p.add_argument("--dry-run", action="store_true", help="classify and count, never change anything")
+    p.add_argument("--duration", type=float)
+    p.add_argument("--report-interval", type=float, default=10.0)
+    args = p.parse_args(argv)
+
+    classes, rules = load_rules(args.rules)
+    applier = ClassApplier(classes, dry_run=args.dry_run).setup()
+    tracer = None
+    try:
+        tracer = ExecTracer()
+        engine = PriorityEngine(RuleMatcher(rules), applier, tracer)
+        if args.existing:
+            engine.handle(list(scan_processes()))
+        engine.run(args.duration, args.report_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if tracer is not None:
+            tracer.close()
+        applier.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
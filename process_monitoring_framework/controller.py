@@ -0,0 +1,319 @@
+import os, sys, time, errno, select, argparse
+import numpy as np
+from cgroup_writer import CgroupWriter, CgroupRemovedError
+from cgroup_index import CgroupIndex
+from cgroupfs import FakeCgroupFS
+from .sampler import Sample
+from .vector_sampler import VectorSampler
+from .policy import CPU_PERIOD, UNLIMITED, Limits, limits_row, read_limits, load_policy, POLICIES
+
+DEFAULT_HZ = 20
+REPORT_INTERVAL = 10.0
+# VectorSampler metric behind each Sample field after ts.
+SAMPLE_METRICS = ("memory_current", "usage_usec", "nr_periods", "nr_throttled", "throttled_usec",
+                  "memory_some_usec", "memory_full_usec", "cpu_some_usec")
+
+
+def process_age_ms():
+    # Time since this process started: /proc/self/stat starttime against
+    # CLOCK_BOOTTIME (clock-tick resolution, usually 10 ms).
+    with open("/proc/self/stat") as f:
+        start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+    return (time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf("SC_CLK_TCK")) * 1e3
+
+
+class LoopStats:
+    # Per report interval; counters are also accumulated over the whole run
+    # in totals() for the metrics exporter, which needs monotonic counters.
+    COUNTERS = ("overruns", "writes", "write_errors", "removed")
+
+    def __init__(self):
+        self._totals = dict.fromkeys(self.COUNTERS + ("ticks",), 0)
+        self.reset()
+
+    def reset(self):
+        if hasattr(self, "loop_ns"):
+            for name in self.COUNTERS:
+                self._totals[name] += getattr(self, name)
+            self._totals["ticks"] += len(self.loop_ns)
+        self.jitter_ns = []
+        self.loop_ns = []
+        self.overruns = 0
+        self.writes = 0
+        self.write_errors = 0
+        self.removed = 0
+        self.wall0 = time.monotonic_ns()
+        self.cpu0 = time.process_time_ns()
+
+    def record(self, jitter_ns, loop_ns):
+        self.jitter_ns.append(jitter_ns)
+        self.loop_ns.append(loop_ns)
+
+    def totals(self):
+        totals = {name: self._totals[name] + getattr(self, name) for name in self.COUNTERS}
+        totals["ticks"] = self._totals["ticks"] + len(self.loop_ns)
+        return totals
+
+    def summary(self, ncgroups):
+        wall = time.monotonic_ns() - self.wall0
+        cpu = time.process_time_ns() - self.cpu0
+        jitter = sorted(self.jitter_ns) or [0]
+        loop = sorted(self.loop_ns) or [0]
+
+        def pct(s, q):
+            return s[min(len(s) - 1, int(len(s) * q))] / 1e3
+
+        return (f"{ncgroups} cgroups  {len(self.loop_ns)} ticks  "
+                f"jitter p50 {pct(jitter, 0.5):.0f} us p99 {pct(jitter, 0.99):.0f} us max {jitter[-1] / 1e3:.0f} us  "
+                f"loop p50 {pct(loop, 0.5):.0f} us p99 {pct(loop, 0.99):.0f} us  "
+                f"overruns {self.overruns}  cpu {cpu / wall * 100 if wall else 0:.2f}% of one core  "
+                f"writes {self.writes} errors {self.write_errors} removed {self.removed}")
+
+
+class Controller:
+    # Fixed-rate sample → decide → write loop over the managed cgroups. Ticks
+    # are scheduled on absolute deadlines, so a slow tick does not shift the
+    # following ones; jitter is the lateness of each wakeup.
+    #
+    # A tick is one VectorSampler.sample() over every cgroup and one
+    # policy.decide_all() on its arrays; only the rows whose limits changed
+    # are visited in Python. The limits in effect are mirrored in per-row
+    # arrays next to the sampler's.
+
+    def __init__(self, policy, hz=DEFAULT_HZ, writer=None, sampler=None, dry_run=False):
+        self.policy = policy
+        self.period_ns = int(1e9 / hz)
+        self.writer = writer or CgroupWriter()
+        self.sampler = sampler or VectorSampler(files=policy.files)
+        self.dry_run = dry_run
+        self.limits = {}
+        self._limit_arrays = Limits((), (), ())
+        self._grow(self.sampler.capacity)
+        self.stats = LoopStats()
+        self.index = None
+        self.startup_ms = None
+        self._pinned = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _grow(self, capacity):
+        # memory_max, cpu_quota, cpu_period per sampler row; unused rows are
+        # unlimited so the policy arithmetic stays finite.
+        arrays = Limits(np.full(capacity, UNLIMITED, dtype=np.int64), np.full(capacity, UNLIMITED, dtype=np.int64),
+                        np.full(capacity, CPU_PERIOD, dtype=np.int64))
+        for new, old in zip(arrays, self._limit_arrays):
+            new[:len(old)] = old
+        self._limit_arrays = arrays
+
+    def _set_limits(self, cgroup_path, limits):
+        self.limits[cgroup_path] = limits
+        slot = self.sampler.slots[cgroup_path]
+        for field, value in zip(self._limit_arrays, limits):
+            field[slot] = UNLIMITED if value is None else value
+
+    def add(self, cgroup_path, pinned=True):
+        if cgroup_path in self.limits:
+            return
+        self.sampler.add(cgroup_path)
+        if len(self._limit_arrays.cpu_period) < self.sampler.capacity:
+            self._grow(self.sampler.capacity)
+        if not self.dry_run:
+            self.writer.open(cgroup_path)
+        self._set_limits(cgroup_path, read_limits(cgroup_path))
+        if pinned:
+            self._pinned.add(cgroup_path)
+
+    def remove(self, cgroup_path):
+        slot = self.sampler.slots.get(cgroup_path)
+        if slot is not None:
+            for field, value in zip(self._limit_arrays, (UNLIMITED, UNLIMITED, CPU_PERIOD)):
+                field[slot] = value
+        self.sampler.remove(cgroup_path)
+        self.writer.forget(cgroup_path)
+        self.limits.pop(cgroup_path, None)
+        self._pinned.discard(cgroup_path)
+
+    def watch_index(self, index):
+        # Manage every container cgroup in the index; containers started or
+        # removed later are picked up from its inotify events.
+        self.index = index
+        self._sync_index()
+
+    def _sync_index(self):
+        current = set(self.index.by_id.values())
+        for path in [p for p in self.limits if p not in current and p not in self._pinned]:
+            self.remove(path)
+        for path in current - set(self.limits):
+            try:
+                self.add(path, pinned=False)
+            except (OSError, CgroupRemovedError):
+                pass
+
+    def apply(self, cgroup_path, old, new):
+        try:
+            if new.memory_max != old.memory_max:
+                self.writer.set_memory_max(cgroup_path, new.memory_max)
+                self.stats.writes += 1
+            if (new.cpu_quota, new.cpu_period) != (old.cpu_quota, old.cpu_period):
+                self.writer.set_cpu_max(cgroup_path, new.cpu_quota, new.cpu_period)
+                self.stats.writes += 1
+        except CgroupRemovedError:
+            self.remove(cgroup_path)
+            self.stats.removed += 1
+            return
+        except OSError as e:
+            # e.g. EBUSY when memory.max cannot be reclaimed down to; resync
+            # with whatever the kernel kept.
+            if e.errno not in (errno.EBUSY, errno.EINVAL):
+                raise
+            self.stats.write_errors += 1
+            self._set_limits(cgroup_path, read_limits(cgroup_path))
+            return
+        self._set_limits(cgroup_path, new)
+
+    def _samples(self, age):
+        sampler = self.sampler
+        zeros = np.zeros(sampler.capacity, dtype=np.int64)
+        return Sample(int(sampler.ts[(sampler.count - 1 - age) % sampler.history]),
+                      *(sampler.column(m, age) if m in sampler.index else zeros for m in SAMPLE_METRICS))
+
+    def tick(self, now):
+        sampler = self.sampler
+        sampler.sample(now)
+        for path in sampler.take_removed():
+            self.remove(path)
+            self.stats.removed += 1
+        if sampler.count < 2:
+            return
+        limits = self._limit_arrays
+        new = self.policy.decide_all(sampler.paths, self._samples(1), self._samples(0), limits)
+        if new is None or self.dry_run:
+            return
+        changed = (new.memory_max != limits.memory_max) | (new.cpu_quota != limits.cpu_quota)
+        changed |= new.cpu_period != limits.cpu_period
+        changed &= sampler.ready()
+        for slot in np.flatnonzero(changed):
+            path = sampler.paths[slot]
+            self.apply(path, self.limits[path], limits_row(new, slot))
+
+    def _wait(self, deadline_ns):
+        while True:
+            timeout = (deadline_ns - time.monotonic_ns()) / 1e9
+            if timeout <= 0:
+                return
+            if self.index is None or self.index.fileno() < 0:
+                time.sleep(timeout)
+                return
+            if select.select([self.index], [], [], timeout)[0] and self.index.process_events():
+                self._sync_index()
+
+    def run(self, duration=None, report_interval=REPORT_INTERVAL, report=print):
+        start = next_ns = time.monotonic_ns()
+        next_report = start + int(report_interval * 1e9)
+        self.stats.reset()
+        while duration is None or next_ns - start < duration * 1e9:
+            self._wait(next_ns)
+            now = time.monotonic_ns()
+            self.tick(now)
+            done = time.monotonic_ns()
+            if self.startup_ms is None:
+                self.startup_ms = process_age_ms()
+                report(f"startup {self.startup_ms:.0f} ms from process start to first tick ({len(self.limits)} cgroups)")
+            self.stats.record(now - next_ns, done - now)
+            next_ns += self.period_ns
+            if done > next_ns:
+                # Skip the ticks we overran instead of running them back to back.
+                missed = (done - next_ns) // self.period_ns + 1
+                self.stats.overruns += missed
+                next_ns += missed * self.period_ns
+            if done >= next_report:
+                report(self.stats.summary(len(self.limits)))
+                self.stats.reset()
+                next_report = done + int(report_interval * 1e9)
+        if self.stats.loop_ns:
+            report(self.stats.summary(len(self.limits)))
+
+    def close(self):
+        self.sampler.close()
+        self.writer.close()
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python3 -m process_monitoring_framework.controller",
+                                description="Closed-loop cgroup limit controller")
+    p.add_argument("targets", nargs="*", help="cgroup directories, container names or IDs")
+    p.add_argument("--containers", action="store_true", help="manage every container cgroup, following starts/stops")
+    p.add_argument("--hz", type=float, default=DEFAULT_HZ, help="sampling rate (10-100)")
+    p.add_argument("--policy", default="headroom", help=f"{'/'.join(POLICIES)} or module:Class")
+    p.add_argument("--duration", type=float, help="stop after this many seconds")
+    p.add_argument("--report-interval", type=float, default=REPORT_INTERVAL)
+    p.add_argument("--dry-run", action="store_true", help="sample and decide, never write")
+    p.add_argument("--fake", type=int, metavar="N", help="rootless run on N cgroups of a fake cgroupfs tree")
+    p.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this localhost port")
+    p.add_argument("--metrics-interval", type=float, help="seconds between metric snapshots (default 5)")
+    p.add_argument("--trace-writes", action="store_true",
+                   help="export BPF write-latency histograms of the controller's writes (needs bcc)")
+    args = p.parse_args(argv)
+    if args.trace_writes and args.metrics_port is None:
+        p.error("--trace-writes needs --metrics-port")
+
+    fs = None
+    if args.fake:
+        fs = FakeCgroupFS()
+        for i in range(args.fake):
+            path = fs.path(f"fake-{i}")
+            fs.mkdir(path)
+            fs.write_file(path, "memory.max", 256 * 1024 * 1024)
+            fs.write_file(path, "cpu.max", "50000 100000")
+            args.targets.append(path)
+    index = None
+    if args.containers or any(not os.path.isdir(t) for t in args.targets):
+        index = CgroupIndex(watch=args.containers)
+    controller = Controller(load_policy(args.policy), hz=args.hz, writer=CgroupWriter(fs=fs), dry_run=args.dry_run)
+    tracer = exporter = None
+    try:
+        for target in args.targets:
+            path = target if os.path.isdir(target) else index.lookup(target)
+            if path is None:
+                p.error(f"Cgroup path not found for {target}")
+            controller.add(path)
+        if args.containers:
+            controller.watch_index(index)
+        if not controller.limits and not args.containers:
+            p.error("nothing to manage")
+        if args.metrics_port is not None:
+            # http.server and friends only load when metrics are served; they
+            # would add about 35 ms to every startup.
+            from .exporter import DEFAULT_INTERVAL, MetricsExporter, controller_source, latency_source
+
+            sources = [controller_source(controller)]
+            if args.trace_writes:
+                from write_tracer import WriteTracer
+
+                tracer = WriteTracer(events=False)
+                tracer.add_raw_writer(os.getpid())
+                sources.append(latency_source(tracer, controller))
+            exporter = MetricsExporter(sources, port=args.metrics_port,
+                                       interval=args.metrics_interval or DEFAULT_INTERVAL).start()
+        controller.run(args.duration, args.report_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if exporter is not None:
+            exporter.close()
+        if tracer is not None:
+            tracer.close()
+        controller.close()
+        if index is not None:
+            index.close()
+        if fs is not None:
+            fs.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+import os, sys, time, errno, select, asyncio, argparse, resource
+from collections import namedtuple
+from cgroup_index import CgroupIndex
+
+EVENT_FILES = ("cgroup.events", "memory.events", "memory.swap.events")
+READ_SIZE = 512
+
+# cgroup.events: populated / frozen changed (state is the new value)
+StateEvent = namedtuple("StateEvent", ["ts", "cgroup_path", "key", "state"])
+# memory.events: low, high, max, oom, oom_kill, oom_group_kill
+MemoryEvent = namedtuple("MemoryEvent", ["ts", "cgroup_path", "key", "count", "delta"])
+# memory.swap.events: high, max, fail
+SwapEvent = namedtuple("SwapEvent", ["ts", "cgroup_path", "key", "count", "delta"])
+# The cgroup directory was removed; no further events follow for it.
+RemovedEvent = namedtuple("RemovedEvent", ["ts", "cgroup_path"])
+
+
+def parse_counters(data):
+    tokens = data.split()
+    return {tokens[i].decode(): int(tokens[i + 1]) for i in range(0, len(tokens) - 1, 2)}
+
+
+def raise_nofile_limit():
+    # Three fds per cgroup; lift the soft limit to the hard one so thousands
+    # of containers fit.
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+class CgroupEventMonitor:
+    # Watches cgroup.events / memory.events / memory.swap.events of many
+    # cgroups from one asyncio loop without polling. kernfs reports a change
+    # as EPOLLPRI, but these files are always readable, so registering them
+    # with the loop directly (EPOLLIN) would spin. They go into a private
+    # epoll set armed for EPOLLPRI only, and that epoll fd, which becomes
+    # readable when any member fires, is what the loop watches. On a wakeup
+    # the changed file is reread with pread() on its kept-open fd and diffed
+    # against the previous content.
+    #
+    #     async with CgroupEventMonitor() as monitor:
+    #         monitor.add(path)
+    #         async for event in monitor:
+    #             ...
+
+    def __init__(self, files=EVENT_FILES, maxsize=0):
+        self.files = tuple(files)
+        self.epoll = select.epoll()
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+        self._loop = None
+        self._fds = {}
+        self._keys = {}
+        self._state = {}
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
+
+    def start(self, loop=None):
+        self._loop = loop or asyncio.get_running_loop()
+        self._loop.add_reader(self.epoll.fileno(), self._on_ready)
+
+    def fileno(self):
+        return self.epoll.fileno()
+
+    def add(self, cgroup_path):
+        for name in self.files:
+            key = (cgroup_path, name)
+            if key in self._fds:
+                continue
+            try:
+                fd = os.open(os.path.join(cgroup_path, name), os.O_RDONLY | os.O_CLOEXEC)
+            except FileNotFoundError:
+                if not os.path.isdir(cgroup_path):
+                    raise
+                # Controller not enabled for this cgroup (or no swap).
+                continue
+            self._state[key] = parse_counters(os.pread(fd, READ_SIZE, 0))
+            self.epoll.register(fd, select.EPOLLPRI)
+            self._fds[key] = fd
+            self._keys[fd] = key
+
+    def remove(self, cgroup_path, emit=False):
+        # emit=True queues a RemovedEvent, for callers that learn about the
+        # removal elsewhere (e.g. from CgroupIndex).
+        if emit and any(k[0] == cgroup_path for k in self._fds):
+            self._emit(RemovedEvent(time.monotonic_ns(), cgroup_path))
+        for key in [k for k in self._fds if k[0] == cgroup_path]:
+            fd = self._fds.pop(key)
+            del self._keys[fd]
+            self._state.pop(key, None)
+            try:
+                self.epoll.unregister(fd)
+            except OSError:
+                pass
+            os.close(fd)
+
+    def cgroups(self):
+        return sorted({k[0] for k in self._fds})
+
+    def _emit(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def _on_ready(self):
+        ts = time.monotonic_ns()
+        gone = set()
+        for fd, _ in self.epoll.poll(0):
+            key = self._keys.get(fd)
+            if key is None or key[0] in gone:
+                continue
+            try:
+                data = os.pread(fd, READ_SIZE, 0)
+            except OSError as e:
+                if e.errno not in (errno.ENODEV, errno.ENOENT):
+                    raise
+                gone.add(key[0])
+                continue
+            self._diff(ts, key, parse_counters(data))
+        for path in gone:
+            self.remove(path)
+            self._emit(RemovedEvent(ts, path))
+
+    def _diff(self, ts, key, new):
+        cgroup_path, name = key
+        old = self._state.get(key, {})
+        self._state[key] = new
+        for k, v in new.items():
+            prev = old.get(k, 0)
+            if v == prev:
+                continue
+            if name == "cgroup.events":
+                self._emit(StateEvent(ts, cgroup_path, k, v))
+            elif name == "memory.events":
+                self._emit(MemoryEvent(ts, cgroup_path, k, v, v - prev))
+            else:
+                self._emit(SwapEvent(ts, cgroup_path, k, v, v - prev))
+
+    def close(self):
+        if self._loop is not None:
+            self._loop.remove_reader(self.epoll.fileno())
+            self._loop = None
+        for path in self.cgroups():
+            self.remove(path)
+        self.epoll.close()
+
+
+async def watch(targets, containers):
+    index = CgroupIndex(watch=containers) if containers or any(not os.path.isdir(t) for t in targets) else None
+    async with CgroupEventMonitor() as monitor:
+        for target in targets:
+            path = target if os.path.isdir(target) else index.lookup(target)
+            if path is None:
+                raise SystemExit(f"Cgroup path not found for {target}")
+            monitor.add(path)
+        if containers:
+            pinned = set(monitor.cgroups())
+
+            def sync():
+                index.process_events()
+                current = set(index.by_id.values())
+                for path in set(monitor.cgroups()) - current - pinned:
+                    monitor.remove(path, emit=True)
+                for path in current - set(monitor.cgroups()):
+                    try:
+                        monitor.add(path)
+                    except OSError:
+                        pass
+
+            sync()
+            asyncio.get_running_loop().add_reader(index.fileno(), sync)
+        print(f"Watching {len(monitor.cgroups())} cgroups")
+        try:
+            async for event in monitor:
+                print(f"{event.ts / 1e9:.6f} {type(event).__name__:<12} {event.cgroup_path} "
+                      + " ".join(f"{f}={getattr(event, f)}" for f in event._fields[2:]))
+        finally:
+            if index is not None:
+                index.close()
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python3 -m process_monitoring_framework.events",
+                                description="Print cgroup.events / memory.events / memory.swap.events changes")
+    p.add_argument("targets", nargs="*", help="cgroup directories, container names or IDs")
+    p.add_argument("--containers", action="store_true", help="watch every container cgroup, following starts")
+    args = p.parse_args(argv)
+    if not args.targets and not args.containers:
+        p.error("nothing to watch")
+    raise_nofile_limit()
+    try:
+        asyncio.run(watch(args.targets, args.containers))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+import gzip, time, threading, socketserver
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from cgroupfs import cgroup_id
+from latency_hist import slot_bounds
+
+DEFAULT_PORT = 9465
+DEFAULT_INTERVAL = 5.0
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Exported histogram buckets: powers of two from ~1 us to ~17 s. Every
+# log-linear slot of latency_hist ends on or below one of them, so the
+# exported counts are exact, just coarser.
+LATENCY_BUCKETS_NS = tuple(1 << i for i in range(10, 35))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if value is None:
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def family(name, kind, help_text, samples):
+    # Prometheus text lines for one metric family. samples: [(suffix,
+    # labels dict or None, value)].
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for suffix, labels, value in samples:
+        if labels:
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{suffix}{{{label_text}}} {_number(value)}")
+        else:
+            lines.append(f"{name}{suffix} {_number(value)}")
+    return lines
+
+
+def controller_source(controller):
+    # Per-cgroup limits as last applied or read, the loop's counters and the
+    # writer's counters (suppressed: identical writes skipped by the shadow).
+    def render():
+        limits = list(controller.limits.items())
+        totals = controller.stats.totals()
+        writer = controller.writer
+        lines = family("cgroup_memory_max_bytes", "gauge", "memory.max of a managed cgroup (+Inf: max).",
+                       [("", {"cgroup": path}, l.memory_max) for path, l in limits])
+        lines += family("cgroup_cpu_max_cores", "gauge", "cpu.max quota/period of a managed cgroup (+Inf: max).",
+                        [("", {"cgroup": path}, None if l.cpu_quota is None else l.cpu_quota / l.cpu_period)
+                         for path, l in limits])
+        lines += family("cgroup_controller_managed_cgroups", "gauge", "Cgroups managed by the controller.",
+                        [("", None, len(limits))])
+        for name in ("ticks", "overruns", "writes", "write_errors", "removed"):
+            lines += family(f"cgroup_controller_{name}_total", "counter", f"Controller {name.replace('_', ' ')}.",
+                            [("", None, totals[name])])
+        for name in ("writes", "suppressed", "reopens"):
+            lines += family(f"cgroup_writer_{name}_total", "counter", f"CgroupWriter {name}.",
+                            [("", None, getattr(writer, name))])
+        return lines
+
+    return render
+
+
+def latency_source(tracer, controller=None):
+    # The BPF write-latency histograms of a WriteTracer, by knob and path.
+    # With a controller, its managed cgroups are watched first, so cgroups
+    # it picked up since the last rebuild are traced from then on.
+    watched = {}   # path -> cgroup id it was watched with
+
+    def render():
+        if controller is not None:
+            paths = set(controller.limits)
+            for path in [p for p in watched if p not in paths]:
+                del watched[path]
+                tracer.unwatch_cgroup(path)
+            for path in paths:
+                # A cgroup may be gone before the controller notices (left
+                # out, retried next rebuild), or recreated at the same path
+                # with a new id (watched again).
+                try:
+                    cgid = cgroup_id(path)
+                    if watched.get(path) != cgid:
+                        tracer.watch_cgroup(path)
+                        watched[path] = cgid
+                except OSError:
+                    watched.pop(path, None)
+        hists, maxes = tracer.latency_histograms(), tracer.latency_max()
+        samples = []
+        max_samples = []
+        for (knob, path), counts in sorted(hists.items()):
+            labels = {"knob": knob, "path": path}
+            cumulative = [0] * len(LATENCY_BUCKETS_NS)
+            total = 0
+            sum_ns = 0
+            for slot, n in counts.items():
+                lo, hi = slot_bounds(slot)
+                total += n
+                # The BPF map has no sum; the slot midpoint is within 6%.
+                sum_ns += n * (lo + hi) / 2
+                for i, bound in enumerate(LATENCY_BUCKETS_NS):
+                    if hi <= bound:
+                        cumulative[i] += n
+                        break
+            running = 0
+            for bound, n in zip(LATENCY_BUCKETS_NS, cumulative):
+                running += n
+                samples.append(("_bucket", dict(labels, le=repr(bound / 1e9)), running))
+            samples.append(("_bucket", dict(labels, le="+Inf"), total))
+            samples.append(("_sum", labels, sum_ns / 1e9))
+            samples.append(("_count", labels, total))
+            if (knob, path) in maxes:
+                max_samples.append(("", labels, maxes[(knob, path)] / 1e9))
+        lines = family("cgroup_write_latency_seconds", "histogram",
+                       "memory.max/cpu.max write latency (raw: vfs_write, dockerd: request read to write).", samples)
+        lines += family("cgroup_write_latency_max_seconds", "gauge", "Largest write latency seen.", max_samples)
+        return lines
+
+    return render
+
+
+class MetricsExporter:
+    # Serves Prometheus text format on http://host:port/metrics. The body is
+    # rendered from the sources on a timer (every interval seconds) and kept
+    # as bytes, plain and gzipped, so a scrape only sends a prebuilt buffer:
+    # its cost does not grow with the number of cgroups, and scrapes never
+    # touch controller or BPF state. interval=0 renders on every scrape
+    # instead, for comparison. Sources are callables returning text lines;
+    # one that raises keeps the previous snapshot (counted in rebuild_errors).
+
+    def __init__(self, sources, port=DEFAULT_PORT, host="127.0.0.1", interval=DEFAULT_INTERVAL):
+        self.sources = list(sources)
+        self.interval = interval
+        self.rebuilds = 0
+        self.rebuild_errors = 0
+        self.rebuild_ns = 0
+        self._snapshot = (b"", b"")
+        self._stop = threading.Event()
+        self._threads = []
+        self.server = _Server((host, port), _Handler)
+        self.server.exporter = self
+        self.port = self.server.server_address[1]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def render(self):
+        t0 = time.monotonic_ns()
+        lines = []
+        for source in self.sources:
+            lines += source()
+        lines += family("cgroup_exporter_rebuild_seconds", "gauge", "Time the last snapshot took to render.",
+                        [("", None, self.rebuild_ns / 1e9)])
+        lines += family("cgroup_exporter_rebuild_errors_total", "counter", "Snapshot renders that failed.",
+                        [("", None, self.rebuild_errors)])
+        lines += family("cgroup_exporter_snapshot_timestamp_seconds", "gauge", "Wall time of the snapshot.",
+                        [("", None, time.time())])
+        body = ("\n".join(lines) + "\n").encode()
+        self.rebuild_ns = time.monotonic_ns() - t0
+        return body
+
+    def rebuild(self):
+        try:
+            body = self.render()
+        except Exception:
+            self.rebuild_errors += 1
+            return False
+        # One tuple, swapped in a single assignment: handlers see either the
+        # old or the new snapshot, never a mix.
+        self._snapshot = (body, gzip.compress(body, compresslevel=1))
+        self.rebuilds += 1
+        return True
+
+    def snapshot(self, gzipped=False):
+        if not self.interval:
+            body = self.render()
+            return gzip.compress(body, compresslevel=1) if gzipped else body
+        return self._snapshot[1 if gzipped else 0]
+
+    def _rebuild_loop(self):
+        while not self._stop.wait(self.interval):
+            self.rebuild()
+
+    def start(self):
+        if self.interval:
+            self.rebuild()
+            self._threads.append(threading.Thread(target=self._rebuild_loop, daemon=True))
+        self._threads.append(threading.Thread(target=self.server.serve_forever, daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        if self._threads:
+            self.server.shutdown()
+        self.server.server_close()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are two writes; with Nagle a small body waits for the
+    # client's delayed ACK (~40 ms).
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        gzipped = "gzip" in self.headers.get("Accept-Encoding", "")
+        body = self.server.exporter.snapshot(gzipped)
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
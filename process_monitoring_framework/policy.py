@@ -0,0 +1,165 @@
+import os
+from collections import namedtuple
+import numpy as np
+from .sampler import SAMPLE_FILES, Sample
+
+CPU_PERIOD = 100000
+MIB = 1024 * 1024
+
+# None means "max" (no limit) for memory_max and cpu_quota.
+Limits = namedtuple("Limits", ["memory_max", "cpu_quota", "cpu_period"])
+# In the array form used by decide_all() "max" is -1.
+UNLIMITED = -1
+
+
+def sample_row(samples, i):
+    # One cgroup's Sample out of a Sample of arrays.
+    return Sample(int(samples.ts), *(int(field[i]) for field in samples[1:]))
+
+
+def limits_row(limits, i):
+    memory_max, cpu_quota, cpu_period = (int(field[i]) for field in limits)
+    return Limits(None if memory_max < 0 else memory_max, None if cpu_quota < 0 else cpu_quota, cpu_period)
+
+
+def limits_arrays(limits):
+    # Scalar Limits to one-element arrays.
+    return Limits(*(np.array([UNLIMITED if value is None else value], dtype=np.int64) for value in limits))
+
+
+def read_limits(cgroup_path):
+    def read(name):
+        try:
+            with open(os.path.join(cgroup_path, name)) as f:
+                return f.read().split()
+        except FileNotFoundError:
+            return None
+
+    mem = read("memory.max")
+    cpu = read("cpu.max")
+    memory_max = None if not mem or mem[0] == "max" else int(mem[0])
+    cpu_quota = None if not cpu or cpu[0] == "max" else int(cpu[0])
+    cpu_period = int(cpu[1]) if cpu and len(cpu) > 1 else CPU_PERIOD
+    return Limits(memory_max, cpu_quota, cpu_period)
+
+
+class Policy:
+    # decide() runs once per cgroup per controller tick with the previous and
+    # current Sample and the limits currently in effect. It returns new Limits
+    # or None to leave the cgroup alone. files lists the stat files the
+    # policy reads; the others are not sampled (their Sample fields are 0).
+    #
+    # The controller calls decide_all() once per tick for every cgroup: the
+    # Sample fields (except ts) and Limits are int64 arrays with one element
+    # per sampler row, paths[i] being the cgroup of row i (None for unused
+    # rows) and -1 meaning "max". It returns Limits arrays, or None when
+    # nothing changes. The default calls decide() per cgroup; policies meant
+    # for hundreds of cgroups should override it with array arithmetic.
+    files = SAMPLE_FILES
+
+    def decide(self, cgroup_path, prev, cur, limits):
+        return None
+
+    def decide_all(self, paths, prev, cur, limits):
+        new = [field.copy() for field in limits]
+        changed = False
+        for i, path in enumerate(paths):
+            if path is None:
+                continue
+            old = limits_row(limits, i)
+            decided = self.decide(path, sample_row(prev, i), sample_row(cur, i), old)
+            if decided is not None and decided != old:
+                for field, value in zip(new, decided):
+                    field[i] = UNLIMITED if value is None else value
+                changed = True
+        return Limits(*new) if changed else None
+
+
+class ObservePolicy(Policy):
+    # Samples only; useful to measure the loop's own overhead.
+
+    def decide_all(self, paths, prev, cur, limits):
+        return None
+
+
+class HeadroomPolicy(Policy):
+    # memory.max: grow by mem_grow while the cgroup stalls on memory for more
+    # than pressure_threshold of the interval; shrink towards memory.current
+    # plus mem_headroom when usage is far below the limit.
+    # cpu.max: grow by cpu_step cores while more than throttle_threshold of
+    # CFS periods are throttled; shrink towards usage plus cpu_headroom when
+    # the cgroup uses less than half its quota.
+    # Both run as array arithmetic over all cgroups at once.
+    files = ("memory.current", "cpu.stat", "memory.pressure")
+
+    def __init__(self, mem_headroom=0.25, mem_grow=1.25, mem_min=64 * MIB, mem_max=None,
+                 pressure_threshold=0.05, throttle_threshold=0.10,
+                 cpu_step=0.10, cpu_headroom=0.5, cpu_min=0.05, cpu_max=None, hysteresis=0.10):
+        self.mem_headroom = mem_headroom
+        self.mem_grow = mem_grow
+        self.mem_min = mem_min
+        self.mem_max = mem_max
+        self.pressure_threshold = pressure_threshold
+        self.throttle_threshold = throttle_threshold
+        self.cpu_step = cpu_step
+        self.cpu_headroom = cpu_headroom
+        self.cpu_min = cpu_min
+        self.cpu_max = cpu_max or float(os.cpu_count() or 1)
+        self.hysteresis = hysteresis
+
+    def _memory(self, prev, cur, limit, wall_usec):
+        stall = (cur.memory_some_usec - prev.memory_some_usec) / wall_usec
+        grow = stall > self.pressure_threshold
+        target = np.where(grow, limit * self.mem_grow, cur.memory_current * (1 + self.mem_headroom))
+        keep = (limit < 0) | (~grow & (target > limit * 0.5))
+        target = np.maximum(self.mem_min, target)
+        if self.mem_max is not None:
+            target = np.minimum(self.mem_max, target)
+        keep |= np.abs(target - limit) < limit * self.hysteresis
+        return np.where(keep, limit, target.astype(np.int64) // 4096 * 4096)
+
+    def _cpu(self, prev, cur, quota, period, wall_usec):
+        periods = cur.nr_periods - prev.nr_periods
+        cores = quota / period
+        throttled = np.divide(cur.nr_throttled - prev.nr_throttled, periods,
+                              out=np.zeros(len(periods)), where=periods > 0) > self.throttle_threshold
+        used = (cur.cpu_usage_usec - prev.cpu_usage_usec) / wall_usec
+        keep = (quota < 0) | (~throttled & (used > cores * 0.5))
+        target = np.where(throttled, cores + self.cpu_step, used * (1 + self.cpu_headroom))
+        target = np.minimum(self.cpu_max, np.maximum(self.cpu_min, target))
+        keep |= np.abs(target - cores) < cores * self.hysteresis
+        return np.where(keep, quota, (target * period).astype(np.int64))
+
+    def decide_all(self, paths, prev, cur, limits):
+        if cur.ts <= prev.ts:
+            return None
+        wall_usec = (cur.ts - prev.ts) / 1000
+        with np.errstate(divide="ignore", invalid="ignore"):
+            memory_max = self._memory(prev, cur, limits.memory_max, wall_usec)
+            cpu_quota = self._cpu(prev, cur, limits.cpu_quota, limits.cpu_period, wall_usec)
+        return limits._replace(memory_max=memory_max, cpu_quota=cpu_quota)
+
+    def decide(self, cgroup_path, prev, cur, limits):
+        arrays = [Sample(s.ts, *(np.array([v], dtype=np.int64) for v in s[1:])) for s in (prev, cur)]
+        new = self.decide_all([cgroup_path], *arrays, limits_arrays(limits))
+        if new is None:
+            return None
+        new = limits_row(new, 0)
+        return new if new != limits else None
+
+
+POLICIES = {
+    "observe": ObservePolicy,
+    "headroom": HeadroomPolicy,
+}
+
+
+def load_policy(spec):
+    # A name from POLICIES or "module:Class" for an out-of-tree policy.
+    if spec in POLICIES:
+        return POLICIES[spec]()
+    module, _, attr = spec.partition(":")
+    if not attr:
+        raise ValueError(f"Unknown policy {spec!r}; use one of {sorted(POLICIES)} or module:Class")
+    import importlib
+    return getattr(importlib.import_module(module), attr)()
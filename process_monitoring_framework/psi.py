@@ -0,0 +1,330 @@
+import os, sys, time, errno, select, argparse
+from collections import namedtuple, deque
+from cgroup_writer import CgroupWriter, CgroupRemovedError
+from cgroup_index import CgroupIndex
+from .sampler import parse_psi_totals
+from .policy import read_limits, MIB
+
+PSI_RESOURCES = ("memory", "cpu")
+# 50 ms of "some" stall within a 1 s window. Windows must be 500 ms - 10 s;
+# unprivileged users are limited to multiples of 2 s.
+DEFAULT_STALL_US = 50000
+DEFAULT_WINDOW_US = 1000000
+
+PressureEvent = namedtuple("PressureEvent", ["ts", "cgroup_path", "resource"])
+
+
+def trigger_spec(stall_us=DEFAULT_STALL_US, window_us=DEFAULT_WINDOW_US, kind="some"):
+    return f"{kind} {int(stall_us)} {int(window_us)}".encode() + b"\0"
+
+
+class PsiWatcher:
+    # Registers PSI triggers on <cgroup>/<resource>.pressure and waits on all
+    # of them in one epoll set. The kernel signals EPOLLPRI when the stall
+    # threshold is crossed within the window (at most once per window) and
+    # EPOLLERR once the cgroup is removed. Closing the fd drops the trigger.
+
+    def __init__(self, stall_us=DEFAULT_STALL_US, window_us=DEFAULT_WINDOW_US, kind="some"):
+        self.spec = trigger_spec(stall_us, window_us, kind)
+        self.epoll = select.epoll()
+        self._fds = {}
+        self._keys = {}
+        self.removed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def fileno(self):
+        return self.epoll.fileno()
+
+    def add(self, cgroup_path, resources=PSI_RESOURCES):
+        for resource in resources:
+            key = (cgroup_path, resource)
+            if key in self._fds:
+                continue
+            fd = os.open(os.path.join(cgroup_path, f"{resource}.pressure"), os.O_RDWR | os.O_NONBLOCK | os.O_CLOEXEC)
+            try:
+                os.write(fd, self.spec)
+                self.epoll.register(fd, select.EPOLLPRI)
+            except OSError:
+                os.close(fd)
+                raise
+            self._fds[key] = fd
+            self._keys[fd] = key
+
+    def remove(self, cgroup_path):
+        for key in [k for k in self._fds if k[0] == cgroup_path]:
+            fd = self._fds.pop(key)
+            del self._keys[fd]
+            try:
+                self.epoll.unregister(fd)
+            except OSError:
+                pass
+            os.close(fd)
+
+    def cgroups(self):
+        return sorted({k[0] for k in self._fds})
+
+    def wait(self, timeout=None):
+        try:
+            ready = self.epoll.poll(-1 if timeout is None else timeout)
+        except InterruptedError:
+            return []
+        ts = time.monotonic_ns()
+        events = []
+        gone = set()
+        for fd, mask in ready:
+            key = self._keys.get(fd)
+            if key is None:
+                continue
+            if mask & select.EPOLLERR:
+                gone.add(key[0])
+            elif mask & select.EPOLLPRI:
+                events.append(PressureEvent(ts, key[0], key[1]))
+        for path in gone:
+            self.remove(path)
+            self.removed += 1
+        return events
+
+    def close(self):
+        for path in self.cgroups():
+            self.remove(path)
+        self.epoll.close()
+
+
+class PsiPoller:
+    # Polling equivalent of PsiWatcher for comparison: rereads the stall
+    # totals every interval and reports when the stall accumulated over the
+    # last window crosses the threshold, at most once per window.
+
+    def __init__(self, interval, stall_us=DEFAULT_STALL_US, window_us=DEFAULT_WINDOW_US, kind="some"):
+        self.interval = interval
+        self.stall_us = stall_us
+        self.window_ns = window_us * 1000
+        self.full = kind == "full"
+        self._fds = {}
+        self._history = {}
+        self._last_event = {}
+        self._next = time.monotonic_ns()
+        self.removed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, cgroup_path, resources=PSI_RESOURCES):
+        for resource in resources:
+            key = (cgroup_path, resource)
+            if key not in self._fds:
+                self._fds[key] = os.open(os.path.join(cgroup_path, f"{resource}.pressure"), os.O_RDONLY | os.O_CLOEXEC)
+                self._history[key] = deque()
+
+    def remove(self, cgroup_path):
+        for key in [k for k in self._fds if k[0] == cgroup_path]:
+            os.close(self._fds.pop(key))
+            self._history.pop(key, None)
+            self._last_event.pop(key, None)
+
+    def cgroups(self):
+        return sorted({k[0] for k in self._fds})
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic_ns() + int(timeout * 1e9)
+        while True:
+            now = time.monotonic_ns()
+            if self._next > now:
+                if deadline is not None and deadline < self._next:
+                    time.sleep(max(0, deadline - now) / 1e9)
+                    return []
+                time.sleep((self._next - now) / 1e9)
+            self._next += int(self.interval * 1e9)
+            events = self.poll_once()
+            if events:
+                return events
+
+    def poll_once(self):
+        ts = time.monotonic_ns()
+        events = []
+        gone = set()
+        for key, fd in self._fds.items():
+            try:
+                some, full = parse_psi_totals(os.pread(fd, 256, 0))
+            except OSError as e:
+                if e.errno in (errno.ENODEV, errno.ENOENT):
+                    gone.add(key[0])
+                    continue
+                raise
+            history = self._history[key]
+            history.append((ts, full if self.full else some))
+            while history[0][0] < ts - self.window_ns:
+                history.popleft()
+            if history[-1][1] - history[0][1] >= self.stall_us and \
+                    ts - self._last_event.get(key, 0) >= self.window_ns:
+                self._last_event[key] = ts
+                events.append(PressureEvent(ts, key[0], key[1]))
+        for path in gone:
+            self.remove(path)
+            self.removed += 1
+        return events
+
+    def close(self):
+        for path in self.cgroups():
+            self.remove(path)
+
+
+class PsiBooster:
+    # Raises a cgroup's limits as soon as its pressure source reports a stall:
+    # memory.max (and memory.high, if set) grow by mem_boost, cpu.max grows by
+    # cpu_step cores. Limits at "max" are left alone.
+
+    def __init__(self, source, writer=None, mem_boost=1.25, mem_cap=None, cpu_step=0.25, cpu_cap=None):
+        self.source = source
+        self.writer = writer or CgroupWriter()
+        self.mem_boost = mem_boost
+        self.mem_cap = mem_cap
+        self.cpu_step = cpu_step
+        self.cpu_cap = cpu_cap or float(os.cpu_count() or 1)
+        self.limits = {}
+        self.memory_high = {}
+        self.boosts = 0
+        self._removed_seen = 0
+        # (event ts, write done ts, cgroup_path, resource)
+        self.reactions = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, cgroup_path, resources=PSI_RESOURCES):
+        self.limits[cgroup_path] = read_limits(cgroup_path)
+        self.memory_high[cgroup_path] = self._read_memory_high(cgroup_path)
+        self.writer.open(cgroup_path)
+        self.source.add(cgroup_path, resources)
+
+    def remove(self, cgroup_path):
+        self.source.remove(cgroup_path)
+        self.writer.forget(cgroup_path)
+        self.limits.pop(cgroup_path, None)
+        self.memory_high.pop(cgroup_path, None)
+
+    @staticmethod
+    def _read_memory_high(cgroup_path):
+        try:
+            with open(os.path.join(cgroup_path, "memory.high")) as f:
+                value = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return None if value == "max" else int(value)
+
+    def boost(self, cgroup_path, resource):
+        limits = self.limits[cgroup_path]
+        if resource == "memory":
+            # memory.max first: memory.high is capped at the new limit.
+            if limits.memory_max is not None:
+                target = int(limits.memory_max * self.mem_boost) // 4096 * 4096
+                if self.mem_cap is not None:
+                    target = min(target, self.mem_cap)
+                if target != limits.memory_max:
+                    self.writer.set_memory_max(cgroup_path, target)
+                    limits = limits._replace(memory_max=target)
+                    self.limits[cgroup_path] = limits
+            high = self.memory_high[cgroup_path]
+            if high is not None:
+                high = int(high * self.mem_boost) // 4096 * 4096
+                if self.mem_cap is not None:
+                    high = min(high, self.mem_cap)
+                if limits.memory_max is not None and high > limits.memory_max:
+                    high = limits.memory_max
+                self.writer.write(cgroup_path, "memory.high", high)
+                self.memory_high[cgroup_path] = high
+        elif limits.cpu_quota is not None:
+            cores = min(self.cpu_cap, limits.cpu_quota / limits.cpu_period + self.cpu_step)
+            target = int(cores * limits.cpu_period)
+            if target != limits.cpu_quota:
+                self.writer.set_cpu_max(cgroup_path, target, limits.cpu_period)
+                self.limits[cgroup_path] = limits._replace(cpu_quota=target)
+        self.boosts += 1
+
+    def handle(self, events):
+        for ev in events:
+            if ev.cgroup_path not in self.limits:
+                continue
+            try:
+                self.boost(ev.cgroup_path, ev.resource)
+            except CgroupRemovedError:
+                self.remove(ev.cgroup_path)
+                continue
+            self.reactions.append((ev.ts, time.monotonic_ns(), ev.cgroup_path, ev.resource))
+
+    def run_once(self, timeout=None):
+        events = self.source.wait(timeout)
+        if self.source.removed != self._removed_seen:
+            self._removed_seen = self.source.removed
+            alive = set(self.source.cgroups())
+            for path in [p for p in self.limits if p not in alive]:
+                self.remove(path)
+        self.handle(events)
+        return events
+
+    def run(self, duration=None, report=print):
+        deadline = None if duration is None else time.monotonic() + duration
+        while deadline is None or time.monotonic() < deadline:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            for ev in self.run_once(timeout):
+                limits = self.limits.get(ev.cgroup_path)
+                if limits is not None:
+                    report(f"{ev.resource} pressure in {ev.cgroup_path}: memory.max "
+                           f"{limits.memory_max if limits.memory_max is not None else 'max'} "
+                           f"cpu.max {limits.cpu_quota if limits.cpu_quota is not None else 'max'} {limits.cpu_period}")
+
+    def close(self):
+        self.source.close()
+        self.writer.close()
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python3 -m process_monitoring_framework.psi",
+                                description="Boost cgroup limits on PSI triggers")
+    p.add_argument("targets", nargs="+", help="cgroup directories, container names or IDs")
+    p.add_argument("--resource", action="append", choices=PSI_RESOURCES, help="pressure file to watch (default: both)")
+    p.add_argument("--stall-us", type=int, default=DEFAULT_STALL_US)
+    p.add_argument("--window-us", type=int, default=DEFAULT_WINDOW_US)
+    p.add_argument("--mem-boost", type=float, default=1.25, help="memory.max growth factor per trigger")
+    p.add_argument("--mem-cap", type=int, help="memory.max ceiling in MiB")
+    p.add_argument("--cpu-step", type=float, default=0.25, help="cpu.max growth in cores per trigger")
+    p.add_argument("--cpu-cap", type=float, help="cpu.max ceiling in cores")
+    p.add_argument("--duration", type=float)
+    args = p.parse_args(argv)
+
+    index = None
+    booster = PsiBooster(PsiWatcher(args.stall_us, args.window_us), mem_boost=args.mem_boost,
+                         mem_cap=args.mem_cap * MIB if args.mem_cap else None,
+                         cpu_step=args.cpu_step, cpu_cap=args.cpu_cap)
+    try:
+        for target in args.targets:
+            path = target
+            if not os.path.isdir(target):
+                index = index or CgroupIndex(watch=False)
+                path = index.lookup(target)
+                if path is None:
+                    p.error(f"Cgroup path not found for {target}")
+            booster.add(path, args.resource or PSI_RESOURCES)
+        booster.run(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        booster.close()
+        if index is not None:
+            index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+from collections import namedtuple
+
+# The stat files behind Sample; VectorSampler reads them for the controller.
+SAMPLE_FILES = ("memory.current", "cpu.stat", "memory.pressure", "cpu.pressure")
+
+# Counters are cumulative (usec / events since cgroup creation); policies
+# work on the difference between two samples.
+Sample = namedtuple("Sample", [
+    "ts",               # CLOCK_MONOTONIC ns
+    "memory_current",
+    "cpu_usage_usec",
+    "nr_periods",
+    "nr_throttled",
+    "throttled_usec",
+    "memory_some_usec",
+    "memory_full_usec",
+    "cpu_some_usec",
+])
+
+
+def parse_psi_totals(data):
+    # "some avg10=.. avg60=.. avg300=.. total=N\nfull ... total=M"; the full
+    # line is missing on older kernels for cpu.pressure.
+    tokens = data.split()
+    some = int(tokens[4][6:]) if len(tokens) > 4 else 0
+    full = int(tokens[9][6:]) if len(tokens) > 9 else 0
+    return some, full
@@ -0,0 +1,341 @@
+import os, errno, time
+import numpy as np
+from cgroup_writer import CgroupRemovedError
+
+CPU_STAT_KEYS = ("usage_usec", "nr_periods", "nr_throttled", "throttled_usec")
+MEMORY_STAT_KEYS = ("anon", "file", "pgmajfault")
+# Stall totals (usec) of the PSI files: "some ... total=N" then "full ... total=M".
+PSI_METRICS = {"memory.pressure": ("memory_some_usec", "memory_full_usec"), "cpu.pressure": ("cpu_some_usec",)}
+FILES = ("memory.current", "cpu.stat", "memory.stat", "memory.pressure", "cpu.pressure")
+DEFAULT_FILES = ("memory.current", "cpu.stat", "memory.stat")
+HISTORY = 256
+READ_SIZE = 8192
+SMALL_READ = 512
+MIN_CAPACITY = 16
+
+_VALUE, _STAT, _KEYS, _TOTALS = 0, 1, 2, 3
+_CPU_STAT_TOKENS = tuple(k.encode() for k in CPU_STAT_KEYS)
+
+
+class VectorSampler:
+    # Samples memory.current, selected cpu.stat and memory.stat keys and the
+    # PSI stall totals of a set of cgroups into one preallocated int64 ring
+    # buffer shaped (cgroups x metrics x time). files picks which of FILES
+    # are read; a file missing in a cgroup (controller not enabled, PSI
+    # disabled) reads as zero.
+    #
+    # All files stay open and sample() reads them file by file across all
+    # cgroups: one list comprehension of pread()s per file, then one array
+    # store per file into the ring. The small files are split(); the
+    # cpu.stat key positions are looked up once per token count (the
+    # nr_periods lines exist only with the cpu controller enabled).
+    # memory.stat (a few KB) is read with preadv() into one reusable
+    # bytearray with a leading "\n" at buf[0], so every key is found with a
+    # single find(b"\n<key> ") and only the selected values are converted.
+    # Derived values (rates, throttle ratios, moving averages) are computed
+    # with NumPy across all cgroups.
+    #
+    # Cgroups can be added and removed; each has a fixed row (slot) of the
+    # ring, and free rows are reused. A row only holds that cgroup's values
+    # from its since[] sample on; ready() masks the rows with at least two.
+    # A cgroup that goes away keeps its last values, is cleared in alive and
+    # is listed by take_removed().
+
+    def __init__(self, cgroup_paths=(), memory_stat_keys=MEMORY_STAT_KEYS, history=HISTORY, files=DEFAULT_FILES):
+        unknown = set(files) - set(FILES)
+        if unknown:
+            raise ValueError(f"Cannot sample {sorted(unknown)}")
+        self.files = tuple(name for name in FILES if name in files)
+        self._parsers = []
+        metrics = []
+        for name in self.files:
+            # (kind, arg, first metric, number of metrics)
+            if name == "memory.current":
+                self._parsers.append((_VALUE, None, len(metrics), 1))
+                metrics.append("memory_current")
+            elif name == "cpu.stat":
+                self._parsers.append((_STAT, None, len(metrics), len(CPU_STAT_KEYS)))
+                metrics += CPU_STAT_KEYS
+            elif name == "memory.stat":
+                keys = [b"\n" + k.encode() + b" " for k in memory_stat_keys]
+                self._parsers.append((_KEYS, keys, len(metrics), len(keys)))
+                metrics += memory_stat_keys
+            else:
+                self._parsers.append((_TOTALS, None, len(metrics), len(PSI_METRICS[name])))
+                metrics += PSI_METRICS[name]
+        self.metrics = tuple(metrics)
+        self.index = {name: i for i, name in enumerate(self.metrics)}
+        self.history = history
+        self.paths = []
+        self.slots = {}
+        self.count = 0
+        self.ts = np.zeros(history, dtype=np.int64)
+        self._allocate(max(len(cgroup_paths), 1))
+        self._fds = [None] * self.capacity
+        self._free = []
+        self._active = []
+        self._removed = []
+        self._groups = None
+        self._layouts = {}
+        self._stat_layout = -1, ()
+        self._buf = bytearray(READ_SIZE + 1)
+        self._buf[0] = 0x0a
+        self._view = [memoryview(self._buf)[1:]]
+        try:
+            for path in cgroup_paths:
+                self.add(path)
+        except (OSError, CgroupRemovedError):
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _allocate(self, capacity):
+        data = np.zeros((capacity, len(self.metrics), self.history), dtype=np.int64)
+        alive = np.zeros(capacity, dtype=bool)
+        since = np.zeros(capacity, dtype=np.int64)
+        if self.paths:
+            n = len(self.paths)
+            data[:n] = self.data
+            alive[:n] = self.alive
+            since[:n] = self.since
+        self.data, self.alive, self.since = data, alive, since
+        self.capacity = capacity
+
+    def add(self, cgroup_path):
+        if cgroup_path in self.slots:
+            return self.slots[cgroup_path]
+        if not os.path.isdir(cgroup_path):
+            raise CgroupRemovedError(cgroup_path)
+        fds = []
+        try:
+            for name in self.files:
+                try:
+                    fds.append(os.open(os.path.join(cgroup_path, name), os.O_RDONLY | os.O_CLOEXEC))
+                except FileNotFoundError:
+                    fds.append(-1)
+        except OSError:
+            for fd in fds:
+                if fd >= 0:
+                    os.close(fd)
+            raise
+        if self._free:
+            slot = self._free.pop()
+            self.paths[slot] = cgroup_path
+        else:
+            slot = len(self.paths)
+            if slot == self.capacity:
+                self._allocate(max(MIN_CAPACITY, 2 * self.capacity))
+                self._fds += [None] * (self.capacity - len(self._fds))
+            self.paths.append(cgroup_path)
+        self.slots[cgroup_path] = slot
+        self._fds[slot] = tuple(fds)
+        self.data[slot] = 0
+        self.alive[slot] = True
+        self.since[slot] = self.count
+        self._active.append(slot)
+        self._active.sort()
+        self._groups = None
+        return slot
+
+    def remove(self, cgroup_path):
+        slot = self.slots.pop(cgroup_path, None)
+        if slot is None:
+            return
+        for fd in self._fds[slot]:
+            if fd >= 0:
+                os.close(fd)
+        self._fds[slot] = None
+        self.paths[slot] = None
+        self.alive[slot] = False
+        if slot in self._active:
+            self._active.remove(slot)
+        self._free.append(slot)
+        self._groups = None
+
+    def cgroups(self):
+        return list(self.slots)
+
+    def take_removed(self):
+        # Cgroups found gone since the last call; their rows stay allocated
+        # until remove().
+        removed, self._removed = self._removed, []
+        return removed
+
+    def _plan(self):
+        # Per file: the open fds of the active cgroups and their rows, rebuilt
+        # only when cgroups are added or removed. A file missing in a cgroup
+        # is left out, so its row stays zero.
+        groups = []
+        for i, (kind, arg, start, n) in enumerate(self._parsers):
+            slots = [slot for slot in self._active if self._fds[slot][i] >= 0]
+            fds = [self._fds[slot][i] for slot in slots]
+            groups.append((kind, arg, start, n, fds, np.array(slots, dtype=np.intp)))
+        self._groups = groups
+
+    def _stat_columns(self, reads):
+        # Usually every cgroup has the cpu.stat layout seen last, so the
+        # joined tokens form a (cgroups x tokens) grid and each key is one
+        # strided slice. Otherwise fall back to splitting file by file.
+        tokens = b"".join(reads).split()
+        length, positions = self._stat_layout
+        if len(tokens) == length * len(reads) and all(
+                tokens[i - 1::length].count(k) == len(reads) for i, k in zip(positions, _CPU_STAT_TOKENS) if i):
+            return [list(map(int, tokens[i::length])) if i else [0] * len(reads) for i in positions]
+        tokens = [r.split() for r in reads]
+        lengths = set(map(len, tokens))
+        layouts = self._layouts
+        for length in lengths - layouts.keys():
+            t = next(t for t in tokens if len(t) == length)
+            layouts[length] = [t.index(k) + 1 if k in t else 0 for k in _CPU_STAT_TOKENS]
+        if len(lengths) == 1:
+            length = lengths.pop()
+            self._stat_layout = length, layouts[length]
+            return [[int(t[i]) for t in tokens] if i else [0] * len(tokens) for i in layouts[length]]
+        return list(zip(*([int(t[i]) if i else 0 for i in layouts[len(t)]] for t in tokens)))
+
+    def _psi_columns(self, reads, n):
+        # "some avg10=.. avg60=.. avg300=.. total=N\nfull ... total=M"; the
+        # full line is missing on older kernels for cpu.pressure.
+        tokens = b"".join(reads).split()
+        length = len(tokens) // len(reads)
+        if length in (5, 10) and len(tokens) == length * len(reads) and tokens[::length].count(b"some") == len(reads):
+            columns = [[int(t[6:]) for t in tokens[4::length]]]
+            if n == 2:
+                columns.append([int(t[6:]) for t in tokens[9::length]] if length == 10 else [0] * len(reads))
+            return columns
+        tokens = [r.split() for r in reads]
+        columns = [[int(t[4][6:]) for t in tokens]]
+        if n == 2:
+            columns.append([int(t[9][6:]) if len(t) > 9 else 0 for t in tokens])
+        return columns
+
+    def _find_keys(self, fd, keys):
+        buf = self._buf
+        end = os.preadv(fd, self._view, 0) + 1
+        values = []
+        for key in keys:
+            pos = buf.find(key, 0, end)
+            if pos < 0:
+                values.append(0)
+            else:
+                pos += len(key)
+                stop = buf.find(b"\n", pos, end)
+                values.append(int(buf[pos:stop if stop >= 0 else end]))
+        return values
+
+    def _read(self, kind, arg, n, fds):
+        # One file of every cgroup in fds, as n columns.
+        if kind == _KEYS:
+            return list(zip(*[self._find_keys(fd, arg) for fd in fds]))
+        pread = os.pread
+        reads = [pread(fd, SMALL_READ, 0) for fd in fds]
+        if kind == _VALUE:
+            return [list(map(int, reads))]
+        if kind == _STAT:
+            return self._stat_columns(reads)
+        return self._psi_columns(reads, n)
+
+    def _read_each(self, kind, arg, start, n, fds, rows, gone):
+        # After a failed read, one cgroup at a time: the ones that went away
+        # keep their last values and the others are still sampled.
+        prev = (self.count - 1) % self.history
+        values = []
+        for fd, slot in zip(fds, rows):
+            try:
+                values.append([column[0] for column in self._read(kind, arg, n, [fd])])
+            except OSError as e:
+                if e.errno not in (errno.ENODEV, errno.ENOENT):
+                    raise
+                gone.add(int(slot))
+                values.append(self.data[slot, start:start + n, prev])
+        return list(zip(*values))
+
+    def sample(self, ts=None):
+        if self._groups is None:
+            self._plan()
+        col = self.count % self.history
+        gone = set()
+        for kind, arg, start, n, fds, rows in self._groups:
+            if not fds:
+                continue
+            try:
+                columns = self._read(kind, arg, n, fds)
+            except OSError as e:
+                if e.errno not in (errno.ENODEV, errno.ENOENT):
+                    raise
+                columns = self._read_each(kind, arg, start, n, fds, rows, gone)
+            self.data[rows, start:start + n, col] = np.array(columns, dtype=np.int64).T
+        self.ts[col] = time.monotonic_ns() if ts is None else ts
+        self.count += 1
+        for slot in sorted(gone):
+            self.alive[slot] = False
+            self._active.remove(slot)
+            self._removed.append(self.paths[slot])
+        if gone:
+            self._groups = None
+
+    def ready(self):
+        # Rows with at least two samples of their current cgroup.
+        return self.alive & (self.count - self.since >= 2)
+
+    def _cols(self, n):
+        # Ring positions of the last n samples, oldest first.
+        n = min(n, self.count, self.history)
+        return (np.arange(self.count - n, self.count)) % self.history
+
+    def column(self, metric, age=0):
+        # Values of a metric in the sample taken age samples ago, per row.
+        return self.data[:, self.index[metric], (self.count - 1 - age) % self.history]
+
+    def series(self, metric, n=HISTORY):
+        cols = self._cols(n)
+        return self.ts[cols], self.data[:, self.index[metric], cols]
+
+    def latest(self, metric):
+        return self.column(metric)
+
+    def delta(self, metric, span=1):
+        # Counter growth over the last span samples, per cgroup.
+        cols = self._cols(span + 1)
+        if len(cols) < 2:
+            return np.zeros(self.capacity, dtype=np.int64), 0
+        values = self.data[:, self.index[metric], :]
+        return values[:, cols[-1]] - values[:, cols[0]], int(self.ts[cols[-1]] - self.ts[cols[0]])
+
+    def rate(self, metric, span=1):
+        # Per-second rate of a counter over the last span samples.
+        d, dt_ns = self.delta(metric, span)
+        return d / (dt_ns / 1e9) if dt_ns else np.zeros(self.capacity)
+
+    def cpu_usage(self, span=1):
+        # CPUs in use (usage_usec per second / 1e6).
+        return self.rate("usage_usec", span) / 1e6
+
+    def throttle_ratio(self, span=1):
+        # Fraction of CFS periods in which the cgroup was throttled.
+        throttled, _ = self.delta("nr_throttled", span)
+        periods, _ = self.delta("nr_periods", span)
+        return np.divide(throttled, periods, out=np.zeros(self.capacity), where=periods > 0)
+
+    def throttled_fraction(self, span=1):
+        # Throttled time per wall time.
+        d, dt_ns = self.delta("throttled_usec", span)
+        return d / (dt_ns / 1e3) if dt_ns else np.zeros(self.capacity)
+
+    def moving_average(self, metric, n=10):
+        # Mean of a gauge (memory.current, memory.stat sizes) over the last n samples.
+        return self.series(metric, n)[1].mean(axis=1)
+
+    def rate_series(self, metric, n=HISTORY):
+        # Per-second rate between consecutive samples, shape (cgroups x n-1).
+        ts, values = self.series(metric, n)
+        return np.diff(values, axis=1) / (np.diff(ts) / 1e9)
+
+    def close(self):
+        for path in list(self.slots):
+            self.remove(path)
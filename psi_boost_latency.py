@@ -0,0 +1,143 @@
+import os, sys, time, signal
+from multiprocessing import Process
+from cgroupfs import CGROUP_ROOT
+from process_monitoring_framework.psi import PsiWatcher, PsiPoller, PsiBooster, DEFAULT_STALL_US, DEFAULT_WINDOW_US
+
+PARENT_NAME = "psi-bench"
+TRIALS = 10
+TRIAL_TIMEOUT = 10.0
+POLL_INTERVALS = (0.001, 0.01, 0.1)
+CPU_WORKERS = 4
+CPU_QUOTA = 20000
+CPU_PERIOD = 100000
+MEMORY_HIGH = 32 * 1024 * 1024
+MEMORY_MAX = 512 * 1024 * 1024
+HOG_MB = 128
+
+
+def join_cgroup(cgroup_path):
+    with open(os.path.join(cgroup_path, "cgroup.procs"), "w") as f:
+        f.write(str(os.getpid()))
+
+
+def spin(cgroup_path):
+    # Several spinners pinned to one CPU under a 20% quota: runnable tasks
+    # wait for the CPU, which shows up as cpu.pressure "some".
+    join_cgroup(cgroup_path)
+    os.sched_setaffinity(0, {0})
+    while True:
+        pass
+
+
+def hog(cgroup_path):
+    # Anonymous memory far above memory.high: with no swap the overage cannot
+    # be reclaimed, so the task is throttled, which is a memory stall.
+    join_cgroup(cgroup_path)
+    chunks = []
+    for _ in range(HOG_MB):
+        chunks.append(bytearray(1024 * 1024))
+    signal.pause()
+
+
+def make_cgroup(parent, resource):
+    path = os.path.join(parent, "workload")
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, "cpu.max"), "w") as f:
+        f.write(f"{CPU_QUOTA} {CPU_PERIOD}")
+    with open(os.path.join(path, "memory.max"), "w") as f:
+        f.write(str(MEMORY_MAX))
+    with open(os.path.join(path, "memory.high"), "w") as f:
+        f.write(str(MEMORY_HIGH) if resource == "memory" else "max")
+    return path
+
+
+def trial(parent, resource, source):
+    path = make_cgroup(parent, resource)
+    booster = PsiBooster(source)
+    procs = []
+    try:
+        booster.add(path, (resource,))
+        target, count = (spin, CPU_WORKERS) if resource == "cpu" else (hog, 1)
+        cpu0 = time.process_time_ns()
+        start = time.monotonic_ns()
+        for _ in range(count):
+            proc = Process(target=target, args=(path,), daemon=True)
+            proc.start()
+            procs.append(proc)
+        deadline = time.monotonic() + TRIAL_TIMEOUT
+        while not booster.reactions and time.monotonic() < deadline:
+            booster.run_once(timeout=0.5)
+        wall = time.monotonic_ns() - start
+        cpu = time.process_time_ns() - cpu0
+        if not booster.reactions:
+            return None
+        event_ts, done_ts, _, _ = booster.reactions[0]
+        return done_ts - start, done_ts - event_ts, cpu / wall
+    finally:
+        for proc in procs:
+            proc.kill()
+        for proc in procs:
+            proc.join()
+        booster.close()
+        while True:
+            try:
+                os.rmdir(path)
+                break
+            except OSError:
+                time.sleep(0.01)
+
+
+def poll_cost(parent, resource):
+    path = make_cgroup(parent, resource)
+    try:
+        with PsiPoller(1.0) as poller:
+            poller.add(path, (resource,))
+            n = 10000
+            t0 = time.process_time_ns()
+            for _ in range(n):
+                poller.poll_once()
+            return (time.process_time_ns() - t0) / n
+    finally:
+        os.rmdir(path)
+
+
+def run_mode(label, parent, resource, make_source):
+    results = [r for r in (trial(parent, resource, make_source()) for _ in range(TRIALS)) if r]
+    if not results:
+        print(f"{label:<24} no trigger within {TRIAL_TIMEOUT:.0f} s")
+        return None
+    onset = sorted(r[0] for r in results)
+    react = sorted(r[1] for r in results)
+    cpu = sum(r[2] for r in results) / len(results)
+    print(f"{label:<24} {len(results):>3}/{TRIALS:<3} {onset[len(onset) // 2] / 1e6:>12.1f} {onset[-1] / 1e6:>10.1f} "
+          f"{react[len(react) // 2] / 1e3:>12.1f} {cpu * 100:>9.3f}%")
+    return cpu
+
+
+def main():
+    resource = sys.argv[1] if len(sys.argv) > 1 else "cpu"
+    if resource not in ("cpu", "memory"):
+        sys.exit("usage: psi_boost_latency.py [cpu|memory]")
+    with open(os.path.join(CGROUP_ROOT, "cgroup.subtree_control"), "w") as f:
+        f.write("+memory +cpu")
+    parent = os.path.join(CGROUP_ROOT, PARENT_NAME)
+    os.makedirs(parent, exist_ok=True)
+    with open(os.path.join(parent, "cgroup.subtree_control"), "w") as f:
+        f.write("+memory +cpu")
+    try:
+        print(f"{resource}.pressure trigger: some {DEFAULT_STALL_US} us / {DEFAULT_WINDOW_US} us, {TRIALS} trials\n")
+        print(f"{'mode':<24} {'ok':>7} {'onset p50 ms':>12} {'max ms':>10} {'react p50 us':>12} {'cpu':>10}")
+        trigger_cpu = run_mode("PSI trigger (epoll)", parent, resource, PsiWatcher)
+        for interval in POLL_INTERVALS:
+            run_mode(f"poll every {interval * 1e3:g} ms", parent, resource, lambda: PsiPoller(interval))
+        if trigger_cpu:
+            # The interval at which polling costs as much CPU as the trigger path.
+            matched = min(DEFAULT_WINDOW_US / 1e6, max(0.001, poll_cost(parent, resource) / 1e9 / trigger_cpu))
+            run_mode(f"poll at equal cpu ({matched * 1e3:.0f} ms)", parent, resource, lambda: PsiPoller(matched))
+        print("\nonset: workload start -> limit written; react: stall reported -> limit written")
+    finally:
+        os.rmdir(parent)
+
+
+if __name__ == "__main__":
+    main()
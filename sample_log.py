@@ -0,0 +1,255 @@
+import os, sys, mmap, math, struct, argparse
+from latency_hist import KNOBS, PERCENTILES, slot_of, summarize
+
+# Append-only log of latency samples for long runs: fixed-width records in a
+# file that is mmap'ed and grown in chunks, so samples are neither kept in
+# Python lists nor lost when the run dies. Record layout (little-endian, 32
+# bytes, u64 fields first so a NumPy memmap of the file is aligned):
+#   ts, cgroup_id, latency_ns: u64   knob, path, metric: u8 codes   5 pad
+# The header holds the number of complete records; bytes past it are spare
+# capacity (or a torn record after a crash) and are ignored by readers.
+MAGIC = b"CGSLOG01"
+HEADER = struct.Struct("<8sIIQ")        # magic, record size, unused, count
+HEADER_SIZE = 64
+COUNT_OFFSET = 16
+RECORD = struct.Struct("<QQQBBB5x")
+CHUNK_RECORDS = 1 << 16                 # 2 MiB per growth step
+
+# Codes are indexes into these tuples; only append to them.
+PATHS = ("raw", "cli", "api")
+METRICS = ("issue_to_write", "dockerd_to_write", "write_to_effect", "issue_to_effect",
+           "write_to_reclaim", "write_to_reclaim_end")
+_KNOB_CODE = {k: i for i, k in enumerate(KNOBS)}
+_PATH_CODE = {p: i for i, p in enumerate(PATHS)}
+_METRIC_CODE = {m: i for i, m in enumerate(METRICS)}
+FIELDS = ("ts", "cgroup_id", "latency_ns", "knob", "path", "metric")
+
+
+def record_dtype():
+    import numpy as np
+
+    return np.dtype([("ts", "<u8"), ("cgroup_id", "<u8"), ("latency_ns", "<u8"),
+                     ("knob", "u1"), ("path", "u1"), ("metric", "u1"), ("_pad", "V5")])
+
+
+def _read_count(buf, path):
+    magic, size, _, count = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or size != RECORD.size:
+        raise ValueError(f"{path}: not a sample log (or another record layout)")
+    return count
+
+
+class SampleLog:
+    # Writer. Opening an existing log appends after its last complete record.
+    # One writer per file; append() is not locked.
+
+    def __init__(self, path, chunk_records=CHUNK_RECORDS):
+        self.path = path
+        self.chunk = chunk_records * RECORD.size
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            size = os.fstat(self.fd).st_size
+            if size:
+                self.count = _read_count(os.pread(self.fd, HEADER.size, 0), path)
+            else:
+                self.count = 0
+            end = HEADER_SIZE + self.count * RECORD.size
+            os.ftruncate(self.fd, max(size, end + self.chunk))
+            self._map = mmap.mmap(self.fd, 0)
+        except BaseException:
+            os.close(self.fd)
+            raise
+        HEADER.pack_into(self._map, 0, MAGIC, RECORD.size, 0, self.count)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def append(self, ts, cgroup_id, knob, path, metric, latency_ns):
+        off = HEADER_SIZE + self.count * RECORD.size
+        if off + RECORD.size > len(self._map):
+            # ftruncate + mremap; earlier records stay where they are.
+            self._map.resize(len(self._map) + self.chunk)
+        RECORD.pack_into(self._map, off, ts, cgroup_id, latency_ns,
+                         _KNOB_CODE[knob], _PATH_CODE[path], _METRIC_CODE[metric])
+        # The count is bumped after the record, so it never covers a torn one.
+        self.count += 1
+        struct.pack_into("<Q", self._map, COUNT_OFFSET, self.count)
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        if self._map is None:
+            return
+        self._map.flush()
+        self._map.close()
+        self._map = None
+        # Drop the spare capacity.
+        os.ftruncate(self.fd, HEADER_SIZE + self.count * RECORD.size)
+        os.close(self.fd)
+
+
+class SampleReader:
+    # Read side. Sees the records complete when it was opened, also while a
+    # writer is still appending. Aggregates either with NumPy over a memmap
+    # of the file (exact nearest-rank percentiles, the same as cgbench) or,
+    # without NumPy or with stream=True, in one pass over the records into
+    # log-linear histograms (percentiles within one bucket, 12.5%).
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.count = _read_count(f.read(HEADER.size), path)
+
+    def __len__(self):
+        return self.count
+
+    def records(self, chunk_records=CHUNK_RECORDS):
+        # Yields (ts, cgroup_id, latency_ns, knob, path, metric) tuples with
+        # the codes decoded, reading chunk_records at a time.
+        end = HEADER_SIZE + self.count * RECORD.size
+        step = chunk_records * RECORD.size
+        with open(self.path, "rb") as f:
+            f.seek(HEADER_SIZE)
+            pos = HEADER_SIZE
+            while pos < end:
+                buf = f.read(min(step, end - pos))
+                if not buf:
+                    break
+                pos += len(buf)
+                for ts, cgid, ns, knob, path, metric in RECORD.iter_unpack(buf):
+                    yield ts, cgid, ns, KNOBS[knob], PATHS[path], METRICS[metric]
+
+    def array(self):
+        import numpy as np
+
+        if not self.count:
+            return np.zeros(0, dtype=record_dtype())
+        return np.memmap(self.path, dtype=record_dtype(), mode="r", offset=HEADER_SIZE, shape=(self.count,))
+
+    def summary(self, since=None, until=None, bucket_ns=None, stream=False):
+        # {(bucket start ts or None, knob, path, metric): stats row}, rows in
+        # cgbench's format (count, mean_ms, pNN_ms, max_ms). since/until are
+        # ts bounds in ns; bucket_ns splits the rows into time buckets.
+        if not stream:
+            try:
+                return self._summary_numpy(since, until, bucket_ns)
+            except ImportError:
+                pass
+        return self._summary_stream(since, until, bucket_ns)
+
+    def _summary_stream(self, since, until, bucket_ns):
+        groups = {}
+        for ts, _, ns, knob, path, metric in self.records():
+            if (since is not None and ts < since) or (until is not None and ts >= until):
+                continue
+            bucket = ts - ts % bucket_ns if bucket_ns else None
+            g = groups.get((bucket, knob, path, metric))
+            if g is None:
+                g = groups[(bucket, knob, path, metric)] = [{}, 0, 0]
+            hist = g[0]
+            slot = slot_of(ns)
+            hist[slot] = hist.get(slot, 0) + 1
+            g[1] += ns
+            if ns > g[2]:
+                g[2] = ns
+        rows = {}
+        for key, (hist, total, max_ns) in sorted(groups.items(), key=_group_order):
+            s = summarize(hist, max_ns)
+            row = {"count": s["count"], "mean_ms": total / s["count"] / 1e6}
+            for q in PERCENTILES:
+                row[f"p{q:g}_ms"] = s[f"p{q:g}"] / 1e6
+            row["max_ms"] = max_ns / 1e6
+            rows[key] = row
+        return rows
+
+    def _summary_numpy(self, since, until, bucket_ns):
+        import numpy as np
+
+        a = self.array()
+        ts = a["ts"]
+        mask = np.ones(len(a), dtype=bool)
+        if since is not None:
+            mask &= ts >= since
+        if until is not None:
+            mask &= ts < until
+        ts = ts[mask]
+        lat = a["latency_ns"][mask]
+        if not len(lat):
+            return {}
+        code = (a["knob"][mask].astype(np.uint64) << 16) | (a["path"][mask].astype(np.uint64) << 8) \
+            | a["metric"][mask].astype(np.uint64)
+        bucket = ts - ts % np.uint64(bucket_ns) if bucket_ns else np.zeros(len(ts), dtype=np.uint64)
+        # Sorted by group, latency within a group: every group is one slice
+        # and its percentiles are plain index lookups.
+        order = np.lexsort((lat, code, bucket))
+        lat, code, bucket = lat[order], code[order], bucket[order]
+        starts = np.flatnonzero(np.r_[True, (code[1:] != code[:-1]) | (bucket[1:] != bucket[:-1])])
+        ends = np.r_[starts[1:], len(lat)]
+        rows = {}
+        for lo, hi in zip(starts.tolist(), ends.tolist()):
+            c = int(code[lo])
+            key = (int(bucket[lo]) if bucket_ns else None, KNOBS[c >> 16], PATHS[(c >> 8) & 0xff], METRICS[c & 0xff])
+            group = lat[lo:hi]
+            n = hi - lo
+            row = {"count": n, "mean_ms": float(group.mean()) / 1e6}
+            for q in PERCENTILES:
+                row[f"p{q:g}_ms"] = int(group[max(0, min(n - 1, math.ceil(q / 100 * n) - 1))]) / 1e6
+            row["max_ms"] = int(group[-1]) / 1e6
+            rows[key] = row
+        return dict(sorted(rows.items(), key=_group_order))
+
+
+def _group_order(item):
+    bucket, knob, path, metric = item[0]
+    return (bucket or 0, PATHS.index(path), KNOBS.index(knob), METRICS.index(metric))
+
+
+def print_summary(rows, out=sys.stdout):
+    cols = ["mean_ms"] + [f"p{q:g}_ms" for q in PERCENTILES] + ["max_ms"]
+    bucketed = any(key[0] is not None for key in rows)
+    t0 = min(key[0] for key in rows) if bucketed else 0
+    out.write((f"{'t+s':>8} " if bucketed else "") + f"{'path':<5} {'knob':<11} {'metric':<20} {'count':>9} "
+              + " ".join(f"{c[:-3]:>9}" for c in cols) + "\n")
+    for (bucket, knob, path, metric), row in rows.items():
+        out.write((f"{(bucket - t0) / 1e9:>8.1f} " if bucketed else "") + f"{path:<5} {knob:<11} {metric:<20} "
+                  f"{row['count']:>9} " + " ".join(f"{row[c]:>9.3f}" for c in cols) + "\n")
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Summarize a sample log (cgbench.py --log)")
+    p.add_argument("log")
+    p.add_argument("--bucket", type=float, help="aggregate per time bucket of this many seconds")
+    p.add_argument("--since", type=float, help="skip samples before this many seconds into the log")
+    p.add_argument("--until", type=float, help="skip samples from this many seconds into the log")
+    p.add_argument("--stream", action="store_true", help="one pass into histograms instead of a NumPy memmap")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    reader = SampleReader(args.log)
+    if not len(reader):
+        print(f"{args.log}: no samples")
+        return 0
+    first = next(reader.records(1))[0]
+    since = first + int(args.since * 1e9) if args.since is not None else None
+    until = first + int(args.until * 1e9) if args.until is not None else None
+    bucket_ns = int(args.bucket * 1e9) if args.bucket else None
+    print(f"{args.log}: {len(reader)} samples")
+    rows = reader.summary(since, until, bucket_ns, args.stream)
+    if not rows:
+        print("no samples in the selected range")
+        return 0
+    print_summary(rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+import os, time, argparse
+from cgroupfs import CgroupFS, FakeCgroupFS
+from process_monitoring_framework.vector_sampler import VectorSampler, CPU_STAT_KEYS, MEMORY_STAT_KEYS
+
+PARENT_NAME = "sampler-bench"
+CGROUP_COUNTS = (10, 100, 500)
+DURATION = 2.0
+
+
+def setup_cgroups(fs, parent, count):
+    fs.mkdir(parent)
+    fs.enable_controllers(parent)
+    paths = []
+    for i in range(count):
+        path = os.path.join(parent, f"cg-{i}")
+        fs.mkdir(path)
+        paths.append(path)
+    return paths
+
+
+def teardown_cgroups(fs, parent):
+    # Children first: a cgroup with children can't be removed. Walks the
+    # directory rather than a path list, so it also clears what a failed
+    # setup or an earlier run left behind.
+    if not os.path.isdir(parent):
+        return
+    for name in sorted(os.listdir(parent)):
+        if os.path.isdir(os.path.join(parent, name)):
+            fs.rmdir(os.path.join(parent, name))
+    fs.rmdir(parent)
+
+
+def naive_sample(paths):
+    # What the scripts used to do: open, read and parse every file into dicts.
+    out = []
+    for path in paths:
+        with open(os.path.join(path, "memory.current")) as f:
+            current = int(f.read())
+        with open(os.path.join(path, "cpu.stat")) as f:
+            cpu = dict((k, int(v)) for k, v in (line.split() for line in f))
+        with open(os.path.join(path, "memory.stat")) as f:
+            mem = dict((k, int(v)) for k, v in (line.split() for line in f))
+        out.append([current] + [cpu.get(k, 0) for k in CPU_STAT_KEYS] + [mem.get(k, 0) for k in MEMORY_STAT_KEYS])
+    return out
+
+
+def rate(fn, count):
+    n = 0
+    t0 = time.perf_counter()
+    deadline = t0 + DURATION
+    while time.perf_counter() < deadline:
+        fn()
+        n += 1
+    return n * count / (time.perf_counter() - t0)
+
+
+def bench(paths):
+    naive = rate(lambda: naive_sample(paths), len(paths))
+    with VectorSampler(paths) as sampler:
+        vector = rate(sampler.sample, len(paths))
+
+        def analyze():
+            sampler.cpu_usage()
+            sampler.throttle_ratio()
+            sampler.moving_average("memory_current")
+
+        t0 = time.perf_counter()
+        for _ in range(1000):
+            analyze()
+        analysis_us = (time.perf_counter() - t0) / 1000 * 1e6
+    print(f"{len(paths):>8} {naive:>16.0f} {vector:>16.0f} {vector / naive:>8.2f}x {analysis_us:>14.1f}")
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="VectorSampler against an open-and-parse loop")
+    p.add_argument("parent", nargs="?", help="sample the existing child cgroups of this directory instead")
+    p.add_argument("--fake", action="store_true", help="rootless run on a FakeCgroupFS tree")
+    args = p.parse_args(argv)
+
+    print(f"{'cgroups':>8} {'naive samples/s':>16} {'vector samples/s':>16} {'speedup':>9} {'analysis us':>14}")
+    if args.parent:
+        parent = args.parent
+        bench(sorted(os.path.join(parent, d) for d in os.listdir(parent) if os.path.isdir(os.path.join(parent, d))))
+        return
+    fs = FakeCgroupFS() if args.fake else CgroupFS()
+    parent = fs.path(PARENT_NAME)
+    try:
+        paths = setup_cgroups(fs, parent, max(CGROUP_COUNTS))
+        for count in CGROUP_COUNTS:
+            bench(paths[:count])
+    finally:
+        teardown_cgroups(fs, parent)
+        if fs.fake:
+            fs.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+from cgroupfs import FakeCgroupFS
+from cgroup_writer import CgroupWriter
+from bulk_update import BulkUpdater
+
+MIB = 1024 * 1024
+
+
+def test_writer_counters_across_workers():
+    with FakeCgroupFS() as fs:
+        paths = []
+        for i in range(64):
+            path = fs.path(f"cg-{i}")
+            fs.mkdir(path)
+            paths.append(path)
+        writer = CgroupWriter(fs=fs, shadow=True)
+        with BulkUpdater(workers=8, writer=writer) as updater:
+            for limit in (128, 256, 256):
+                result = updater.apply([(p, {"memory.max": limit * MIB, "cpu.max": "50000 100000"}) for p in paths])
+                assert not result.failed
+        # cpu.max repeats after the first round, memory.max after the second.
+        assert writer.writes == 64 * 2 + 64 + 0
+        assert writer.suppressed == 64 + 64 * 2
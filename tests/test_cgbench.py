@@ -0,0 +1,25 @@
+import json
+import cgbench
+
+RUN = ["--fake", "-n", "5", "--warmup", "1"]
+
+
+def test_json_stdout_with_baseline(tmp_path, capsys):
+    baseline = str(tmp_path / "baseline.json")
+    assert cgbench.main(RUN + ["-f", "json", "-o", baseline]) == 0
+    capsys.readouterr()
+    # threshold -100: every row is flagged, so the regression line is printed.
+    assert cgbench.main(RUN + ["-f", "json", "--baseline", baseline, "--threshold", "-100"]) == 1
+    out, err = capsys.readouterr()
+    report = json.loads(out)
+    assert {r["path"] for r in report["results"]} == {"raw", "api"}
+    assert "REGRESSION" in err and "regression(s) above -100%" in err
+
+
+def test_text_compare_on_stdout(tmp_path, capsys):
+    baseline = str(tmp_path / "baseline.json")
+    assert cgbench.main(RUN + ["-f", "json", "-o", baseline]) == 0
+    capsys.readouterr()
+    assert cgbench.main(["--compare", baseline, "--baseline", baseline]) == 0
+    out, err = capsys.readouterr()
+    assert "baseline" in out and "REGRESSION" not in out and not err
@@ -0,0 +1,82 @@
+import json, random, re
+import pytest
+from process_monitoring_framework.classifier import RULE_FIELDS, Rule, RuleMatcher, load_rules, match_linear
+
+
+def values(comm="sh", exe="/usr/bin/sh", parent="bash", cgroup="/sys/fs/cgroup/user.slice"):
+    return {"comm": comm, "exe": exe, "parent": parent, "cgroup": cgroup}
+
+
+def write_config(tmp_path, classes, rules):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"classes": classes, "rules": rules}))
+    return str(path)
+
+
+def test_matches_linear_scan():
+    # Overlapping exact and prefix patterns over a small alphabet, so most
+    # lookups see several candidates.
+    rnd = random.Random(3)
+    words = ["a", "ab", "abc", "b", "ba", "x"]
+
+    def pattern():
+        word = rnd.choice(words)
+        return word + "*" if rnd.random() < 0.5 else word
+
+    rules = []
+    for i in range(300):
+        fields = rnd.sample(RULE_FIELDS, rnd.randrange(4))
+        rules.append(Rule(i, "c", **{field: pattern() for field in fields}))
+    matcher = RuleMatcher(rules)
+    for _ in range(2000):
+        v = {field: rnd.choice(words + ["abcd", "", None]) for field in RULE_FIELDS}
+        assert matcher.match(v) == match_linear(rules, v)
+
+
+def test_comm_patterns_are_truncated():
+    # The kernel keeps 15 characters of comm; a longer pattern still matches.
+    rules = [Rule(0, "c", comm="kube-controller-manager"), Rule(1, "c", parent="containerd-shim-runc-v2*")]
+    matcher = RuleMatcher(rules)
+    assert matcher.match(values(comm="kube-controller")) == rules[0]
+    assert matcher.match(values(comm="kube-controller-manager")) is None
+    assert matcher.match(values(parent="containerd-shim")) == rules[1]
+    # exe is not truncated.
+    exe = Rule(0, "c", exe="/usr/local/bin/kube-controller-manager")
+    assert RuleMatcher([exe]).match(values(exe="/usr/local/bin/kube-controller")) is None
+
+
+def test_first_matching_rule_wins():
+    rules = [Rule(0, "a", comm="nginx*", cgroup="/sys/fs/cgroup/web.slice/*"),
+             Rule(1, "b", exe="/usr/sbin/nginx"),
+             Rule(2, "c", comm="nginx"),
+             Rule(3, "d")]
+    matcher = RuleMatcher(rules)
+    nginx = values(comm="nginx", exe="/usr/sbin/nginx")
+    assert matcher.match(nginx) == rules[1]
+    assert matcher.match(dict(nginx, cgroup="/sys/fs/cgroup/web.slice/a.scope")) == rules[0]
+    assert matcher.match(values(comm="nginx")) == rules[2]
+    assert matcher.match(values()) == rules[3]
+    assert matcher.match(values(comm=None)) == rules[3]
+
+
+def test_load_rules(tmp_path):
+    path = write_config(tmp_path, {"batch": {"cpu_weight": 50, "sched_policy": "batch"},
+                                   "rt": {"sched_policy": "fifo", "sched_priority": 10}},
+                        [{"class": "batch", "comm": "ffmpeg"}, {"class": "rt", "exe": "/opt/audio/*"}])
+    classes, rules = load_rules(path)
+    assert classes["rt"].sched_priority == 10
+    assert rules == [Rule(0, "batch", comm="ffmpeg"), Rule(1, "rt", exe="/opt/audio/*")]
+
+
+@pytest.mark.parametrize("classes,rules,message", [
+    ({"a": {}}, [{"class": "b", "comm": "x"}], "unknown class 'b'"),
+    ({"a": {}}, [{"comm": "x"}], "unknown class None"),
+    ({"a": {}}, [{"class": "a", "pid": 1}], "unknown fields ['pid']"),
+    ({"a": {"weight": 1}}, [], "unknown settings ['weight']"),
+    ({"a": {"sched_policy": "deadline"}}, [], "sched_policy must be one of"),
+    ({"a": {"sched_policy": "fifo"}}, [], "needs a sched_priority >= 1"),
+    ({"a": {"sched_policy": "rr", "sched_priority": 0}}, [], "needs a sched_priority >= 1"),
+])
+def test_load_rules_errors(tmp_path, classes, rules, message):
+    with pytest.raises(ValueError, match=re.escape(message)):
+        load_rules(write_config(tmp_path, classes, rules))
@@ -0,0 +1,108 @@
+import os
+import pytest
+from cgroupfs import FakeCgroupFS
+from cgroup_writer import CgroupWriter
+from process_monitoring_framework.controller import Controller
+from process_monitoring_framework.policy import HeadroomPolicy, Limits, Policy
+from process_monitoring_framework.vector_sampler import VectorSampler
+
+MIB = 1024 * 1024
+TICK_NS = 100_000_000
+
+
+@pytest.fixture
+def fs():
+    with FakeCgroupFS() as fs:
+        yield fs
+
+
+def cgroups(fs, count):
+    paths = []
+    for i in range(count):
+        path = fs.path(f"cg-{i}")
+        fs.mkdir(path)
+        fs.write_file(path, "memory.max", 1024 * MIB)
+        fs.write_file(path, "cpu.max", "50000 100000")
+        paths.append(path)
+    return paths
+
+
+def read(path, name):
+    with open(os.path.join(path, name)) as f:
+        return f.read().strip()
+
+
+def test_headroom_shrinks_idle_cgroups(fs):
+    paths = cgroups(fs, 3)
+    fs.set_stat(paths[0], "memory.current", f"{100 * MIB}\n")
+    # cg-1 stalls on memory for half of every tick: its limit grows.
+    with Controller(HeadroomPolicy(), writer=CgroupWriter(fs=fs)) as controller:
+        for path in paths:
+            controller.add(path)
+        for tick in range(2):
+            fs.set_stat(paths[1], "memory.pressure",
+                        f"some avg10=0.00 avg60=0.00 avg300=0.00 total={tick * 50_000}\n"
+                        "full avg10=0.00 avg60=0.00 avg300=0.00 total=0\n")
+            controller.tick(tick * TICK_NS)
+    assert read(paths[0], "memory.max") == str(125 * MIB)
+    assert read(paths[1], "memory.max") == str(1280 * MIB)
+    assert read(paths[2], "memory.max") == str(64 * MIB)
+    assert [read(p, "cpu.max") for p in paths] == ["5000 100000"] * 3
+    assert controller.stats.writes == 6
+
+
+def test_per_cgroup_decide_is_the_fallback(fs):
+    paths = cgroups(fs, 3)
+
+    class PinSecond(Policy):
+        def decide(self, cgroup_path, prev, cur, limits):
+            assert cur.ts - prev.ts == TICK_NS
+            if cgroup_path == paths[1]:
+                return limits._replace(memory_max=None)
+            return limits
+
+    with Controller(PinSecond(), writer=CgroupWriter(fs=fs)) as controller:
+        for path in paths:
+            controller.add(path)
+        controller.tick(0)
+        # A new cgroup is only decided on once it has two samples.
+        assert controller.limits[paths[1]].memory_max == 1024 * MIB
+        controller.tick(TICK_NS)
+        assert controller.limits[paths[1]] == Limits(None, 50000, 100000)
+        assert controller.stats.writes == 1
+    assert [read(p, "memory.max") for p in paths] == [str(1024 * MIB), "max", str(1024 * MIB)]
+
+
+def test_removed_cgroup_frees_its_row(fs):
+    paths = cgroups(fs, 2)
+    with Controller(HeadroomPolicy(), writer=CgroupWriter(fs=fs), dry_run=True) as controller:
+        for path in paths:
+            controller.add(path)
+        controller.tick(0)
+        controller.remove(paths[0])
+        assert controller.sampler.cgroups() == [paths[1]]
+        # The freed row is reused with the new cgroup's limits.
+        extra = cgroups(fs, 3)[2]
+        controller.add(extra)
+        assert controller.sampler.slots[extra] == 0
+        assert controller.limits[extra] == Limits(1024 * MIB, 50000, 100000)
+
+
+def test_vector_sampler_mixed_cpu_stat_layouts(fs):
+    paths = cgroups(fs, 3)
+    fs.set_stat(paths[0], "cpu.stat", "usage_usec 7\nuser_usec 5\nsystem_usec 2\n")
+    fs.set_stat(paths[1], "cpu.stat", "usage_usec 9\nuser_usec 5\nsystem_usec 4\n"
+                                      "nr_periods 10\nnr_throttled 3\nthrottled_usec 400\n")
+    with VectorSampler(paths, files=("cpu.stat",)) as sampler:
+        sampler.sample(0)
+        assert sampler.column("usage_usec")[:3].tolist() == [7, 9, 0]
+        assert sampler.column("nr_throttled")[:3].tolist() == [0, 3, 0]
+        assert sampler.column("throttled_usec")[:3].tolist() == [0, 400, 0]
+        # Same layout everywhere again: the strided fast path.
+        fs.set_stat(paths[0], "cpu.stat", "usage_usec 8\nuser_usec 5\nsystem_usec 3\n"
+                                          "nr_periods 1\nnr_throttled 1\nthrottled_usec 50\n")
+        fs.set_stat(paths[2], "cpu.stat", "usage_usec 1\nuser_usec 1\nsystem_usec 0\n"
+                                          "nr_periods 2\nnr_throttled 0\nthrottled_usec 0\n")
+        sampler.sample(TICK_NS)
+        assert sampler.column("usage_usec")[:3].tolist() == [8, 9, 1]
+        assert sampler.column("throttled_usec")[:3].tolist() == [50, 400, 0]
@@ -0,0 +1,169 @@
+import os, json, queue, shutil, socket, tempfile, threading, time
+import pytest
+from cgroupfs import FakeCgroupFS
+from docker_api import DockerAPIError, DockerClient, UnixHTTPConnection
+from fake_dockerd import FakeDockerd
+
+
+@pytest.fixture
+def sock_dir():
+    # Short path: unix socket paths are limited to 108 bytes.
+    path = tempfile.mkdtemp(prefix="dapi-", dir="/tmp")
+    yield path
+    shutil.rmtree(path, ignore_errors=True)
+
+
+@pytest.fixture
+def cgfs():
+    with FakeCgroupFS() as fs:
+        yield fs
+
+
+def start(sock_dir, **kwargs):
+    server = FakeDockerd(os.path.join(sock_dir, "docker.sock"), **kwargs)
+    server.start()
+    return server
+
+
+@pytest.fixture
+def dockerd(sock_dir, cgfs):
+    server = start(sock_dir, fs=cgfs)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def read(path, name):
+    with open(os.path.join(path, name)) as f:
+        return f.read().strip()
+
+
+def test_update_inspect_round_trip(dockerd, cgfs):
+    path = cgfs.path("web")
+    cgfs.mkdir(path)
+    cid = dockerd.add_container("web", path)
+    with DockerClient(dockerd.socket_path, version="1.43") as client:
+        assert client.update("web", memory=256 * 1024 * 1024, cpus=1.5) == {"Warnings": []}
+        info = client.inspect("web")
+    assert info["Id"] == cid
+    assert info["HostConfig"]["Memory"] == 256 * 1024 * 1024
+    assert info["HostConfig"]["NanoCpus"] == 1_500_000_000
+    assert read(path, "memory.max") == str(256 * 1024 * 1024)
+    assert read(path, "cpu.max") == "150000 100000"
+
+
+def test_keep_alive_reuses_one_connection(dockerd):
+    dockerd.add_container("web")
+    with DockerClient(dockerd.socket_path) as client:
+        for i in range(50):
+            client.update("web", memory=(100 + i) * 1024 * 1024)
+            client.inspect("web")
+    assert dockerd.updates == 50
+    assert dockerd.accepts == 1
+
+
+def test_pipelined_responses_in_order(dockerd):
+    names = [f"c{i}" for i in range(20)]
+    ids = [dockerd.add_container(name) for name in names]
+    conn = UnixHTTPConnection(dockerd.socket_path, timeout=5)
+    try:
+        for name in names:
+            conn.send_request("GET", f"/containers/{name}/json")
+        responses = [conn.read_response() for _ in names]
+    finally:
+        conn.close()
+    assert [status for status, _, _ in responses] == [200] * len(names)
+    assert [json.loads(body)["Id"] for _, _, body in responses] == ids
+
+    with DockerClient(dockerd.socket_path) as client:
+        results = client.update_pipelined((name, {"memory": (i + 1) * 1024 * 1024}) for i, name in enumerate(names))
+        assert results == [{"Warnings": []}] * len(names)
+        assert [client.inspect(name)["HostConfig"]["Memory"] for name in names] == \
+               [(i + 1) * 1024 * 1024 for i in range(len(names))]
+    assert dockerd.accepts == 2
+
+
+def test_events_stream(dockerd):
+    cid = dockerd.add_container("web")
+    received = queue.Queue()
+    with DockerClient(dockerd.socket_path) as client:
+        events = client.events()
+
+        def consume():
+            for ev in events:
+                received.put(ev)
+                if received.qsize() == 3:
+                    return
+
+        consumer = threading.Thread(target=consume, daemon=True)
+        consumer.start()
+        deadline = time.monotonic() + 5
+        while not dockerd._subscribers and time.monotonic() < deadline:
+            time.sleep(0.01)
+        for i in range(3):
+            client.update("web", memory=(i + 1) * 1024 * 1024)
+        consumer.join(5)
+        events.close()
+    got = [received.get(timeout=1) for _ in range(3)]
+    assert [(ev["Type"], ev["Action"], ev["Actor"]["ID"]) for ev in got] == [("container", "update", cid)] * 3
+    assert [ev["timeNano"] for ev in got] == sorted(ev["timeNano"] for ev in got)
+
+
+def test_error_status(dockerd):
+    dockerd.add_container("web")
+    with DockerClient(dockerd.socket_path) as client:
+        with pytest.raises(DockerAPIError) as err:
+            client.update("missing", memory=1024 * 1024)
+        assert err.value.status == 404
+        assert "No such container" in err.value.message
+        with pytest.raises(DockerAPIError) as err:
+            client.request("GET", "/nope")
+        assert err.value.status == 404
+        # The connection survives error responses.
+        assert client.inspect("web")["Name"] == "/web"
+    assert dockerd.accepts == 1
+
+
+def test_reconnect_after_server_close(sock_dir):
+    server = start(sock_dir, idle_timeout=0.1)
+    try:
+        server.add_container("web")
+        with DockerClient(server.socket_path) as client:
+            client.update("web", memory=1024 * 1024)
+            time.sleep(0.5)
+            # The pooled connection was closed by the server while idle.
+            client.update("web", memory=2 * 1024 * 1024)
+            assert client.inspect("web")["HostConfig"]["Memory"] == 2 * 1024 * 1024
+        assert server.accepts == 2
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_no_retry_on_fresh_connection(sock_dir):
+    server = start(sock_dir)
+    path = server.socket_path
+    server.shutdown()
+    server.server_close()
+    with DockerClient(path) as client:
+        with pytest.raises(OSError):
+            client.inspect("web")
+
+
+def test_refused_socket_raises_connect_error(sock_dir):
+    # Bound but not listening: connect() is refused before any connection exists.
+    path = os.path.join(sock_dir, "refused.sock")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    try:
+        with DockerClient(path) as client:
+            with pytest.raises(ConnectionRefusedError):
+                client.inspect("web")
+    finally:
+        sock.close()
+
+
+def test_missing_socket_raises_not_found(sock_dir):
+    with DockerClient(os.path.join(sock_dir, "missing.sock")) as client:
+        with pytest.raises(FileNotFoundError):
+            client.update("web", memory=1024 * 1024)
@@ -0,0 +1,87 @@
+import os, gzip, http.client, types
+import pytest
+from cgroupfs import FakeCgroupFS, FakeWriteTracer, cgroup_id
+from latency_hist import slot_of
+from process_monitoring_framework.exporter import MetricsExporter, latency_source
+
+
+class HistTracer(FakeWriteTracer):
+    # FakeWriteTracer plus fixed histograms, as WriteTracer would report them.
+
+    def latency_histograms(self):
+        return {("memory.max", "raw"): {slot_of(5000): 3, slot_of(2_000_000): 1}}
+
+    def latency_max(self):
+        return {("memory.max", "raw"): 2_100_000}
+
+
+@pytest.fixture
+def fs():
+    with FakeCgroupFS() as fs:
+        yield fs
+
+
+def test_latency_histogram_families(fs):
+    with HistTracer(fs) as tracer:
+        lines = latency_source(tracer)()
+    assert 'cgroup_write_latency_seconds_bucket{knob="memory.max",path="raw",le="+Inf"} 4' in lines
+    assert 'cgroup_write_latency_seconds_count{knob="memory.max",path="raw"} 4' in lines
+    # 5 us lands in the 2^13 ns bucket, 2 ms in the 2^21 ns one.
+    assert 'cgroup_write_latency_seconds_bucket{knob="memory.max",path="raw",le="8.192e-06"} 3' in lines
+    assert 'cgroup_write_latency_seconds_bucket{knob="memory.max",path="raw",le="0.002097152"} 4' in lines
+
+
+def test_watch_follows_removed_and_recreated_cgroups(fs):
+    paths = [fs.path(f"cg-{i}") for i in range(3)]
+    for path in paths:
+        fs.mkdir(path)
+    controller = types.SimpleNamespace(limits=dict.fromkeys(paths))
+    with HistTracer(fs) as tracer:
+        render = latency_source(tracer, controller)
+        render()
+        assert tracer._watched == {(cgroup_id(p), n) for p in paths for n in ("memory.max", "cpu.max")}
+
+        # Removed before the controller drops it: the render still works.
+        old_id = cgroup_id(paths[0])
+        fs.rmdir(paths[0])
+        assert render()
+        assert (old_id, "memory.max") in tracer._watched
+
+        # Recreated at the same path: watched again under the new id. (The
+        # old directory is kept under another name so the new one cannot
+        # reuse its inode number.)
+        fs.mkdir(paths[0])
+        render()
+        old_id = cgroup_id(paths[0])
+        os.rename(paths[0], paths[0] + "-old")
+        fs.mkdir(paths[0])
+        render()
+        assert (cgroup_id(paths[0]), "memory.max") in tracer._watched
+        assert (old_id, "memory.max") not in tracer._watched
+        fs.write_file(paths[0], "memory.max", 64 * 1024 * 1024)
+        assert [ev.cgroup_id for ev in tracer.drain()] == [cgroup_id(paths[0])]
+
+        # Dropped by the controller: unwatched, even though it is gone.
+        fs.rmdir(paths[0])
+        del controller.limits[paths[0]]
+        render()
+        assert {cgid for cgid, _ in tracer._watched} == {cgroup_id(p) for p in paths[1:]}
+
+
+def test_exporter_serves_snapshot(fs):
+    with HistTracer(fs) as tracer:
+        with MetricsExporter([latency_source(tracer)], port=0, interval=3600).start() as exporter:
+            conn = http.client.HTTPConnection("127.0.0.1", exporter.port, timeout=5)
+            try:
+                conn.request("GET", "/metrics", headers={"Accept-Encoding": "gzip"})
+                resp = conn.getresponse()
+                body = gzip.decompress(resp.read()).decode()
+                conn.request("GET", "/other")
+                missing = conn.getresponse()
+                missing.read()
+            finally:
+                conn.close()
+    assert resp.status == 200 and missing.status == 404
+    assert "cgroup_write_latency_seconds_count" in body
+    assert "cgroup_exporter_rebuild_errors_total 0" in body
+    assert exporter.rebuilds == 1
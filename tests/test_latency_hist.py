@@ -0,0 +1,64 @@
+import os, re, random
+from latency_hist import SUB_BITS, slot_bounds, slot_of
+
+WRITE_TRACER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "write_tracer.py")
+MAX_NS = 10 * 10**9
+
+
+def bpf_log2l(v):
+    # bcc's helper: floor(log2(v)) + 1, i.e. the bit length.
+    return v.bit_length()
+
+
+def c_hist_slot(v):
+    # hist_slot() from the BPF program in write_tracer.py, line for line.
+    if v < (1 << SUB_BITS):
+        return v
+    l = bpf_log2l(v) - 1
+    return ((l - SUB_BITS + 1) << SUB_BITS) | ((v >> (l - SUB_BITS)) & ((1 << SUB_BITS) - 1))
+
+
+def sample_values():
+    # Every value up to 64 Ki, both edges of every sub-bucket up to 10 s,
+    # and random values in between.
+    values = set(range(1, 1 << 16))
+    for log2 in range(SUB_BITS, MAX_NS.bit_length()):
+        step = 1 << (log2 - SUB_BITS)
+        for sub in range(1 << SUB_BITS):
+            lo = (1 << log2) + sub * step
+            values.update((lo, lo + step - 1))
+    rng = random.Random(5)
+    values.update(rng.randrange(1, MAX_NS) for _ in range(100000))
+    return sorted(v for v in values if v <= MAX_NS)
+
+
+def test_bpf_source_matches_port():
+    with open(WRITE_TRACER) as f:
+        source = f.read()
+    body = re.search(r"static inline u64 hist_slot\(u64 v\) \{(.*?)\n\}", source, re.S).group(1)
+    assert "u64 l = bpf_log2l(v) - 1;" in body
+    assert "((l - HIST_SUB_BITS + 1) << HIST_SUB_BITS)" in body
+    assert f"#define HIST_SUB_BITS {SUB_BITS}" in source
+
+
+def test_kernel_slots_match_decoder():
+    for v in sample_values():
+        slot = c_hist_slot(v)
+        assert slot == slot_of(v), v
+        lo, hi = slot_bounds(slot)
+        assert lo <= v < hi, (v, lo, hi)
+
+
+def test_every_octave_split():
+    # All sub-buckets of an octave are used, not just its upper half.
+    for log2 in range(SUB_BITS, MAX_NS.bit_length() - 1):
+        slots = {c_hist_slot(v) for v in range(1 << log2, 2 << log2, max(1, (1 << log2) >> SUB_BITS))}
+        assert len(slots) == 1 << SUB_BITS, log2
+
+
+def test_known_values():
+    assert slot_bounds(c_hist_slot(8)) == (8, 9)
+    lo, hi = slot_bounds(c_hist_slot(1000))
+    assert (lo, hi) == (960, 1024)
+    lo, hi = slot_bounds(c_hist_slot(8_900_000))
+    assert lo <= 8_900_000 < hi and hi - lo <= lo / 8
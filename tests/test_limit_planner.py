@@ -0,0 +1,59 @@
+import os
+import pytest
+from cgroupfs import FakeCgroupFS
+from limit_planner import LimitPlanner
+
+
+@pytest.fixture
+def tree():
+    with FakeCgroupFS() as fs:
+        parent = fs.path("planner.slice")
+        fs.mkdir(parent)
+        paths = [os.path.join(parent, f"cg-{i}") for i in range(3)]
+        for path in paths:
+            fs.mkdir(path)
+        with LimitPlanner(fs=fs) as planner:
+            yield planner, parent, paths
+
+
+def read(path, name):
+    with open(os.path.join(path, name)) as f:
+        return f.read().strip()
+
+
+def test_per_child_caps_by_default(tree):
+    planner, parent, paths = tree
+    result = planner.tick({p: 0.5 * (i + 1) for i, p in enumerate(paths)})
+    assert not result.failed
+    assert [read(p, "cpu.max") for p in paths] == ["50000 100000", "100000 100000", "150000 100000"]
+    assert read(parent, "cpu.max") == "max 100000"
+
+
+def test_shared_parent_is_grouped(tree):
+    planner, parent, paths = tree
+    budgets = {p: 0.5 * (i + 1) for i, p in enumerate(paths)}
+    planner.tick(budgets, shared={parent})
+    assert read(parent, "cpu.max") == "300000 100000"
+    assert [read(p, "cpu.max") for p in paths] == ["max 100000"] * 3
+    weights = [int(read(p, "cpu.weight")) for p in paths]
+    assert weights[1] == 2 * weights[0] and weights[2] == 3 * weights[0]
+    # Proportional rescale: only the parent changes.
+    assert planner.plan({p: b * 2 for p, b in budgets.items()}, shared={parent}) == \
+           [(parent, "cpu.max", b"600000 100000")]
+
+    # A strict child keeps the whole group on per-child caps.
+    planner.tick(budgets, strict={paths[0]}, shared={parent})
+    assert [read(p, "cpu.max") for p in paths] == ["50000 100000", "100000 100000", "150000 100000"]
+    assert read(parent, "cpu.max") == "max 100000"
+
+
+def test_leaving_shared_caps_children_first(tree):
+    planner, parent, paths = tree
+    budgets = {p: 1.0 for p in paths}
+    planner.tick(budgets, shared={parent})
+    writes = planner.plan(budgets)
+    # Children are capped before the group cap is lifted.
+    assert writes[-1] == (parent, "cpu.max", b"max 100000")
+    assert {w[0] for w in writes[:-1]} == set(paths)
+    planner.apply(writes)
+    assert [read(p, "cpu.max") for p in paths] == ["100000 100000"] * 3
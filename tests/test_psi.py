@@ -0,0 +1,40 @@
+import os
+from cgroupfs import FakeCgroupFS
+from cgroup_writer import CgroupWriter
+from process_monitoring_framework.psi import PsiBooster
+
+MIB = 1024 * 1024
+
+
+class NullSource:
+    def add(self, cgroup_path, resources):
+        pass
+
+    def remove(self, cgroup_path):
+        pass
+
+    def close(self):
+        pass
+
+
+def read(path, name):
+    with open(os.path.join(path, name)) as f:
+        return f.read().strip()
+
+
+def test_memory_high_grows_up_to_the_new_max():
+    with FakeCgroupFS() as fs:
+        path = fs.path("cg")
+        fs.mkdir(path)
+        fs.write_file(path, "memory.max", 100 * MIB)
+        fs.write_file(path, "memory.high", 90 * MIB)
+        with PsiBooster(NullSource(), writer=CgroupWriter(fs=fs), mem_boost=1.5) as booster:
+            booster.add(path)
+            booster.boost(path, "memory")
+            # 135 MiB is above the old max of 100 MiB but below the new 150 MiB.
+            assert read(path, "memory.max") == str(150 * MIB)
+            assert read(path, "memory.high") == str(135 * MIB)
+            booster.boost(path, "memory")
+            assert read(path, "memory.max") == str(225 * MIB)
+            assert read(path, "memory.high") == str(int(202.5 * MIB))
+            assert booster.boosts == 2
@@ -0,0 +1,71 @@
+import os, random
+import pytest
+from sample_log import HEADER_SIZE, RECORD, SampleLog, SampleReader, main
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    return str(tmp_path / "samples.log")
+
+
+def fill(log, n, seed=0, t0=1_000_000_000):
+    rnd = random.Random(seed)
+    for i in range(n):
+        log.append(t0 + i * 1_000_000, 42, rnd.choice(("memory.max", "cpu.max")), rnd.choice(("raw", "api")),
+                   "issue_to_write", rnd.randrange(10_000, 5_000_000))
+
+
+def test_reopen_appends(log_path):
+    with SampleLog(log_path, chunk_records=4) as log:
+        fill(log, 10)
+    with SampleLog(log_path, chunk_records=4) as log:
+        assert len(log) == 10
+        log.append(99, 7, "cpu.max", "cli", "write_to_effect", 1234)
+    reader = SampleReader(log_path)
+    assert len(reader) == 11
+    assert list(reader.records())[-1] == (99, 7, 1234, "cpu.max", "cli", "write_to_effect")
+    assert os.path.getsize(log_path) == HEADER_SIZE + 11 * RECORD.size
+
+
+def test_torn_tail_is_ignored_and_overwritten(log_path):
+    with SampleLog(log_path) as log:
+        fill(log, 3)
+    # A crash mid-append: record bytes past the header count.
+    with open(log_path, "ab") as f:
+        f.write(RECORD.pack(5, 5, 5, 0, 0, 0)[:20])
+    reader = SampleReader(log_path)
+    assert len(reader) == 3 and len(list(reader.records())) == 3
+    assert len(reader.array()) == 3
+    with SampleLog(log_path) as log:
+        log.append(77, 1, "memory.max", "raw", "issue_to_write", 500)
+    assert [r[0] for r in SampleReader(log_path).records()][-2:] == [1_002_000_000, 77]
+
+
+def test_numpy_and_stream_summaries_agree(log_path):
+    pytest.importorskip("numpy")
+    with SampleLog(log_path) as log:
+        fill(log, 2000, seed=1)
+    reader = SampleReader(log_path)
+    for kwargs in ({}, {"bucket_ns": 500_000_000}, {"since": 1_300_000_000, "until": 2_000_000_000}):
+        exact = reader.summary(**kwargs)
+        streamed = reader.summary(stream=True, **kwargs)
+        assert list(exact) == list(streamed)
+        for key, row in exact.items():
+            other = streamed[key]
+            assert other["count"] == row["count"]
+            assert other["max_ms"] == row["max_ms"]
+            assert other["mean_ms"] == pytest.approx(row["mean_ms"])
+            for name, value in row.items():
+                if name.startswith("p"):
+                    # Log-linear buckets: within one bucket (12.5 %).
+                    assert other[name] == pytest.approx(value, rel=0.125)
+
+
+def test_empty_window(log_path, capsys):
+    with SampleLog(log_path) as log:
+        fill(log, 50)
+    reader = SampleReader(log_path)
+    assert reader.summary(since=10**18) == {}
+    assert reader.summary(since=10**18, stream=True) == {}
+    assert main([log_path, "--since", "100"]) == 0
+    assert "no samples in the selected range" in capsys.readouterr().out
@@ -0,0 +1,95 @@
+import os
+import pytest
+from cgroupfs import FakeCgroupFS
+from docker_api import DockerClient
+from fake_containerd import FakeContainerd
+from fake_dockerd import FakeDockerd
+from update_waterfall import (CTRD_CONN, CTRD_LISTENER, STAGES, FakeStageTracer, Waterfall, collect, containerd_fds,
+                              containerd_socket_path, segments, unix_sockets)
+
+# The stand-in pipeline has no shim; connect only happens on the first update.
+FAKE_STAGES = tuple(s for s in STAGES if s != "shim_recv")
+MEM = 256 * 1024 * 1024
+
+
+@pytest.fixture
+def pipeline():
+    # FakeDockerd -> FakeContainerd -> fake_runc.py on a fake cgroupfs tree.
+    with FakeCgroupFS() as fs:
+        containerd = FakeContainerd(os.path.join(fs.base, "containerd.sock"))
+        containerd.start()
+        dockerd = FakeDockerd(os.path.join(fs.base, "docker.sock"), fs=fs, containerd_socket=containerd.socket_path)
+        container_id, path = fs.add_container("web")
+        dockerd.add_container("web", path, container_id=container_id)
+        dockerd.start()
+        try:
+            with FakeStageTracer() as tracer, DockerClient(dockerd.socket_path) as client:
+                yield client, tracer, path, containerd, dockerd
+        finally:
+            dockerd.shutdown()
+            dockerd.server_close()
+            containerd.shutdown()
+            containerd.server_close()
+
+
+def update(client, tracer, waterfall, memory):
+    tracer.drain()
+    client.update("web", memory=memory)
+    trace = collect(tracer, waterfall)
+    assert trace is not None, "update without a complete trace"
+    return trace
+
+
+def check_trace(trace, expected):
+    stamps = trace.stamps
+    assert tuple(s for s in STAGES if s in stamps) == expected
+    # Pipeline order and time order agree.
+    ts = [stamps[s] for s in expected]
+    assert ts == sorted(ts)
+    total = stamps["dockerd_reply"] - stamps["dockerd_recv"]
+    assert total > 0
+    parts = segments(trace)
+    whole = [ns for seg, ns in parts if seg == ("dockerd_recv", "dockerd_reply")]
+    steps = [(seg, ns) for seg, ns in parts if seg != ("dockerd_recv", "dockerd_reply")]
+    assert whole == [total]
+    assert [seg for seg, _ in steps] == list(zip(expected, expected[1:]))
+    assert all(ns >= 0 for _, ns in steps)
+    assert sum(ns for _, ns in steps) == total
+
+
+def test_update_stages(pipeline):
+    client, tracer, path, containerd, _ = pipeline
+    waterfall = Waterfall()
+
+    trace = update(client, tracer, waterfall, MEM)
+    check_trace(trace, FAKE_STAGES)
+    with open(os.path.join(path, "memory.max")) as f:
+        assert int(f.read()) == MEM
+
+    # The containerd connection is kept: no connect stage from now on.
+    trace = update(client, tracer, waterfall, MEM * 2)
+    check_trace(trace, tuple(s for s in FAKE_STAGES if s != "connect"))
+    with open(os.path.join(path, "memory.max")) as f:
+        assert int(f.read()) == MEM * 2
+
+    assert containerd.updates == 2
+    assert len(waterfall.traces) == 2
+    counts = {seg: sum(h.values()) for seg, h in waterfall.hists.items()}
+    assert counts[("dockerd_recv", "dockerd_reply")] == 2
+    assert counts[("runc_exec", "cgroup_write")] == 2
+    assert counts[("dockerd_recv", "connect")] == 1
+
+
+def test_containerd_socket_fds(pipeline):
+    # What StageTracer seeds its fd filter with: only the dockerd <-> containerd
+    # connection and containerd's listener, not the docker.sock connections.
+    client, tracer, _, containerd, dockerd = pipeline
+    update(client, tracer, Waterfall(), MEM)
+    pid = os.getpid()
+    sockets = unix_sockets()
+    assert containerd_socket_path([pid], sockets) == containerd.socket_path
+    fds = containerd_fds([pid], containerd.socket_path, sockets)
+    kinds = sorted(kind for _, _, kind in fds)
+    assert kinds == [CTRD_CONN, CTRD_CONN, CTRD_LISTENER]
+    assert (pid, dockerd.containerd._sock.fileno(), CTRD_CONN) in fds
+    assert (pid, containerd.fileno(), CTRD_LISTENER) in fds
@@ -0,0 +1,40 @@
+import threading, time
+from write_queue import CoalescingQueue
+
+
+class BlockingWriter:
+    # Records writes; the first one blocks until release is set.
+
+    suppressed = 0
+
+    def __init__(self):
+        self.writes = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def write(self, cgroup_path, name, value):
+        if not self.entered.is_set():
+            self.entered.set()
+            self.release.wait(5)
+        self.writes.append(value)
+
+    def close(self):
+        pass
+
+
+def test_concurrent_flushes_keep_submit_order():
+    writer = BlockingWriter()
+    with CoalescingQueue(writer, start=False) as queue:
+        queue.submit("/cg", "memory.max", b"1")
+        first = threading.Thread(target=queue.flush)
+        first.start()
+        assert writer.entered.wait(5)
+        # A newer value flushed while the first flush is still writing.
+        queue.submit("/cg", "memory.max", b"2")
+        second = threading.Thread(target=queue.flush)
+        second.start()
+        time.sleep(0.05)
+        writer.release.set()
+        first.join()
+        second.join()
+    assert writer.writes == [b"1", b"2"]
@@ -0,0 +1,720 @@
+import os, sys, time, socket, struct, argparse, threading
+import ctypes as ct
+from collections import deque, namedtuple
+from latency_hist import PERCENTILES, slot_of, summarize
+
+# Stages of one `docker update`, in the order they happen. Not every run has
+# every stage: connect only when a new containerd connection is made, and
+# the stand-in pipeline has no shim.
+STAGES = (
+    "dockerd_recv",      # dockerd reads the POST /containers/<id>/update request
+    "connect",           # dockerd/containerd connect(2) during the update
+    "containerd_send",   # dockerd writes the gRPC call on its containerd socket
+    "containerd_recv",   # containerd reads it
+    "shim_recv",         # containerd-shim reads the ttrpc call from containerd
+    "runc_fork",         # the shim forks for runc
+    "runc_exec",         # runc is exec'd
+    "cgroup_write",      # runc's first cgroup file write
+    "runc_exit",         # runc exits
+    "dockerd_reply",     # dockerd writes the HTTP response
+)
+
+# One stage of an update reached at ts, by pid; arg is stage-specific.
+StageEvent = namedtuple("StageEvent", ["ts", "stage", "pid", "arg"])
+UpdateTrace = namedtuple("UpdateTrace", ["stamps"])   # {stage: ts}
+
+bpf_code = """
+#include <uapi/linux/ptrace.h>
+#include <linux/sched.h>
+#include <linux/un.h>
+#include <linux/errno.h>
+
+#define ROLE_DOCKERD 1
+#define ROLE_CONTAINERD 2
+#define ROLE_SHIM 3
+
+// ctrd_fds values.
+#define CTRD_CONN 1
+#define CTRD_LISTENER 2
+
+// Stage numbers, indexes into STAGES.
+#define S_DOCKERD_RECV 0
+#define S_CONNECT 1
+#define S_CONTAINERD_SEND 2
+#define S_CONTAINERD_RECV 3
+#define S_SHIM_RECV 4
+#define S_RUNC_FORK 5
+#define S_RUNC_EXEC 6
+#define S_CGROUP_WRITE 7
+#define S_RUNC_EXIT 8
+#define S_DOCKERD_REPLY 9
+
+// Stages still expected for the update in flight. Set on dockerd_recv and
+// cleared one by one; a single slot, so one update at a time.
+#define ARM_SEND (1 << 0)
+#define ARM_CTRD (1 << 1)
+#define ARM_SHIM (1 << 2)
+#define ARM_FORK (1 << 3)
+#define ARM_WRITE (1 << 4)
+#define ARM_REPLY (1 << 5)
+
+struct stage_event {
+    u64 ts;
+    u32 stage;
+    u32 pid;
+    u32 arg;
+};
+
+struct read_start {
+    u64 buf;
+    u32 fd;
+};
+
+struct update_state {
+    u64 armed;
+    u32 req_fd;
+};
+
+struct fd_key {
+    u32 tgid;
+    u32 fd;
+};
+
+BPF_RINGBUF_OUTPUT(events, 16);
+BPF_HASH(roles, u32, u8);
+BPF_HASH(reads, u32, struct read_start);
+BPF_HASH(runc_pids, u32, u8);
+// Connections on the containerd socket (and containerd's listeners on it) by
+// (tgid, fd). Seeded from sock_diag at start; dockerd's connect() to
+// CTRD_PATH and containerd's accept() on a listener add new ones, close()
+// drops them. connects/accepts carry the fd from syscall entry to exit.
+BPF_HASH(ctrd_fds, struct fd_key, u8);
+BPF_HASH(connects, u32, u32);
+BPF_HASH(accepts, u32, u8);
+// Children of the shims by pid with their fork time. Threads land here too
+// and are never exec'd; the LRU map ages them out.
+BPF_TABLE("lru_hash", u32, u64, forks, 4096);
+BPF_ARRAY(state, struct update_state, 1);
+
+static __always_inline struct update_state *get_state(void) {
+    int zero = 0;
+    return state.lookup(&zero);
+}
+
+static __always_inline void emit_at(u64 ts, u32 stage, u32 pid, u32 arg) {
+    struct stage_event *ev = events.ringbuf_reserve(sizeof(struct stage_event));
+    if (!ev)
+        return;
+    ev->ts = ts;
+    ev->stage = stage;
+    ev->pid = pid;
+    ev->arg = arg;
+    events.ringbuf_submit(ev, 0);
+}
+
+static __always_inline void emit(u32 stage, u32 pid, u32 arg) {
+    emit_at(bpf_ktime_get_ns(), stage, pid, arg);
+}
+
+static __always_inline u8 role_of(u32 tgid) {
+    u8 *role = roles.lookup(&tgid);
+    return role ? *role : 0;
+}
+
+static __always_inline u8 ctrd_fd(u32 tgid, u32 fd) {
+    struct fd_key key = {};
+    key.tgid = tgid;
+    key.fd = fd;
+    u8 *kind = ctrd_fds.lookup(&key);
+    return kind ? *kind : 0;
+}
+
+static __always_inline void add_ctrd_fd(u32 tgid, u32 fd) {
+    struct fd_key key = {};
+    key.tgid = tgid;
+    key.fd = fd;
+    u8 kind = CTRD_CONN;
+    ctrd_fds.update(&key, &kind);
+}
+
+// Compares sun_path with CTRD_PATH, terminating NUL included.
+static __always_inline int is_ctrd_path(const struct sockaddr_un *addr) {
+    char path[CTRD_PATH_LEN + 1] = {};
+    if (bpf_probe_read_user(&path, sizeof(path), addr->sun_path) < 0)
+        return 0;
+    const char want[] = CTRD_PATH;
+#pragma unroll
+    for (int i = 0; i <= CTRD_PATH_LEN; i++)
+        if (path[i] != want[i])
+            return 0;
+    return 1;
+}
+
+TRACEPOINT_PROBE(syscalls, sys_enter_read) {
+    u64 pid_tgid = bpf_get_current_pid_tgid();
+    if (!role_of(pid_tgid >> 32))
+        return 0;
+    u32 tid = pid_tgid;
+    struct read_start rs = {};
+    rs.buf = (u64)args->buf;
+    rs.fd = args->fd;
+    reads.update(&tid, &rs);
+    return 0;
+}
+
+TRACEPOINT_PROBE(syscalls, sys_exit_read) {
+    u64 pid_tgid = bpf_get_current_pid_tgid();
+    u32 tgid = pid_tgid >> 32;
+    u32 tid = pid_tgid;
+    struct read_start *rs = reads.lookup(&tid);
+    if (!rs)
+        return 0;
+    struct read_start r = *rs;
+    reads.delete(&tid);
+    struct update_state *st = get_state();
+    if (!st || args->ret <= 0)
+        return 0;
+
+    u8 role = role_of(tgid);
+    if (role == ROLE_DOCKERD) {
+        char head[5] = {};
+        bpf_probe_read_user(&head, sizeof(head), (void *)r.buf);
+        if (head[0] == 'P' && head[1] == 'O' && head[2] == 'S' && head[3] == 'T' && head[4] == ' ') {
+            st->armed = ARM_SEND | ARM_FORK | ARM_WRITE | ARM_REPLY;
+            st->req_fd = r.fd;
+            emit(S_DOCKERD_RECV, tgid, r.fd);
+        }
+    } else if (role == ROLE_CONTAINERD && (st->armed & ARM_CTRD) && ctrd_fd(tgid, r.fd) == CTRD_CONN) {
+        st->armed = (st->armed & ~ARM_CTRD) | ARM_SHIM;
+        emit(S_CONTAINERD_RECV, tgid, r.fd);
+    } else if (role == ROLE_SHIM && (st->armed & ARM_SHIM)) {
+        st->armed &= ~ARM_SHIM;
+        emit(S_SHIM_RECV, tgid, r.fd);
+    }
+    return 0;
+}
+
+// dockerd (Go) writes sockets with write(2); writev/sendmsg are covered too.
+static __always_inline int on_send(u32 fd) {
+    u32 tgid = bpf_get_current_pid_tgid() >> 32;
+    if (role_of(tgid) != ROLE_DOCKERD)
+        return 0;
+    struct update_state *st = get_state();
+    if (!st || !st->armed)
+        return 0;
+    if (fd == st->req_fd) {
+        if (st->armed & ARM_REPLY) {
+            st->armed = 0;
+            emit(S_DOCKERD_REPLY, tgid, fd);
+        }
+    } else if ((st->armed & ARM_SEND) && ctrd_fd(tgid, fd) == CTRD_CONN) {
+        st->armed = (st->armed & ~ARM_SEND) | ARM_CTRD;
+        emit(S_CONTAINERD_SEND, tgid, fd);
+    }
+    return 0;
+}
+
+TRACEPOINT_PROBE(syscalls, sys_enter_write) { return on_send(args->fd); }
+TRACEPOINT_PROBE(syscalls, sys_enter_writev) { return on_send(args->fd); }
+TRACEPOINT_PROBE(syscalls, sys_enter_sendmsg) { return on_send(args->fd); }
+
+TRACEPOINT_PROBE(syscalls, sys_enter_connect) {
+    u64 pid_tgid = bpf_get_current_pid_tgid();
+    u32 tgid = pid_tgid >> 32;
+    u8 role = role_of(tgid);
+    if (role != ROLE_DOCKERD && role != ROLE_CONTAINERD)
+        return 0;
+    if (role == ROLE_DOCKERD && is_ctrd_path((const struct sockaddr_un *)args->uservaddr)) {
+        u32 tid = pid_tgid;
+        u32 fd = args->fd;
+        connects.update(&tid, &fd);
+    }
+    struct update_state *st = get_state();
+    if (st && st->armed)
+        emit(S_CONNECT, tgid, args->fd);
+    return 0;
+}
+
+TRACEPOINT_PROBE(syscalls, sys_exit_connect) {
+    u64 pid_tgid = bpf_get_current_pid_tgid();
+    u32 tid = pid_tgid;
+    u32 *fd = connects.lookup(&tid);
+    if (!fd)
+        return 0;
+    u32 conn_fd = *fd;
+    connects.delete(&tid);
+    // Go connects non-blocking; EINPROGRESS completes later on the same fd.
+    if (args->ret == 0 || args->ret == -EINPROGRESS)
+        add_ctrd_fd(pid_tgid >> 32, conn_fd);
+    return 0;
+}
+
+static __always_inline int on_accept(u32 fd) {
+    u64 pid_tgid = bpf_get_current_pid_tgid();
+    if (ctrd_fd(pid_tgid >> 32, fd) != CTRD_LISTENER)
+        return 0;
+    u32 tid = pid_tgid;
+    u8 one = 1;
+    accepts.update(&tid, &one);
+    return 0;
+}
+
+static __always_inline int on_accept_return(long ret) {
+    u64 pid_tgid = bpf_get_current_pid_tgid();
+    u32 tid = pid_tgid;
+    if (!accepts.lookup(&tid))
+        return 0;
+    accepts.delete(&tid);
+    if (ret >= 0)
+        add_ctrd_fd(pid_tgid >> 32, ret);
+    return 0;
+}
+
+TRACEPOINT_PROBE(syscalls, sys_enter_accept) { return on_accept(args->fd); }
+TRACEPOINT_PROBE(syscalls, sys_enter_accept4) { return on_accept(args->fd); }
+TRACEPOINT_PROBE(syscalls, sys_exit_accept) { return on_accept_return(args->ret); }
+TRACEPOINT_PROBE(syscalls, sys_exit_accept4) { return on_accept_return(args->ret); }
+
+TRACEPOINT_PROBE(syscalls, sys_enter_close) {
+    u32 tgid = bpf_get_current_pid_tgid() >> 32;
+    if (!role_of(tgid))
+        return 0;
+    struct fd_key key = {};
+    key.tgid = tgid;
+    key.fd = args->fd;
+    ctrd_fds.delete(&key);
+    return 0;
+}
+
+TRACEPOINT_PROBE(sched, sched_process_fork) {
+    if (role_of(bpf_get_current_pid_tgid() >> 32) != ROLE_SHIM)
+        return 0;
+    struct update_state *st = get_state();
+    if (!st || !(st->armed & ARM_FORK))
+        return 0;
+    u32 child = args->child_pid;
+    u64 ts = bpf_ktime_get_ns();
+    forks.update(&child, &ts);
+    return 0;
+}
+
+// The shim's child that execs is runc: emit its fork and exec together.
+TRACEPOINT_PROBE(sched, sched_process_exec) {
+    u32 pid = bpf_get_current_pid_tgid() >> 32;
+    u64 *fork_ts = forks.lookup(&pid);
+    if (!fork_ts)
+        return 0;
+    u64 ts = *fork_ts;
+    forks.delete(&pid);
+    struct update_state *st = get_state();
+    if (!st || !(st->armed & ARM_FORK))
+        return 0;
+    st->armed &= ~ARM_FORK;
+    u8 one = 1;
+    runc_pids.update(&pid, &one);
+    emit_at(ts, S_RUNC_FORK, pid, 0);
+    emit(S_RUNC_EXEC, pid, 0);
+    return 0;
+}
+
+TRACEPOINT_PROBE(sched, sched_process_exit) {
+    u64 pid_tgid = bpf_get_current_pid_tgid();
+    u32 pid = pid_tgid >> 32;
+    if ((u32)pid_tgid != pid || !runc_pids.lookup(&pid))
+        return 0;
+    runc_pids.delete(&pid);
+    emit(S_RUNC_EXIT, pid, 0);
+    return 0;
+}
+
+int trace_cgroup_write(struct pt_regs *ctx) {
+    u32 pid = bpf_get_current_pid_tgid() >> 32;
+    if (!runc_pids.lookup(&pid))
+        return 0;
+    struct update_state *st = get_state();
+    if (!st || !(st->armed & ARM_WRITE))
+        return 0;
+    st->armed &= ~ARM_WRITE;
+    emit(S_CGROUP_WRITE, pid, 0);
+    return 0;
+}
+"""
+
+ROLE_DOCKERD, ROLE_CONTAINERD, ROLE_SHIM = 1, 2, 3
+CTRD_CONN, CTRD_LISTENER = 1, 2
+CONTAINERD_SOCKET = "/run/containerd/containerd.sock"
+
+# sock_diag (what `ss -x` uses): every unix socket with its bound path and
+# the inode of its peer.
+NETLINK_SOCK_DIAG = 4
+SOCK_DIAG_BY_FAMILY = 20
+NLM_F_REQUEST, NLM_F_DUMP = 0x1, 0x300
+NLMSG_ERROR, NLMSG_DONE = 2, 3
+UDIAG_SHOW_NAME, UDIAG_SHOW_PEER = 0x1, 0x4
+UNIX_DIAG_NAME, UNIX_DIAG_PEER = 0, 2
+UNIX_LISTEN = 10
+NLMSG = struct.Struct("<IHHII")
+UNIX_DIAG_REQ = struct.Struct("<BBHIIIII")
+UNIX_DIAG_MSG = struct.Struct("<BBBBIII")
+RTATTR = struct.Struct("<HH")
+
+
+def find_pids(comm_prefix):
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/comm") as f:
+                if f.read().strip().startswith(comm_prefix):
+                    pids.append(int(entry))
+        except OSError:
+            pass
+    return pids
+
+
+def unix_sockets():
+    # {inode: (bound path or None, state, peer inode or 0)}
+    req = UNIX_DIAG_REQ.pack(socket.AF_UNIX, 0, 0, 0xffffffff, 0, UDIAG_SHOW_NAME | UDIAG_SHOW_PEER,
+                             0xffffffff, 0xffffffff)
+    sockets = {}
+    with socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_SOCK_DIAG) as nl:
+        nl.send(NLMSG.pack(NLMSG.size + len(req), SOCK_DIAG_BY_FAMILY, NLM_F_REQUEST | NLM_F_DUMP, 1, 0) + req)
+        while True:
+            data = nl.recv(1 << 16)
+            off = 0
+            while off < len(data):
+                length, kind = NLMSG.unpack_from(data, off)[:2]
+                if kind == NLMSG_DONE:
+                    return sockets
+                if kind == NLMSG_ERROR:
+                    err = -struct.unpack_from("<i", data, off + NLMSG.size)[0]
+                    raise OSError(err, os.strerror(err))
+                _, _, state, _, ino = UNIX_DIAG_MSG.unpack_from(data, off + NLMSG.size)[:5]
+                name, peer = None, 0
+                attr = off + NLMSG.size + UNIX_DIAG_MSG.size
+                while attr < off + length:
+                    alen, atype = RTATTR.unpack_from(data, attr)
+                    value = data[attr + RTATTR.size:attr + alen]
+                    if atype == UNIX_DIAG_NAME:
+                        name = value.rstrip(b"\0").decode(errors="replace")
+                    elif atype == UNIX_DIAG_PEER:
+                        peer = struct.unpack_from("<I", value)[0]
+                    attr += (alen + 3) & ~3
+                sockets[ino] = (name, state, peer)
+                off += (length + 3) & ~3
+
+
+def socket_fds(pid):
+    # {socket inode: fd} of a process, from the "socket:[ino]" links in /proc.
+    fds = {}
+    fd_dir = f"/proc/{pid}/fd"
+    for entry in os.listdir(fd_dir):
+        try:
+            target = os.readlink(os.path.join(fd_dir, entry))
+        except OSError:
+            continue
+        if target.startswith("socket:["):
+            fds[int(target[8:-1])] = int(entry)
+    return fds
+
+
+def containerd_socket_path(pids, sockets):
+    # The path containerd listens on for its API (not the .ttrpc one).
+    for pid in pids:
+        for ino in socket_fds(pid):
+            name, state, _ = sockets.get(ino, (None, 0, 0))
+            if name and state == UNIX_LISTEN and name.endswith("containerd.sock"):
+                return name
+    return CONTAINERD_SOCKET
+
+
+def containerd_fds(pids, socket_path, sockets):
+    # [(pid, fd, CTRD_CONN or CTRD_LISTENER)] of pids' fds on the containerd
+    # socket: containerd's own ends are bound to socket_path, a client's end
+    # (dockerd's) has one of those as its peer.
+    out = []
+    for pid in pids:
+        for ino, fd in socket_fds(pid).items():
+            name, state, peer = sockets.get(ino, (None, 0, 0))
+            if name == socket_path:
+                out.append((pid, fd, CTRD_LISTENER if state == UNIX_LISTEN else CTRD_CONN))
+            elif peer and sockets.get(peer, (None,))[0] == socket_path:
+                out.append((pid, fd, CTRD_CONN))
+    return out
+
+
+class StageTracer:
+    # Timestamps the stages of a docker update with tracepoints on the
+    # syscalls of dockerd, containerd and the shims, the shim's fork and
+    # runc's exec/exit, and a kprobe on cgroup_file_write. Processes are
+    # recognized by tgid (roles map), filled from /proc at start; call
+    # add_shim() for shims started later. The stage state is a single slot,
+    # so stages are only meaningful with one update in flight.
+    #
+    # containerd_send/recv only count the connections between dockerd and
+    # containerd's API socket: the fds already open are found through
+    # sock_diag, later ones on connect()/accept().
+
+    def __init__(self, dockerd_pid=None, containerd_pid=None, containerd_socket=None):
+        from bcc import BPF
+
+        dockerd = [dockerd_pid] if dockerd_pid else find_pids("dockerd")
+        shims = find_pids("containerd-shim")
+        containerd = [containerd_pid] if containerd_pid else [p for p in find_pids("containerd") if p not in shims]
+        sockets = unix_sockets()
+        self.containerd_socket = containerd_socket or containerd_socket_path(containerd, sockets)
+        self.bpf = BPF(text=bpf_code, cflags=[f"-DCTRD_PATH_LEN={len(self.containerd_socket)}",
+                                              f'-DCTRD_PATH="{self.containerd_socket}"'])
+        self.bpf.attach_kprobe(event="cgroup_file_write", fn_name="trace_cgroup_write")
+        roles = self.bpf["roles"]
+        for pid in dockerd:
+            roles[ct.c_uint(pid)] = ct.c_ubyte(ROLE_DOCKERD)
+        for pid in containerd:
+            roles[ct.c_uint(pid)] = ct.c_ubyte(ROLE_CONTAINERD)
+        for pid in shims:
+            self.add_shim(pid)
+        fds = self.bpf["ctrd_fds"]
+        for pid, fd, kind in containerd_fds(dockerd + containerd, self.containerd_socket, sockets):
+            fds[fds.Key(pid, fd)] = ct.c_ubyte(kind)
+        self._pending = deque()
+        self.bpf["events"].open_ring_buffer(self._on_event)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_shim(self, pid):
+        self.bpf["roles"][ct.c_uint(pid)] = ct.c_ubyte(ROLE_SHIM)
+
+    def _on_event(self, ctx, data, size):
+        ev = self.bpf["events"].event(data)
+        self._pending.append(StageEvent(ev.ts, STAGES[ev.stage], ev.pid, ev.arg))
+
+    def poll(self, timeout_ms=-1):
+        self.bpf.ring_buffer_poll(timeout_ms)
+
+    def drain(self):
+        self.bpf.ring_buffer_consume()
+        events = list(self._pending)
+        self._pending.clear()
+        return events
+
+    def close(self):
+        self.bpf.cleanup()
+
+
+_fake_tracers = []
+
+
+def mark_stage(stage, ts=None, pid=None, arg=0):
+    # Called by the stand-in dockerd/containerd/runc at each stage; reaches
+    # every FakeStageTracer of this process.
+    ev = StageEvent(time.monotonic_ns() if ts is None else ts, stage, pid or os.getpid(), arg)
+    for tracer in list(_fake_tracers):
+        tracer._push(ev)
+
+
+class FakeStageTracer:
+    # StageTracer's poll/drain interface fed by mark_stage() from the
+    # stand-in processes instead of BPF.
+
+    def __init__(self):
+        self._pending = deque()
+        self._cond = threading.Condition()
+        _fake_tracers.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _push(self, ev):
+        with self._cond:
+            self._pending.append(ev)
+            self._cond.notify_all()
+
+    def poll(self, timeout_ms=-1):
+        with self._cond:
+            if not self._pending:
+                self._cond.wait(None if timeout_ms < 0 else timeout_ms / 1e3)
+
+    def drain(self):
+        with self._cond:
+            events = list(self._pending)
+            self._pending.clear()
+        return events
+
+    def close(self):
+        if self in _fake_tracers:
+            _fake_tracers.remove(self)
+
+
+class Waterfall:
+    # Assembles stage events into per-update traces: dockerd_recv opens a
+    # trace, dockerd_reply closes it, and in between the first event of each
+    # stage is kept. Segment latencies between consecutive stages go into
+    # log-linear histograms.
+
+    def __init__(self):
+        self.current = None
+        self.traces = []
+        self.hists = {}
+        self.maxes = {}
+
+    def feed(self, events):
+        done = []
+        for ev in sorted(events):
+            if ev.stage == "dockerd_recv":
+                self.current = {}
+            if self.current is None or ev.stage in self.current:
+                continue
+            self.current[ev.stage] = ev.ts
+            if ev.stage == "dockerd_reply":
+                trace = UpdateTrace(self.current)
+                self.current = None
+                self._record(trace)
+                done.append(trace)
+        self.traces.extend(done)
+        return done
+
+    def _record(self, trace):
+        for segment, ns in segments(trace):
+            hist = self.hists.setdefault(segment, {})
+            slot = slot_of(ns)
+            hist[slot] = hist.get(slot, 0) + 1
+            if ns > self.maxes.get(segment, -1):
+                self.maxes[segment] = ns
+
+
+def segments(trace):
+    # [(("from", "to"), ns)] between consecutive stages present in the
+    # trace, plus ("dockerd_recv", "dockerd_reply") for the whole update.
+    present = sorted((ts, stage) for stage, ts in trace.stamps.items())
+    out = [((a, b), tb - ta) for (ta, a), (tb, b) in zip(present, present[1:])]
+    stamps = trace.stamps
+    if "dockerd_recv" in stamps and "dockerd_reply" in stamps:
+        out.append((("dockerd_recv", "dockerd_reply"), stamps["dockerd_reply"] - stamps["dockerd_recv"]))
+    return out
+
+
+def print_waterfall(trace, width=40, out=sys.stdout):
+    stamps = trace.stamps
+    start = min(stamps.values())
+    total = max(stamps.values()) - start or 1
+    out.write(f"update: {total / 1e6:.3f} ms\n")
+    present = sorted((ts, stage) for stage, ts in stamps.items())
+    for (ta, a), (tb, b) in zip(present, present[1:]):
+        lo = int((ta - start) / total * width)
+        hi = max(lo + 1, int((tb - start) / total * width))
+        bar = " " * lo + "#" * (hi - lo) + " " * (width - hi)
+        out.write(f"  {a:>15} -> {b:<15} {(tb - ta) / 1e6:>8.3f} ms |{bar}|\n")
+
+
+def print_summary(waterfall, out=sys.stdout):
+    cols = [f"p{q:g}" for q in PERCENTILES] + ["max"]
+    out.write(f"{'segment':<34} {'count':>6} " + " ".join(f"{c:>10}" for c in cols) + "\n")
+    order = {stage: i for i, stage in enumerate(STAGES)}
+    for segment in sorted(waterfall.hists, key=lambda s: (s == ("dockerd_recv", "dockerd_reply"),
+                                                           order[s[0]], order[s[1]])):
+        s = summarize(waterfall.hists[segment], waterfall.maxes[segment])
+        label = f"{segment[0]} -> {segment[1]}"
+        out.write(f"{label:<34} {s['count']:>6} " + " ".join(f"{s[c] / 1e6:>7.3f} ms" for c in cols) + "\n")
+
+
+def collect(tracer, waterfall, timeout=5.0):
+    # Waits for the update in flight to complete its trace.
+    deadline = time.monotonic() + timeout
+    while True:
+        done = waterfall.feed(tracer.drain())
+        if done:
+            return done[-1]
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        tracer.poll(int(remaining * 1e3))
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Per-stage latency of docker updates")
+    p.add_argument("--path", choices=("api", "cli"), default="api")
+    p.add_argument("-n", "--iterations", type=int, default=100)
+    p.add_argument("--show", type=int, default=3, help="print the waterfall of the first N updates")
+    p.add_argument("--fake", action="store_true",
+                   help="run against the stand-in dockerd/containerd/runc on a fake cgroupfs tree")
+    args = p.parse_args(argv)
+    if args.fake and args.path == "cli":
+        p.error("the cli path needs a real dockerd")
+    return args
+
+
+def main(argv=None):
+    import subprocess
+    from cgbench import (CONTAINER_NAME, CPU_PERIOD, MEM_DELTA, Updater, build_image, initial_cpu, initial_mem,
+                         remove_containers, resolve_cgroups, start_containers)
+
+    args = parse_args(argv)
+    cleanup = []
+    try:
+        if args.fake:
+            from cgroupfs import FakeCgroupFS
+            from fake_containerd import FakeContainerd
+            from fake_dockerd import FakeDockerd
+            # The module the stand-ins call mark_stage() on, also when run as __main__.
+            from update_waterfall import FakeStageTracer
+
+            fs = FakeCgroupFS()
+            cleanup.append(fs.cleanup)
+            containerd = FakeContainerd(os.path.join(fs.base, "containerd.sock"))
+            containerd.start()
+            cleanup.append(containerd.server_close)
+            cleanup.append(containerd.shutdown)
+            socket_path = os.path.join(fs.base, "docker.sock")
+            server = FakeDockerd(socket_path, fs=fs, containerd_socket=containerd.socket_path)
+            container_id, path = fs.add_container(CONTAINER_NAME)
+            fs.write_file(path, "cpu.max", f"{initial_cpu} {CPU_PERIOD}")
+            server.add_container(CONTAINER_NAME, path, container_id=container_id)
+            server.start()
+            cleanup.append(server.server_close)
+            cleanup.append(server.shutdown)
+            cgroup_paths = resolve_cgroups([CONTAINER_NAME], fs)
+            tracer = FakeStageTracer()
+        else:
+            from docker_api import DOCKER_SOCKET
+
+            fs, socket_path = None, DOCKER_SOCKET
+            build_image()
+            start_containers(1)
+            cleanup.append(lambda: remove_containers([CONTAINER_NAME]))
+            cgroup_paths = resolve_cgroups([CONTAINER_NAME])
+            dockerd = int(subprocess.check_output(["pidof", "dockerd"]).decode().split()[0])
+            tracer = StageTracer(dockerd)
+        cleanup.append(tracer.close)
+
+        updater = Updater(args.path, cgroup_paths, socket_path, fs)
+        cleanup.append(updater.close)
+        waterfall = Waterfall()
+        missed = 0
+        for i in range(args.iterations):
+            tracer.drain()
+            updater.issue(CONTAINER_NAME, "memory.max", initial_mem + (MEM_DELTA if i % 2 == 0 else -MEM_DELTA))
+            trace = collect(tracer, waterfall)
+            if trace is None:
+                missed += 1
+            elif i < args.show:
+                print_waterfall(trace)
+        print()
+        print_summary(waterfall)
+        if missed:
+            print(f"\n{missed} update(s) without a complete trace")
+    finally:
+        for fn in reversed(cleanup):
+            fn()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
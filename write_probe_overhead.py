@@ -0,0 +1,135 @@
+import os, sys, time, argparse
+from multiprocessing import Process, Value
+from cgroup_writer import CgroupWriter, memory_max_bytes
+from cgroupfs import CGROUP_ROOT
+from write_tracer import WriteTracer, HOOKS
+
+CGROUP_NAME = "probe-overhead"
+WRITERS = os.cpu_count() or 1
+IO_SIZE = 512
+DURATION = 5.0
+SAMPLE_RATE = 16
+MEM_LIMIT = 128 * 1024 * 1024
+MEM_DELTA = 1024 * 1024
+
+# What each worker does in a loop, and which probe it exercises:
+#   write  - host writes to /dev/null: vfs_write probe, filtered out
+#   read   - host reads from /dev/zero: dockerd request-read tracepoints,
+#            filtered out by the dockerd tgid check
+#   cgroup - memory.max writes to a watched cgroup: every write is an event
+WORKLOADS = ("write", "read", "cgroup")
+
+
+def worker_loop(workload, counter, stop_at, cgroup_path):
+    n = 0
+    if workload == "cgroup":
+        writer = CgroupWriter(files=("memory.max",))
+        bufs = [memory_max_bytes(MEM_LIMIT + MEM_DELTA), memory_max_bytes(MEM_LIMIT - MEM_DELTA)]
+        while time.monotonic() < stop_at:
+            for i in range(100):
+                writer.write(cgroup_path, "memory.max", bufs[i & 1])
+            n += 100
+        writer.close()
+    else:
+        if workload == "write":
+            fd = os.open("/dev/null", os.O_WRONLY)
+            buf = b"x" * IO_SIZE
+            op = lambda: os.write(fd, buf)
+        else:
+            fd = os.open("/dev/zero", os.O_RDONLY)
+            op = lambda: os.read(fd, IO_SIZE)
+        while time.monotonic() < stop_at:
+            for _ in range(1000):
+                op()
+            n += 1000
+        os.close(fd)
+    with counter.get_lock():
+        counter.value += n
+
+
+def measure(workload, cgroup_paths, duration, tracer=None):
+    # Returns operations/s over all workers. With a tracer, its ring buffer
+    # is drained on this process's thread meanwhile, as a real consumer would.
+    counter = Value("Q", 0)
+    stop_at = time.monotonic() + duration
+    procs = [Process(target=worker_loop, args=(workload, counter, stop_at, cgroup_paths[i]))
+             for i in range(len(cgroup_paths))]
+    for p in procs:
+        p.start()
+    consumed = 0
+    if tracer is not None:
+        while time.monotonic() < stop_at:
+            tracer.poll(100)
+            consumed += len(tracer.drain())
+    for p in procs:
+        p.join()
+    if tracer is not None:
+        consumed += len(tracer.drain())
+    return counter.value / duration, consumed
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Cost of the write/read probes on the host")
+    p.add_argument("--workload", action="append", choices=WORKLOADS, help="repeatable, default: all")
+    p.add_argument("--hook", action="append", choices=HOOKS, help="write probe hook, repeatable (default: all)")
+    p.add_argument("--sample", type=int, default=SAMPLE_RATE, help="N for the 1-in-N sampled mode")
+    p.add_argument("--duration", type=float, default=DURATION, help="seconds per mode")
+    p.add_argument("--writers", type=int, default=WRITERS, help="worker processes")
+    args = p.parse_args(argv)
+    args.workload = args.workload or list(WORKLOADS)
+    args.hook = args.hook or list(HOOKS)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    parent = os.path.join(CGROUP_ROOT, CGROUP_NAME)
+    # One cgroup per worker so the cgroup workload does not measure lock
+    # contention between writers.
+    cgroup_paths = [os.path.join(parent, f"w{i}") for i in range(args.writers)]
+    for path in [parent] + cgroup_paths:
+        os.makedirs(path, exist_ok=True)
+    with open(os.path.join(parent, "cgroup.subtree_control"), "w") as f:
+        f.write("+memory")
+    try:
+        print(f"{args.writers} workers, {IO_SIZE} B I/O, {args.duration:g} s per mode, sampled = 1 in {args.sample}\n")
+        print(f"{'workload':<8} {'hook':<18} {'mode':<10} {'ops/s':>12} {'loss':>8} {'cost/op':>11} "
+              f"{'events/s':>10} {'compile':>9}")
+        for workload in args.workload:
+            baseline, _ = measure(workload, cgroup_paths, args.duration)
+            print(f"{workload:<8} {'-':<18} {'off':<10} {baseline:>12.0f} {'-':>8} {'-':>11} {'-':>10}")
+            # The read tracepoints do not depend on the write hook.
+            hooks = args.hook[:1] if workload == "read" else args.hook
+            for hook in hooks:
+                try:
+                    tracer = WriteTracer(hook=hook)
+                except Exception as e:
+                    print(f"{workload:<8} {hook:<18} skipped: {e}")
+                    continue
+                try:
+                    for path in cgroup_paths:
+                        tracer.watch_cgroup(path, ("memory.max",))
+                    if workload == "read":
+                        # Any tgid other than the workers' attaches and arms
+                        # the read tracepoints; the workers are filtered out.
+                        tracer.set_dockerd_pid(os.getpid())
+                    for mode, rate in (("on", 1), (f"1/{args.sample}", args.sample)):
+                        if workload == "read" and rate > 1:
+                            continue
+                        tracer.set_sample_rate(rate)
+                        ops, events = measure(workload, cgroup_paths, args.duration, tracer)
+                        loss = (1 - ops / baseline) * 100
+                        # Extra CPU time per operation, each worker using one CPU.
+                        cost_ns = (args.writers / ops - args.writers / baseline) * 1e9
+                        print(f"{workload:<8} {hook:<18} {mode:<10} {ops:>12.0f} {loss:>7.2f}% {cost_ns:>8.1f} ns "
+                              f"{events / args.duration:>10.0f} {tracer.startup_ns['compile'] / 1e6:>6.0f} ms")
+                finally:
+                    tracer.close()
+    finally:
+        for path in cgroup_paths + [parent]:
+            os.rmdir(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+import time, threading
+from collections import namedtuple
+from cgroup_writer import CgroupWriter, CgroupRemovedError, memory_max_bytes, cpu_max_bytes
+
+DEFAULT_TICK = 0.01
+
+QueueStats = namedtuple("QueueStats", ["submitted", "coalesced", "suppressed", "written", "failed"])
+
+
+class CoalescingQueue:
+    # Pending cgroup writes keyed by (cgroup_path, file). A newer submit for
+    # the same file replaces the pending value (last writer wins) and counts
+    # as coalesced. A background thread flushes every tick, or earlier when a
+    # submit carries a deadline (time.monotonic() seconds) before the next
+    # tick. Writes go through a shadow-enabled CgroupWriter, so a flushed
+    # value equal to the last one written is suppressed as well. Flushes are
+    # serialized, so a value never overwrites a newer one taken by a
+    # concurrent flush.
+
+    def __init__(self, writer=None, tick=DEFAULT_TICK, start=True):
+        self.writer = writer or CgroupWriter(shadow=True)
+        self.tick = tick
+        self.submitted = 0
+        self.coalesced = 0
+        self.failed = []
+        self._pending = {}
+        self._deadline = None
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stop = False
+        self._thread = None
+        if start:
+            self.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="cgroup-write-flush", daemon=True)
+        self._thread.start()
+
+    def submit(self, cgroup_path, name, value, deadline=None):
+        key = (cgroup_path, name)
+        with self._cond:
+            self.submitted += 1
+            if key in self._pending:
+                self.coalesced += 1
+            self._pending[key] = value
+            if deadline is not None and (self._deadline is None or deadline < self._deadline):
+                self._deadline = deadline
+                self._cond.notify()
+
+    def set_memory_max(self, cgroup_path, limit, deadline=None):
+        self.submit(cgroup_path, "memory.max", memory_max_bytes(limit), deadline)
+
+    def set_cpu_max(self, cgroup_path, quota, period=100000, deadline=None):
+        self.submit(cgroup_path, "cpu.max", cpu_max_bytes(quota, period), deadline)
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def flush(self):
+        # Held from the snapshot to the last write; submit() only needs _cond.
+        with self._flush_lock:
+            with self._cond:
+                pending, self._pending = self._pending, {}
+                self._deadline = None
+            for (cgroup_path, name), value in pending.items():
+                try:
+                    self.writer.write(cgroup_path, name, value)
+                except (OSError, CgroupRemovedError) as e:
+                    self.failed.append((cgroup_path, name, e))
+            return len(pending)
+
+    def _run(self):
+        next_tick = time.monotonic() + self.tick
+        while True:
+            with self._cond:
+                while not self._stop:
+                    wake = next_tick if self._deadline is None else min(next_tick, self._deadline)
+                    timeout = wake - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    self._cond.wait(timeout)
+                stop = self._stop
+            self.flush()
+            if stop:
+                return
+            now = time.monotonic()
+            if now >= next_tick:
+                next_tick += self.tick * ((now - next_tick) // self.tick + 1)
+
+    def stats(self):
+        return QueueStats(self.submitted, self.coalesced, self.writer.suppressed, self.writer.writes, len(self.failed))
+
+    def close(self, flush=True, close_writer=True):
+        if self._thread is not None:
+            with self._cond:
+                self._stop = True
+                if not flush:
+                    self._pending.clear()
+                self._cond.notify()
+            self._thread.join()
+            self._thread = None
+        elif flush:
+            self.flush()
+        if close_writer:
+            self.writer.close()
@@ -0,0 +1,443 @@
+import os, time
+import ctypes as ct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from bcc import BPF
+from cgroupfs import WriteEvent, cgroup_id
+from latency_hist import KNOBS, PATHS, print_report
+
+bpf_code = """
+#include <uapi/linux/ptrace.h>
+#include <linux/fs.h>
+#include <linux/dcache.h>
+#include <linux/kernfs.h>
+#include <linux/magic.h>
+
+#define VALUE_BUF_LEN 32
+#define REQ_BUF_LEN 128
+#define IDENT_LEN 64
+#define HIST_SUB_BITS 3
+
+#define KNOB_MEMORY_MAX 0
+#define KNOB_CPU_MAX 1
+#define PATH_RAW 0
+#define PATH_DOCKERD 1
+
+#define CONFIG_DOCKERD_TGID 0
+#define CONFIG_SAMPLE_RATE 1
+#define CONFIG_MAX 2
+
+#define HOOK_VFS_WRITE 0
+#define HOOK_CGROUP_FILE_WRITE 1
+#define HOOK_FENTRY 2
+
+struct write_event {
+    u64 ts;
+    u64 start_ts;
+    u64 cgroup_id;
+    u32 pid;
+    u32 dockerd_tid;
+    u32 knob;
+    u32 value_len;
+    char value[VALUE_BUF_LEN];
+};
+
+struct hist_key {
+    u32 knob;
+    u32 path;
+    u64 slot;
+};
+
+struct write_start {
+    u64 ts;
+    u64 start_ts;
+    u32 knob;
+    u32 path;
+    u32 dockerd_tid;
+};
+
+struct watch_val {
+    u64 cgroup_id;
+    u32 knob;
+};
+
+struct container_key {
+    char ident[IDENT_LEN];
+};
+
+struct pending_req {
+    u64 recv_ts;
+    u32 tid;
+};
+
+BPF_RINGBUF_OUTPUT(events, 64);
+BPF_ARRAY(dropped, u64, 1);
+// Runtime parameters, set from userspace so the source (and its compiled
+// object) does not change with them.
+BPF_ARRAY(config, u64, CONFIG_MAX);
+BPF_HASH(read_bufs, u32, u64);
+BPF_HASH(container_cgids, struct container_key, u64);
+BPF_HASH(pending, u64, struct pending_req);
+BPF_HASH(raw_tgids, u32, u8);
+BPF_HASH(watched, u64, struct watch_val);
+BPF_HASH(inflight, u64, struct write_start);
+BPF_HISTOGRAM(latency_hist, struct hist_key, 2048);
+BPF_HASH(latency_max, struct hist_key, u64);
+
+// Log-linear bucket index; latency_hist.slot_of() is the Python twin.
+static inline u64 hist_slot(u64 v) {
+    if (v < (1 << HIST_SUB_BITS))
+        return v;
+    // bpf_log2l() is the bit length, floor(log2(v)) + 1.
+    u64 l = bpf_log2l(v) - 1;
+    return ((l - HIST_SUB_BITS + 1) << HIST_SUB_BITS) |
+           ((v >> (l - HIST_SUB_BITS)) & ((1 << HIST_SUB_BITS) - 1));
+}
+
+// Matches "/containers/<ident>" at a fixed offset of an HTTP request line and
+// copies <ident> (container ID or name, as sent by the client) into key.
+static __always_inline int match_ident(const char *data, int off, struct container_key *key) {
+    const char pat[] = "/containers/";
+    #pragma unroll
+    for (int i = 0; i < 12; i++) {
+        if (data[off + i] != pat[i])
+            return 0;
+    }
+    #pragma unroll
+    for (int i = 0; i < IDENT_LEN - 1; i++) {
+        char c = data[off + 12 + i];
+        if (c == '/' || c == '?' || c == ' ' || c == 0)
+            break;
+        key->ident[i] = c;
+    }
+    return 1;
+}
+
+static __always_inline u64 config_get(int key) {
+    u64 *val = config.lookup(&key);
+    return val ? *val : 0;
+}
+
+// 1-in-N sampling of watched writes. Rates of 0 and 1 record everything.
+static __always_inline int sampled(void) {
+    u64 rate = config_get(CONFIG_SAMPLE_RATE);
+    return rate <= 1 || bpf_get_prandom_u32() % rate == 0;
+}
+
+// dockerd (Go) reads API requests with read(2). Remember the buffer per
+// dockerd thread on entry and parse the request line on exit.
+int trace_read_enter(struct tracepoint__syscalls__sys_enter_read *args) {
+    u64 pid_tgid = bpf_get_current_pid_tgid();
+    if ((pid_tgid >> 32) != config_get(CONFIG_DOCKERD_TGID)) return 0;
+    u32 tid = pid_tgid;
+    u64 buf = (u64)args->buf;
+    read_bufs.update(&tid, &buf);
+    return 0;
+}
+
+int trace_read_exit(struct tracepoint__syscalls__sys_exit_read *args) {
+    u64 pid_tgid = bpf_get_current_pid_tgid();
+    if ((pid_tgid >> 32) != config_get(CONFIG_DOCKERD_TGID)) return 0;
+    u32 tid = pid_tgid;
+    u64 *bufp = read_bufs.lookup(&tid);
+    if (!bufp) return 0;
+    u64 buf = *bufp;
+    read_bufs.delete(&tid);
+    if (args->ret < 24) return 0;
+
+    char data[REQ_BUF_LEN] = {};
+    u32 len = args->ret < REQ_BUF_LEN ? args->ret : REQ_BUF_LEN;
+    bpf_probe_read_user(&data, len, (void *)buf);
+    if (!(data[0]=='P'&&data[1]=='O'&&data[2]=='S'&&data[3]=='T'&&data[4]==' '))
+        return 0;
+
+    // "POST /containers/..." or "POST /v1.NN/containers/..."
+    struct container_key key = {};
+    if (!(match_ident(data, 5, &key) || match_ident(data, 11, &key) || match_ident(data, 12, &key)))
+        return 0;
+    u64 *cgid = container_cgids.lookup(&key);
+    if (!cgid) return 0;
+
+    struct pending_req req = {};
+    req.recv_ts = bpf_ktime_get_ns();
+    req.tid = tid;
+    pending.update(cgid, &req);
+    return 0;
+}
+
+// Shared by all hooks. ino is the written file's kernfs id; anything not in
+// the userspace-managed watch set is rejected with a single map lookup.
+static __always_inline int handle_write(u64 ino, const char *buf, size_t count, int user_buf) {
+    struct watch_val *w = watched.lookup(&ino);
+    if (!w)
+        return 0;
+
+    u64 cgid = w->cgroup_id;
+    struct write_start ws = {};
+    ws.ts = bpf_ktime_get_ns();
+    // The first limit write into a cgroup completes the request dockerd
+    // received for that container: one record per container per update.
+    // Consumed before sampling so a skipped write does not leave a stale
+    // request behind for the next one.
+    struct pending_req *req = pending.lookup(&cgid);
+    if (req) {
+        ws.start_ts = req->recv_ts;
+        ws.dockerd_tid = req->tid;
+        pending.delete(&cgid);
+    }
+    if (!sampled())
+        return 0;
+
+    u64 pid_tgid = bpf_get_current_pid_tgid();
+    u32 tgid = pid_tgid >> 32;
+    ws.knob = w->knob;
+    ws.path = raw_tgids.lookup(&tgid) ? PATH_RAW : PATH_DOCKERD;
+    inflight.update(&pid_tgid, &ws);
+
+#if EMIT_EVENTS
+    struct write_event *ev = events.ringbuf_reserve(sizeof(struct write_event));
+    if (!ev) {
+        u32 key = 0;
+        u64 *d = dropped.lookup(&key);
+        if (d) __sync_fetch_and_add(d, 1);
+        return 0;
+    }
+
+    ev->ts = ws.ts;
+    ev->start_ts = ws.start_ts;
+    ev->pid = tgid;
+    ev->dockerd_tid = ws.dockerd_tid;
+    ev->cgroup_id = cgid;
+    ev->knob = ws.knob;
+
+    u32 len = count < VALUE_BUF_LEN ? count : VALUE_BUF_LEN;
+    ev->value_len = len;
+    if (user_buf)
+        bpf_probe_read_user(ev->value, len, buf);
+    else
+        bpf_probe_read_kernel(ev->value, len, buf);
+
+    events.ringbuf_submit(ev, 0);
+#endif
+    return 0;
+}
+
+// Enforcement is complete once the write returns. Raw writes are timed from
+// their own entry, dockerd-driven writes from the dockerd request read.
+// Failed writes (EINVAL, EBUSY, ...) enforced nothing and are not recorded.
+static __always_inline int handle_write_return(long ret) {
+    u64 pid_tgid = bpf_get_current_pid_tgid();
+    struct write_start *ws = inflight.lookup(&pid_tgid);
+    if (!ws)
+        return 0;
+    u64 base = ws->path == PATH_RAW ? ws->ts : ws->start_ts;
+    struct hist_key hk = {};
+    hk.knob = ws->knob;
+    hk.path = ws->path;
+    inflight.delete(&pid_tgid);
+    if (!base || ret < 0)
+        return 0;
+
+    u64 delta = bpf_ktime_get_ns() - base;
+    u64 *max = latency_max.lookup(&hk);
+    if (!max || *max < delta)
+        latency_max.update(&hk, &delta);
+    hk.slot = hist_slot(delta);
+    latency_hist.increment(hk);
+    return 0;
+}
+
+#if HOOK == HOOK_VFS_WRITE
+int trace_write(struct pt_regs *ctx, struct file *file, const char __user *buf, size_t count, loff_t *pos) {
+    // Inode numbers are only unique per superblock: a devtmpfs, ext4 or tmpfs
+    // file can carry the number of a watched kernfs node.
+    struct inode *inode = file->f_inode;
+    if (inode->i_sb->s_magic != CGROUP2_SUPER_MAGIC)
+        return 0;
+    return handle_write(inode->i_ino, buf, count, 1);
+}
+
+int trace_write_return(struct pt_regs *ctx) {
+    return handle_write_return(PT_REGS_RC(ctx));
+}
+#elif HOOK == HOOK_CGROUP_FILE_WRITE
+// Only cgroupfs writes reach this function; buf is already in kernel memory.
+int trace_write(struct pt_regs *ctx, struct kernfs_open_file *of, char *buf, size_t nbytes, loff_t off) {
+    return handle_write(of->kn->id, buf, nbytes, 0);
+}
+
+int trace_write_return(struct pt_regs *ctx) {
+    return handle_write_return(PT_REGS_RC(ctx));
+}
+#elif HOOK == HOOK_FENTRY
+KFUNC_PROBE(cgroup_file_write, struct kernfs_open_file *of, char *buf, size_t nbytes, loff_t off) {
+    return handle_write(of->kn->id, buf, nbytes, 0);
+}
+
+KRETFUNC_PROBE(cgroup_file_write, struct kernfs_open_file *of, char *buf, size_t nbytes, loff_t off, ssize_t ret) {
+    return handle_write_return(ret);
+}
+#endif
+"""
+
+HOOKS = ("vfs_write", "cgroup_file_write", "fentry")
+CONFIG_DOCKERD_TGID = 0
+CONFIG_SAMPLE_RATE = 1
+
+class WriteTracer:
+    # The BPF source is the same for every run with the same events/hook
+    # cflags; the dockerd PID and the sample rate live in the config map.
+    # startup_ns records how long the clang/LLVM compile and the attach took.
+    #
+    # With sample_rate=N only a random 1 in N watched writes is recorded
+    # (events and histograms); multiply counts by N for totals. Unwatched
+    # writes and the dockerd read tracepoints cost the same either way.
+
+    def __init__(self, dockerd_pid=None, events=True, hook="vfs_write", sample_rate=1):
+        if hook not in HOOKS:
+            raise ValueError(f"Unknown hook {hook!r}, expected one of {HOOKS}")
+        self.hook = hook
+        t0 = time.monotonic_ns()
+        self.bpf = BPF(text=bpf_code, cflags=[f"-DEMIT_EVENTS={int(events)}", f"-DHOOK={HOOKS.index(hook)}"])
+        t1 = time.monotonic_ns()
+        # fentry programs are attached by bcc when the object is loaded.
+        if hook != "fentry":
+            self.bpf.attach_kprobe(event=hook, fn_name="trace_write")
+            self.bpf.attach_kretprobe(event=hook, fn_name="trace_write_return")
+        self.add_raw_writer(os.getpid())
+        self._reads_attached = False
+        self.set_dockerd_pid(dockerd_pid)
+        self.set_sample_rate(sample_rate)
+        self.timeouts = 0
+        self._pending = deque()
+        # (cgroup_path, file) -> inode in the watched map, so entries can be
+        # removed after the cgroup is gone.
+        self._watch_inos = {}
+        self.bpf["events"].open_ring_buffer(self._on_event)
+        self.startup_ns = {"compile": t1 - t0, "attach": time.monotonic_ns() - t1}
+
+    def set_dockerd_pid(self, pid):
+        # Can be called again after dockerd restarts; no recompile.
+        self.bpf["config"][ct.c_int(CONFIG_DOCKERD_TGID)] = ct.c_ulonglong(pid or 0)
+        if pid and not self._reads_attached:
+            self.bpf.attach_tracepoint(tp="syscalls:sys_enter_read", fn_name="trace_read_enter")
+            self.bpf.attach_tracepoint(tp="syscalls:sys_exit_read", fn_name="trace_read_exit")
+            self._reads_attached = True
+
+    def set_sample_rate(self, rate):
+        self.sample_rate = max(1, int(rate))
+        self.bpf["config"][ct.c_int(CONFIG_SAMPLE_RATE)] = ct.c_ulonglong(self.sample_rate)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _on_event(self, ctx, data, size):
+        ev = self.bpf["events"].event(data)
+        self._pending.append(WriteEvent(
+            ev.ts, ev.start_ts, ev.pid, ev.dockerd_tid, ev.cgroup_id,
+            KNOBS[ev.knob],
+            bytes(ev.value[:ev.value_len]).decode(errors="replace").strip(),
+        ))
+
+    def poll(self, timeout_ms=-1):
+        # ring_buffer_poll() blocks in epoll_wait on the ring buffer fd.
+        self.bpf.ring_buffer_poll(timeout_ms)
+
+    def drain(self):
+        self.bpf.ring_buffer_consume()
+        events = list(self._pending)
+        self._pending.clear()
+        return events
+
+    def wait(self, timeout_ms=1000, cgroup_id=None, filename=None):
+        deadline = time.monotonic() + timeout_ms / 1e3
+        while True:
+            while self._pending:
+                ev = self._pending.popleft()
+                if cgroup_id is not None and ev.cgroup_id != cgroup_id:
+                    continue
+                if filename is not None and ev.filename != filename:
+                    continue
+                return ev
+            remaining = int((deadline - time.monotonic()) * 1e3)
+            if remaining <= 0:
+                self.timeouts += 1
+                raise TimeoutError(f"No cgroup write event within {timeout_ms} ms")
+            self.poll(remaining)
+
+    def watch_cgroup(self, cgroup_path, files=KNOBS):
+        # The probes only look at files in this set, keyed by the file's
+        # kernfs inode. Re-watch if the cgroup is recreated.
+        cgid = cgroup_id(cgroup_path)
+        table = self.bpf["watched"]
+        for name in files:
+            val = table.Leaf()
+            val.cgroup_id = cgid
+            val.knob = KNOBS.index(name)
+            ino = os.stat(os.path.join(cgroup_path, name)).st_ino
+            old = self._watch_inos.get((cgroup_path, name))
+            if old is not None and old != ino:
+                try:
+                    del table[ct.c_ulonglong(old)]
+                except KeyError:
+                    pass
+            table[ct.c_ulonglong(ino)] = val
+            self._watch_inos[(cgroup_path, name)] = ino
+        return cgid
+
+    def unwatch_cgroup(self, cgroup_path, files=KNOBS):
+        table = self.bpf["watched"]
+        for name in files:
+            ino = self._watch_inos.pop((cgroup_path, name), None)
+            try:
+                if ino is None:
+                    ino = os.stat(os.path.join(cgroup_path, name)).st_ino
+                del table[ct.c_ulonglong(ino)]
+            except (OSError, KeyError):
+                pass
+
+    def watch_container(self, cgroup_path, *idents):
+        # idents: every string a client may put in /containers/<ident>/update
+        # (full ID, short ID, name).
+        cgid = self.watch_cgroup(cgroup_path)
+        table = self.bpf["container_cgids"]
+        for ident in idents:
+            key = table.Key()
+            key.ident = ident.encode()[:63]
+            table[key] = ct.c_ulonglong(cgid)
+        return cgid
+
+    def add_raw_writer(self, pid):
+        self.bpf["raw_tgids"][ct.c_uint(pid)] = ct.c_ubyte(1)
+
+    def latency_histograms(self):
+        hists = {}
+        for k, v in self.bpf["latency_hist"].items():
+            key = (KNOBS[k.knob], PATHS[k.path])
+            hists.setdefault(key, {})[k.slot] = v.value
+        return hists
+
+    def latency_max(self):
+        return {(KNOBS[k.knob], PATHS[k.path]): v.value for k, v in self.bpf["latency_max"].items()}
+
+    def print_latency_report(self):
+        print_report(self.latency_histograms(), self.latency_max())
+
+    def dropped(self):
+        return self.bpf["dropped"][ct.c_int(0)].value
+
+    def close(self):
+        self.bpf.cleanup()
+
+
+def open_tracer_async(**kwargs):
+    # Builds a WriteTracer on a background thread and returns a Future.
+    # ctypes drops the GIL for the compile, so callers can set up containers
+    # meanwhile and only wait for whatever compile time is left.
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bpf-compile")
+    future = executor.submit(WriteTracer, **kwargs)
+    executor.shutdown(wait=False)
+    return future
@@ -0,0 +1,192 @@
+import os, sys, csv, json, time, queue, argparse, threading
+import multiprocessing as mp
+from cgroup_writer import CgroupWriter, memory_max_bytes, cpu_max_bytes
+from cgroupfs import CgroupFS, FakeCgroupFS
+from bulk_update_latency import setup_cgroups, teardown_cgroups
+from latency_hist import KNOBS, PERCENTILES, slot_of, summarize
+
+PARENT_NAME = "scaling-bench"
+MEM_DELTA = 1 * 1024 * 1024
+CPU_DELTA = 1000
+CPU_PERIOD = 100000
+TOP_LOCKS = 3
+
+initial_mem = 128 * 1024 * 1024
+initial_cpu = 10000
+
+FIELDS = ["writers", "mode", "writes", "updates_per_s", "per_writer_per_s"] + \
+         [f"p{q:g}_us" for q in PERCENTILES] + ["max_us", "lock_wait_us_per_write", "top_locks"]
+
+
+def writer_counts(limit):
+    counts, n = [], 1
+    while n < limit:
+        counts.append(n)
+        n *= 2
+    return counts + [limit]
+
+
+def write_loop(fs, cgroup_path, knobs, cpu, duration, start, results):
+    # One writer: pinned to cpu, tight pwrite loop on its own cgroup until
+    # duration has passed. Latencies go into a log-linear histogram (the
+    # same buckets as the BPF histograms) instead of a sample list.
+    if cpu is not None:
+        os.sched_setaffinity(0, {cpu})
+    bufs = []
+    for sign in (1, -1):
+        for knob in knobs:
+            if knob == "memory.max":
+                bufs.append((knob, memory_max_bytes(initial_mem + sign * MEM_DELTA)))
+            else:
+                bufs.append((knob, cpu_max_bytes(initial_cpu + sign * CPU_DELTA, CPU_PERIOD)))
+    hist = {}
+    writes = max_ns = 0
+    with CgroupWriter(files=knobs, fs=fs) as writer:
+        writer.open(cgroup_path)
+        write = writer.write
+        clock = time.perf_counter_ns
+        nbufs = len(bufs)
+        start.wait()
+        t_start = clock()
+        deadline = t_start + int(duration * 1e9)
+        t1 = t_start
+        while t1 < deadline:
+            knob, data = bufs[writes % nbufs]
+            t0 = clock()
+            write(cgroup_path, knob, data)
+            t1 = clock()
+            delta = t1 - t0
+            slot = slot_of(delta)
+            hist[slot] = hist.get(slot, 0) + 1
+            if delta > max_ns:
+                max_ns = delta
+            writes += 1
+    results.put((writes, hist, max_ns, t1 - t_start))
+
+
+def run_point(fs, paths, n, args, cpus, contention):
+    if args.mode == "process":
+        ctx = mp.get_context("fork")
+        start, results, spawn = ctx.Barrier(n + 1), ctx.Queue(), ctx.Process
+    else:
+        start, results, spawn = threading.Barrier(n + 1), queue.Queue(), threading.Thread
+    workers = [spawn(target=write_loop, daemon=True,
+                     args=(fs, paths[i], args.knob, cpus[i % len(cpus)] if cpus else None,
+                           args.duration, start, results))
+               for i in range(n)]
+    for w in workers:
+        w.start()
+    if contention is not None:
+        contention.clear()
+        for w in workers:
+            contention.add(w.pid if args.mode == "process" else os.getpid())
+    start.wait()
+    outs = [results.get() for _ in workers]
+    for w in workers:
+        w.join()
+
+    hist = {}
+    for _, h, _, _ in outs:
+        for slot, count in h.items():
+            hist[slot] = hist.get(slot, 0) + count
+    writes = sum(o[0] for o in outs)
+    wall = max(o[3] for o in outs)
+    summary = summarize(hist, max(o[2] for o in outs))
+    row = {"writers": n, "mode": args.mode, "writes": writes,
+           "updates_per_s": writes / (wall / 1e9), "per_writer_per_s": writes / (wall / 1e9) / n}
+    for q in PERCENTILES:
+        row[f"p{q:g}_us"] = summary[f"p{q:g}"] / 1e3
+    row["max_us"] = summary["max"] / 1e3
+    row["lock_wait_us_per_write"] = None
+    row["top_locks"] = ""
+    if contention is not None:
+        locks = contention.stats()
+        row["lock_wait_us_per_write"] = sum(l.wait_ns for l in locks) / writes / 1e3
+        row["top_locks"] = " ".join(f"{l.name}({l.kind}):{l.wait_ns / 1e6:.1f}ms" for l in locks[:TOP_LOCKS])
+    return row
+
+
+def print_header(out):
+    out.write(f"{'writers':>7} {'updates/s':>11} {'per writer':>11} "
+              + " ".join(f"{f[:-3]:>9}" for f in FIELDS[5:-2]) + f" {'lock/write':>10}  top locks\n")
+
+
+def print_rows(rows, out):
+    for row in rows:
+        out.write(f"{row['writers']:>7} {row['updates_per_s']:>11.0f} {row['per_writer_per_s']:>11.0f} "
+                  + " ".join(f"{row[f]:>6.1f} us" for f in FIELDS[5:-2])
+                  + (f" {row['lock_wait_us_per_write']:>7.2f} us" if row["lock_wait_us_per_write"] is not None
+                     else f" {'-':>10}") + f"  {row['top_locks']}\n")
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Cgroup limit writes: throughput and latency vs. number of writers")
+    p.add_argument("--max-writers", type=int, default=len(os.sched_getaffinity(0)),
+                   help="largest writer count (default: usable CPUs)")
+    p.add_argument("--mode", choices=("process", "thread"), default="process",
+                   help="writers as processes (default) or threads of one process")
+    p.add_argument("--knob", action="append", choices=KNOBS, help="file each writer updates (repeatable, default: both)")
+    p.add_argument("--duration", type=float, default=2.0, help="seconds per point")
+    p.add_argument("--no-pin", action="store_true", help="do not pin writers to separate CPUs")
+    p.add_argument("--locks", action="store_true", help="trace lock contention of the writers with BPF")
+    p.add_argument("--fake", action="store_true", help="run rootless against a fake cgroupfs tree")
+    p.add_argument("-f", "--format", choices=("text", "json", "csv"), default="text")
+    p.add_argument("-o", "--output", help="write results to this file instead of stdout")
+    args = p.parse_args(argv)
+    args.knob = args.knob or list(KNOBS)
+    if args.fake and args.locks:
+        p.error("--locks traces kernel locks; it needs the real cgroupfs")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    fs = FakeCgroupFS() if args.fake else CgroupFS()
+    parent = fs.path(PARENT_NAME)
+    paths = setup_cgroups(fs, parent, args.max_writers)
+    cpus = None if args.no_pin else sorted(os.sched_getaffinity(0))
+    contention = None
+    if args.locks:
+        from lock_tracer import ContentionTracer
+
+        contention = ContentionTracer()
+    rows = []
+    # Text to stdout is printed point by point as the curve is measured.
+    live = args.format == "text" and not args.output
+    if live:
+        print_header(sys.stdout)
+    try:
+        for n in writer_counts(args.max_writers):
+            rows.append(run_point(fs, paths, n, args, cpus, contention))
+            if live:
+                print_rows(rows[-1:], sys.stdout)
+                sys.stdout.flush()
+    finally:
+        if contention is not None:
+            contention.close()
+        teardown_cgroups(fs, parent, paths)
+        if fs.fake:
+            fs.cleanup()
+
+    if live:
+        return 0
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            json.dump({"knobs": args.knob, "duration": args.duration, "results": rows}, out, indent=2)
+            out.write("\n")
+        elif args.format == "csv":
+            w = csv.DictWriter(out, fieldnames=FIELDS)
+            w.writeheader()
+            w.writerows(rows)
+        else:
+            print_header(out)
+            print_rows(rows, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())